@@ -0,0 +1,122 @@
+"""Modo changelist offline: FakeChangelistFeed + build lookup falso sobre um banco semeado.
+
+Publica CHANGES change numbers (a maioria em apps sem inscritos), roda
+UpdateChecker.ingest_changes e confere que todo app inscrito alterado gerou
+update, que nenhum app sem inscritos foi consultado e que o change number foi
+persistido. Mostra a vazão e quantas consultas de build o polling faria.
+
+Uso: python benchmarks/bench_changelist.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from changelist import FakeChangelistFeed
+from db import AsyncDatabase, Database
+from steam_api import BuildInfo
+from updater import UpdateChecker, library_hash
+
+USERS = 200
+APPS_PER_USER = 40
+SUBSCRIBED_APPS = 2000  # faixa de appids sorteada para as bibliotecas
+CATALOG = 100000  # apps que aparecem no feed
+CHANGES = 50000
+
+class FakeBuilds:
+    """Substitui o SteamAPI: o build de um app é o último change number que o alterou"""
+
+    steamdb_url = 'https://steamdb.info/api'
+
+    def __init__(self):
+        self.builds = {}
+        self.lookups = []
+
+    def host_available(self, url):
+        return True
+
+    async def get_latest_build(self, app_id):
+        self.lookups.append(app_id)
+        return BuildInfo(str(self.builds.get(app_id, 0)), None, None, f"https://steamdb.info/app/{app_id}/patchnotes/")
+
+class Notifier:
+    def wake(self):
+        pass
+
+def seed(db):
+    rng = random.Random(7)
+    for telegram_id in range(1, USERS + 1):
+        db.add_user(telegram_id, str(76561197960287930 + telegram_id))
+        games = [
+            {'appid': appid, 'name': f"Game {appid}", 'playtime_forever': 0}
+            for appid in rng.sample(range(1, SUBSCRIBED_APPS + 1), APPS_PER_USER)
+        ]
+        db.sync_library(telegram_id, games, library_hash(games))
+        db.conn.execute('UPDATE games SET installed = TRUE WHERE telegram_id = ?', (telegram_id,))
+    db.conn.execute("UPDATE apps SET last_buildid = '0'")
+    db.conn.commit()
+
+async def run(path):
+    db = AsyncDatabase(Database(path))
+    seed(db.db)
+    builds = FakeBuilds()
+    feed = FakeChangelistFeed()
+    checker = UpdateChecker(db, builds, Notifier(), feed)
+
+    # Primeiro ciclo: sem change number salvo, faz a verificação completa e guarda a cabeça do feed
+    await checker.ingest_changes()
+    baseline = len(builds.lookups)
+    builds.lookups.clear()
+
+    rng = random.Random(11)
+    subscribed = {row[0] for row in db.db.conn.execute('SELECT DISTINCT game_id FROM games WHERE installed = TRUE')}
+    changed = set()
+    for _ in range(CHANGES):
+        apps = rng.sample(range(1, CATALOG + 1), 3)
+        number = feed.publish(*apps)
+        for app_id in apps:
+            builds.builds[app_id] = number
+            if app_id in subscribed:
+                changed.add(app_id)
+
+    requests = feed.requests
+    start = time.perf_counter()
+    found = 0
+    while int(await db.get_checker_state('change_number')) < feed.current:
+        found += await checker.ingest_changes()
+    elapsed = time.perf_counter() - start
+
+    stale = db.db.conn.execute('''SELECT COUNT(*) FROM apps
+                                  WHERE appid IN (SELECT value FROM json_each(?))
+                                  AND last_buildid = '0' ''', (str(sorted(changed)),)).fetchone()[0]
+    saved = await db.get_checker_state('change_number')
+    await db.close()
+
+    lookups = set(builds.lookups)
+    print(f"baseline full check: {baseline} build lookups")
+    print(f"{CHANGES} change numbers in {feed.requests - requests} feed requests, {elapsed:.2f}s "
+          f"({CHANGES / elapsed:,.0f} changes/s)")
+    print(f"build lookups: {len(builds.lookups)} (polling would do {len(subscribed)} per cycle), "
+          f"{found} subscriber updates")
+    checks = {
+        'every changed subscribed app looked up': lookups == changed,
+        'no lookups for apps without subscribers': lookups <= subscribed,
+        'no changed app left on the old build': stale == 0,
+        'change number persisted': int(saved) == feed.current,
+    }
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    return 0 if all(checks.values()) else 1
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        return asyncio.run(run(os.path.join(tmp, 'bench.db')))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Tempo de /vincular para bibliotecas de 100/1k/10k jogos: loop por jogo vs sync_library,
+e da ressincronização de uma biblioteca já gravada: reimportação completa vs diff (sync_library).
+
+Os caminhos antigos (um commit por jogo e a reimportação completa) não existem mais
+no Database e são reproduzidos aqui em SQL, só como referência.
+
+Uso: python benchmarks/bench_library_import.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from db import Database
+from updater import library_hash
+
+SIZES = (100, 1000, 10000)
+
+def fake_library(size):
+    return [
+        {'appid': 10 + i, 'name': f"Game {i}", 'playtime_forever': i * 7}
+        for i in range(size)
+    ]
+
+def link_per_game(db, telegram_id, games):
+    # Caminho antigo do link_account: um commit por jogo
+    for game in games:
+        db.conn.execute('''INSERT INTO apps (appid, name) VALUES (?, ?)
+                          ON CONFLICT(appid) DO UPDATE SET name = excluded.name''',
+                        (game['appid'], game.get('name', f"AppID {game['appid']}")))
+        db.conn.execute('''INSERT INTO games (telegram_id, game_id, installed, last_played)
+                          VALUES (?, ?, FALSE, ?)
+                          ON CONFLICT(telegram_id, game_id) DO UPDATE SET
+                          installed = excluded.installed, last_played = excluded.last_played''',
+                        (telegram_id, game['appid'], game.get('playtime_forever', 0)))
+        db.conn.commit()
+
+def link_bulk(db, telegram_id, games):
+    # Caminho atual do link_account
+    db.sync_library(telegram_id, games, library_hash(games))
+
+def measure(link, games):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.add_user(1, '76561197960287930')
+        start = time.perf_counter()
+        link(db, 1, games)
+        elapsed = time.perf_counter() - start
+        db.close()
+    return elapsed
+
+def resync_delta(games):
+    # Um dia típico: ~2% dos jogos com tempo de jogo novo e uma compra
+    changed = [dict(game, playtime_forever=game['playtime_forever'] + 30) if i % 50 == 0 else game
+               for i, game in enumerate(games)]
+    return changed + [{'appid': 10 + len(games), 'name': "New game", 'playtime_forever': 0}]
+
+def measure_resync(resync, games):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        db.add_user(1, '76561197960287930')
+        db.sync_library(1, games, library_hash(games))
+        updated = resync_delta(games)
+        start = time.perf_counter()
+        resync(db, 1, updated)
+        elapsed = time.perf_counter() - start
+        db.close()
+    return elapsed
+
+def resync_full(db, telegram_id, games):
+    # Reimportação antiga: regrava a resposta inteira em uma transação
+    db.conn.executemany('''INSERT INTO apps (appid, name) VALUES (?, ?)
+                          ON CONFLICT(appid) DO UPDATE SET name = excluded.name
+                          WHERE apps.name IS NOT excluded.name''',
+                        [(game['appid'], game.get('name', f"AppID {game['appid']}")) for game in games])
+    db.conn.executemany('''INSERT INTO games (telegram_id, game_id, last_played) VALUES (?, ?, ?)
+                          ON CONFLICT(telegram_id, game_id) DO UPDATE SET
+                          last_played = excluded.last_played''',
+                        [(telegram_id, game['appid'], game.get('playtime_forever', 0)) for game in games])
+    db.conn.commit()
+
+def resync_diff(db, telegram_id, games):
+    db.sync_library(telegram_id, games, library_hash(games))
+
+def main():
+    print(f"{'games':>8} {'per-game (s)':>14} {'sync (s)':>10} {'speedup':>8}")
+    for size in SIZES:
+        games = fake_library(size)
+        before = measure(link_per_game, games)
+        after = measure(link_bulk, games)
+        print(f"{size:>8} {before:>14.3f} {after:>10.3f} {before / after:>7.0f}x")
+
+    print(f"\n{'games':>8} {'reimport (s)':>14} {'diff (s)':>10} {'speedup':>8}")
+    for size in SIZES:
+        games = fake_library(size)
+        before = measure_resync(resync_full, games)
+        after = measure_resync(resync_diff, games)
+        print(f"{size:>8} {before:>14.3f} {after:>10.3f} {before / after:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Retenção do histórico: /stats e tamanho do arquivo com anos de updates acumulados.
+
+Semeia USERS usuários com --years anos de histórico em updates (ids em ordem de
+update_time, como em produção), mede get_user_stats e a consulta antiga (GROUP BY
+sobre todo o histórico do usuário), roda UpdateChecker.maintain_database e confere
+que os totais mensais somam exatamente as linhas removidas e que stats não mudou.
+
+Uso: python benchmarks/bench_retention.py [--users 1000] [--per-user 1000] [--years 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from config import Config
+from db import AsyncDatabase, Database
+from updater import UpdateChecker
+
+APPS = 2000
+OLD_STATS_QUERY = '''SELECT a.name, MAX(u.update_time) as last_update
+                     FROM updates u
+                     JOIN apps a ON a.appid = u.game_id
+                     WHERE u.telegram_id = ?
+                     GROUP BY u.game_id
+                     ORDER BY last_update DESC LIMIT 5'''
+
+def seed(db, users, per_user, years):
+    rng = random.Random(5)
+    conn = db.conn
+    conn.executemany('INSERT INTO apps (appid, name) VALUES (?, ?)', ((appid, f"Game {appid}") for appid in range(APPS)))
+    conn.executemany('INSERT INTO users (telegram_id, steam_id) VALUES (?, ?)',
+                     ((telegram_id, str(76561197960287930 + telegram_id)) for telegram_id in range(1, users + 1)))
+    libraries = {telegram_id: rng.sample(range(APPS), 30) for telegram_id in range(1, users + 1)}
+    conn.executemany('INSERT INTO games (telegram_id, game_id, installed) VALUES (?, ?, TRUE)',
+                     ((telegram_id, appid) for telegram_id, library in libraries.items() for appid in library))
+    # Em ordem cronológica: o id cresce com update_time
+    now = time.time()
+    span = years * 365 * 86400
+    total = users * per_user
+    for first in range(0, total, 100000):
+        rows = []
+        for i in range(first, min(first + 100000, total)):
+            telegram_id = rng.randint(1, users)
+            ts = now - span + span * i / total
+            rows.append((telegram_id, rng.choice(libraries[telegram_id]), '1',
+                         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))))
+        conn.executemany('INSERT INTO updates (telegram_id, game_id, build_id, update_time) VALUES (?, ?, ?, ?)', rows)
+    conn.execute('''INSERT INTO stats (telegram_id, total_updates, last_update)
+                    SELECT telegram_id, COUNT(*), MAX(update_time) FROM updates GROUP BY telegram_id''')
+    conn.execute('''INSERT OR REPLACE INTO last_updates (telegram_id, game_id, update_time)
+                    SELECT telegram_id, game_id, MAX(update_time) FROM updates GROUP BY telegram_id, game_id''')
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def time_stats(db, users, sample=300):
+    ids = random.Random(9).sample(range(1, users + 1), min(sample, users))
+    start = time.perf_counter()
+    for telegram_id in ids:
+        db.conn.execute(OLD_STATS_QUERY, (telegram_id,)).fetchall()
+    old = (time.perf_counter() - start) / len(ids)
+    start = time.perf_counter()
+    for telegram_id in ids:
+        db.get_user_stats(telegram_id)
+    new = (time.perf_counter() - start) / len(ids)
+    return old * 1000, new * 1000
+
+def file_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+class Idle:
+    """SteamAPI/notifier não são usados pela manutenção"""
+
+async def maintain(db):
+    adb = AsyncDatabase(db)
+    start = time.perf_counter()
+    await UpdateChecker(adb, Idle(), Idle()).maintain_database()
+    elapsed = time.perf_counter() - start
+    # Fecha só os executores; o Database segue aberto para as medições
+    adb._readers.shutdown(wait=True)
+    adb._writer.shutdown(wait=True)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--per-user', type=int, default=1000, help='updates por usuário no histórico')
+    parser.add_argument('--years', type=float, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'retention.db')
+    try:
+        db = Database(path)
+        start = time.perf_counter()
+        seed(db, args.users, args.per_user, args.years)
+        print(f"seeded {args.users * args.per_user} updates over {args.years:g} years "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        count = lambda sql: db.conn.execute(sql).fetchone()[0]
+        stats_before = db.conn.execute('SELECT SUM(total_updates), MAX(last_update) FROM stats').fetchone()
+        rows_before = count('SELECT COUNT(*) FROM updates')
+        size_before = file_size(path)
+        old_ms, new_ms = time_stats(db, args.users)
+        print(f"/stats before: old query {old_ms:.3f} ms, get_user_stats {new_ms:.3f} ms per user")
+
+        elapsed = asyncio.run(maintain(db))
+        rows_after = count('SELECT COUNT(*) FROM updates')
+        rolled = count('SELECT COALESCE(SUM(updates), 0) FROM update_rollups')
+        stats_after = db.conn.execute('SELECT SUM(total_updates), MAX(last_update) FROM stats').fetchone()
+        size_after = file_size(path)
+        old_ms, new_ms = time_stats(db, args.users)
+        print(f"maintenance ({Config.UPDATES_RETENTION_DAYS} day retention) took {elapsed:.1f}s: "
+              f"updates {rows_before} -> {rows_after}, "
+              f"{count('SELECT COUNT(*) FROM update_rollups')} monthly rollup rows")
+        print(f"file size {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+        print(f"/stats after:  old query {old_ms:.3f} ms, get_user_stats {new_ms:.3f} ms per user")
+
+        checks = [
+            ('rollups add up to the removed rows', rolled == rows_before - rows_after),
+            ('stats untouched', stats_before == stats_after),
+            ('no row older than the retention left',
+             count(f"SELECT COUNT(*) FROM updates WHERE update_time < "
+                   f"datetime('now', '-{Config.UPDATES_RETENTION_DAYS} days')") == 0),
+            ('file shrank', size_after < size_before),
+        ]
+        for name, passed in checks:
+            print(f"{'ok  ' if passed else 'FAIL'} {name}")
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+    sys.exit(0 if all(passed for _, passed in checks) else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""Escala da verificação com shards: N processos worker contra um SteamDB falso local.
+
+Semeia um banco com APPS apps instalados, enfileira todos (como um ciclo completo
+do agendador) e sobe N processos com o UpdateChecker em modo shards, que dividem
+os shards por leases no banco. Para cada N mostra apps verificados por minuto e
+o speedup, e confere pelo servidor falso e pela tabela updates que nenhum app foi
+consultado duas vezes e que cada build novo gerou um único update por inscrito.
+
+O SteamDB falso responde com --latency segundos de atraso e o host tem um orçamento
+global fixo de --budget requisições/s (rajada --burst), dividido entre os workers
+vivos. Enquanto cada worker é limitado pela latência (HTTP_MAX_CONCURRENCY), mais
+workers escalam; ao atingir o orçamento a vazão para de crescer, e o servidor falso
+confere que nenhuma janela de PEAK_WINDOW segundos passou dele (mais a rajada). Com
+--budget 0 o host fica sem limite de taxa. O desvio do ideal vem do desequilíbrio
+entre os shards de cada worker: quanto mais shards por worker, mais uniforme a divisão.
+
+Com --kill, um dos workers recebe SIGKILL no meio da execução: os demais assumem
+os shards dele quando o lease expira (--lease segundos) e terminam a fila; o lote
+que estava em andamento no worker morto é consultado de novo.
+
+Uso: python benchmarks/bench_sharding.py [--workers 1 2 4] [--apps 1000] [--latency 0.3]
+                                         [--budget 60] [--burst 5] [--shards 256] [--kill]
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+FIRST_APP = 10
+BASE_BUILD = 1000
+USERS = 500
+APPS_PER_USER = 20
+CHANGED_FRACTION = 0.05  # apps com build novo no SteamDB falso
+PEAK_WINDOW = 5  # segundos; janelas curtas medem mais o jitter de escalonamento que a taxa
+
+class PatchDataHandler(tornado.web.RequestHandler):
+    """PatchData com atraso fixo; conta as consultas por app"""
+
+    def initialize(self, calls, times, latency):
+        self.calls = calls
+        self.times = times
+        self.latency = latency
+
+    async def get(self):
+        appid = int(self.get_argument('appid'))
+        self.calls[appid] += 1
+        self.times.append(time.monotonic())
+        await asyncio.sleep(self.latency)
+        build = BASE_BUILD + 1 if appid % int(1 / CHANGED_FRACTION) == 0 else BASE_BUILD
+        self.write({'success': True, 'changes': [{'buildid': build, 'time': int(time.time()),
+                                                  'change_description': ''}]})
+
+def peak_requests(times, window=PEAK_WINDOW):
+    """Maior número de requisições em qualquer janela [t, t + window)"""
+    peak, first = 0, 0
+    for last, now in enumerate(times):
+        while now - times[first] >= window:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak
+
+class CallsHandler(tornado.web.RequestHandler):
+    def initialize(self, calls, times):
+        self.calls = calls
+        self.times = times
+
+    def get(self):
+        self.write({'calls': {str(appid): n for appid, n in self.calls.items()},
+                    'peak': peak_requests(self.times)})
+
+    def post(self):
+        self.calls.clear()
+        self.times.clear()
+
+def serve_steamdb(sockets, latency):
+    async def serve():
+        calls, times = Counter(), []
+        app = tornado.web.Application([
+            (r'/steamdb/PatchData/', PatchDataHandler, {'calls': calls, 'times': times, 'latency': latency}),
+            (r'/_calls', CallsHandler, {'calls': calls, 'times': times}),
+        ])
+        HTTPServer(app).add_sockets(sockets)
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+def seed(path, apps):
+    """Usuários vinculados com APPS_PER_USER apps instalados cada; todos os apps com inscritos"""
+    from db import Database
+
+    db = Database(path)
+    rng = random.Random(3)
+    appids = list(range(FIRST_APP, FIRST_APP + apps))
+    db.conn.executemany('INSERT INTO apps (appid, name, last_buildid) VALUES (?, ?, ?)',
+                        ((appid, f"Game {appid}", str(BASE_BUILD)) for appid in appids))
+    # Cada app tem ao menos um inscrito; o resto das bibliotecas é sorteado
+    libraries = {telegram_id: set() for telegram_id in range(1, USERS + 1)}
+    for i, appid in enumerate(appids):
+        libraries[i % USERS + 1].add(appid)
+    for telegram_id, library in libraries.items():
+        library.update(rng.sample(appids, max(0, APPS_PER_USER - len(library))))
+    db.conn.executemany("INSERT INTO users (telegram_id, steam_id, next_check_at) VALUES (?, ?, '2999-01-01 00:00:00')",
+                        ((telegram_id, str(76561197960287930 + telegram_id)) for telegram_id in libraries))
+    db.conn.executemany('INSERT INTO games (telegram_id, game_id, installed) VALUES (?, ?, TRUE)',
+                        ((telegram_id, appid) for telegram_id, library in libraries.items() for appid in library))
+    db.conn.commit()
+    subscribers = dict(db.conn.execute('SELECT game_id, COUNT(*) FROM games GROUP BY game_id').fetchall())
+    db.close()
+    return subscribers
+
+def run_worker(path, worker_id, shards, lease, rate, barrier):
+    """Processo worker: o mesmo UpdateChecker do bot/worker.py, até a fila esvaziar"""
+    from config import Config
+    from db import AsyncDatabase, Database
+    from sharding import ShardLeases
+    from steam_api import SteamAPI
+    from updater import UpdateChecker
+
+    # Orçamento global do host; cada worker usa a sua parte (share_rate_limits)
+    Config.HOST_RATE_DEFAULT = rate
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async def work():
+        db = AsyncDatabase(Database(path))
+        steam_api = SteamAPI()
+        leases = ShardLeases(db, shards, lease, worker_id)
+        checker = UpdateChecker(db, steam_api, None, leases=leases)
+        # Todos os workers vivos antes da primeira divisão dos shards
+        await db.heartbeat_worker(worker_id, lease)
+        await asyncio.to_thread(barrier.wait)
+        leases.start()
+        try:
+            while await db.get_queued_checks(range(shards), shards, 1):
+                await checker.check_shards()
+                await asyncio.sleep(0.05)
+        finally:
+            await leases.release()
+            await steam_api.close()
+            await db.close()
+
+    asyncio.run(work())
+
+def run_round(template, tmp, workers, shards, lease, rate, kill, client):
+    """Uma execução com `workers` processos sobre uma cópia do banco semeado"""
+    from db import Database
+
+    path = os.path.join(tmp, f'shards_{workers}.db')
+    shutil.copy(template, path)
+    db = Database(path)
+    apps = [row[0] for row in db.conn.execute('SELECT appid FROM apps')]
+    db.queue_app_checks(apps)
+    db.close()
+    client.post('/_calls')
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers + 1)
+    procs = [context.Process(target=run_worker, args=(path, f'worker-{i}', shards, lease, rate, barrier))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    barrier.wait()
+    start = time.perf_counter()
+    killed_at = None
+    if kill:
+        time.sleep(0.3 * len(apps) / (workers * 100))
+        os.kill(procs[0].pid, signal.SIGKILL)
+        killed_at = time.perf_counter() - start
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - start
+
+    served = client.get('/_calls').json()
+    calls = {int(appid): n for appid, n in served['calls'].items()}
+    conn = sqlite3.connect(path)
+    updates = Counter(dict(conn.execute('SELECT game_id, COUNT(*) FROM updates GROUP BY game_id').fetchall()))
+    queued = conn.execute('SELECT COUNT(*) FROM check_queue').fetchone()[0]
+    conn.close()
+    return {
+        'apps': len(apps),
+        'elapsed': elapsed,
+        'killed_at': killed_at,
+        'missing': sum(1 for appid in apps if not calls.get(appid)),
+        'rechecked': sum(1 for n in calls.values() if n > 1),
+        'updates': updates,
+        'queued': queued,
+        'peak': served['peak'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--apps', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.3, help='atraso do SteamDB falso (s)')
+    parser.add_argument('--budget', type=float, default=60, help='requisições/s do host somando todos os workers (0: sem limite)')
+    parser.add_argument('--burst', type=float, default=5, help='rajada do orçamento do host')
+    parser.add_argument('--shards', type=int, default=256)
+    parser.add_argument('--lease', type=float, default=3, help='SHARD_LEASE_SECONDS dos workers')
+    parser.add_argument('--kill', action='store_true', help='mata um worker no meio de cada execução com 2+ workers')
+    args = parser.parse_args()
+
+    sockets = bind_sockets(0, '127.0.0.1')
+    base = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+    tmp = tempfile.mkdtemp()
+    # Lido quando config.py é importado (nos workers, via fork)
+    os.environ.update({'STEAMDB_API_URL': f"{base}/steamdb", 'DATABASE_NAME': os.path.join(tmp, 'unused.db')})
+    os.environ.pop('CHANGELIST_URL', None)
+    os.environ.pop('CACHE_DB_PATH', None)
+    server = multiprocessing.get_context('fork').Process(target=serve_steamdb, args=(sockets, args.latency), daemon=True)
+    server.start()
+    for sock in sockets:
+        sock.close()
+
+    client = httpx.Client(base_url=base, trust_env=False)
+    try:
+        template = os.path.join(tmp, 'template.db')
+        subscribers = seed(template, args.apps)
+        changed = [appid for appid in subscribers if appid % int(1 / CHANGED_FRACTION) == 0]
+        host_rate = (args.budget, args.burst) if args.budget else (1e9, 1e9)
+        print(f"{args.apps} apps, {USERS} users, {len(changed)} apps with a new build, "
+              f"{args.shards} shards, SteamDB latency {args.latency * 1000:.0f}ms, "
+              + (f"budget {args.budget:g} req/s (burst {args.burst:g})" if args.budget else "no rate budget"))
+
+        baseline = None
+        ok = True
+        for workers in args.workers:
+            kill = args.kill and workers > 1
+            result = run_round(template, tmp, workers, args.shards, args.lease, host_rate, kill, client)
+            rate = result['apps'] / result['elapsed'] * 60
+            baseline = baseline or rate / workers
+            # Um único update por inscrito de cada app alterado, mesmo com apps reconsultados
+            wrong_updates = sum(1 for appid in changed if result['updates'][appid] != subscribers[appid])
+            # A janela pode somar a rajada ao orçamento, mais uma requisição por worker
+            # liberada antes da janela e atrasada pelo escalonamento até o servidor falso
+            peak = result['peak'] / PEAK_WINDOW
+            over_budget = bool(args.budget) and result['peak'] > args.budget * PEAK_WINDOW + args.burst + workers
+            round_ok = not result['missing'] and not result['queued'] and not wrong_updates and not over_budget
+            if not kill:
+                round_ok = round_ok and not result['rechecked']
+            ok = ok and round_ok
+            print(f"workers={workers:<3} {result['elapsed']:6.2f}s {rate:10.0f} apps/min  "
+                  f"speedup {rate / baseline:4.2f}x (ideal {workers}x)  "
+                  f"missing={result['missing']} rechecked={result['rechecked']} "
+                  f"wrong_updates={wrong_updates} left_in_queue={result['queued']} "
+                  f"peak={peak:.1f} req/s"
+                  + (f"  killed worker-0 at {result['killed_at']:.1f}s" if kill else '')
+                  + ('' if round_ok else '  FAILED'))
+    finally:
+        client.close()
+        server.terminate()
+        server.join()
+        shutil.rmtree(tmp)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+"""Teste de carga offline do bot inteiro contra backends falsos locais.
+
+Sobe, num processo separado, um servidor tornado que imita a Bot API do Telegram,
+a Steam Web API, a loja e o SteamDB, semeia uma população sintética (10k a 1M usuários) e mede:
+
+- handlers do SteamUpdateBot: vazão, latência p50/p99 por comando, consultas SQL e
+  chamadas ao Telegram/Steam por comando;
+- UpdateChecker: requisições ao upstream, updates e tempo de um tick em regime
+  (check_due_apps) e de um ciclo completo (check_all_users);
+- caminhos quentes do Database: ops/s e latência p50/p99.
+
+Os hosts falsos não passam pelo token bucket (HOST_RATE_DEFAULT alto), então o
+que se mede é o nosso lado; os limites de conexão do SteamAPI continuam valendo.
+Com --db o banco semeado é reaproveitado entre execuções (semear 1M leva minutos).
+
+Uso: python benchmarks/load_test.py [--users 10000] [--games-per-user 50] [--updates 5000]
+                                    [--concurrency 64] [--db caminho]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+FIRST_STEAM_ID = 76561197960287930
+FIRST_APP = 10
+BASE_BUILD = 1000
+
+# Mistura de comandos: (tipo, peso)
+COMMAND_MIX = (
+    ('/start', 5), ('/help', 5), ('/status', 20), ('/stats', 10), ('/games', 15),
+    ('games_page', 10), ('toggle', 20), ('/settings', 5), ('/vincular', 10),
+)
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+class FakeBackend:
+    """Estado dos serviços falsos: bibliotecas determinísticas por SteamID e builds por app"""
+
+    def __init__(self, apps, games_per_user, installed_fraction, change_rate):
+        self.apps = apps
+        self.games_per_user = games_per_user
+        self.installed_fraction = installed_fraction
+        self.change_rate = change_rate
+        self.builds = {}
+        self.cycle = 0
+        self.calls = Counter()
+
+    def library(self, steam_id):
+        """(jogos do GetOwnedGames, appids instalados) de um SteamID, sempre os mesmos"""
+        rng = random.Random(int(steam_id))
+        appids = rng.sample(range(FIRST_APP, FIRST_APP + self.apps), min(self.games_per_user, self.apps))
+        games = [{'appid': appid, 'name': f"Game {appid}", 'playtime_forever': rng.randrange(0, 6000)}
+                 for appid in appids]
+        installed = [appid for appid in appids if rng.random() < self.installed_fraction]
+        return games, installed
+
+    def advance(self):
+        """Novo ciclo: change_rate dos apps do catálogo ganham build novo"""
+        self.cycle += 1
+        rng = random.Random(self.cycle)
+        for appid in rng.sample(range(FIRST_APP, FIRST_APP + self.apps), int(self.apps * self.change_rate)):
+            self.builds[appid] = BASE_BUILD + self.cycle
+
+    def telegram(self, method, args):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        if method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            chat_id = int(args.get('chat_id', 1))
+            return {'message_id': 1, 'date': int(time.time()), 'text': args.get('text', ''),
+                    'chat': {'id': chat_id, 'type': 'private'}}
+        return True
+
+    def steam(self, endpoint, args):
+        if endpoint == 'vanity':
+            return {'response': {'success': 1, 'steamid': str(FIRST_STEAM_ID + 1)}}
+        if endpoint == 'owned_games':
+            games, _ = self.library(args['steamid'])
+            return {'response': {'game_count': len(games), 'games': games}}
+        if endpoint == 'app_details':
+            appid = args['appids']
+            return {appid: {'success': True, 'data': {'name': f"Game {appid}", 'type': 'game'}}}
+        if endpoint == 'patch_data':
+            build = self.builds.get(int(args['appid']), BASE_BUILD)
+            return {'success': True, 'changes': [{'buildid': build, 'time': int(time.time()),
+                                                  'change_description': ''}]}
+        raise tornado.web.HTTPError(404)
+
+class FakeHandler(tornado.web.RequestHandler):
+    def initialize(self, backend, endpoint):
+        self.backend = backend
+        self.endpoint = endpoint
+
+    def log_exception(self, typ, value, tb):
+        pass
+
+    def respond(self, method=None):
+        args = {name: self.get_argument(name) for name in self.request.arguments}
+        if self.endpoint == 'telegram':
+            self.backend.calls[f"telegram.{method}"] += 1
+            self.write({'ok': True, 'result': self.backend.telegram(method, args)})
+        else:
+            self.backend.calls[f"steam.{self.endpoint}"] += 1
+            self.write(self.backend.steam(self.endpoint, args))
+
+    def get(self, method=None):
+        self.respond(method)
+
+    def post(self, method=None):
+        self.respond(method)
+
+class ControlHandler(tornado.web.RequestHandler):
+    """Contadores e avanço de ciclo, consultados pelo processo do bot"""
+
+    def initialize(self, backend):
+        self.backend = backend
+
+    def get(self, action):
+        self.write(dict(self.backend.calls))
+
+    def post(self, action):
+        if action == 'advance':
+            self.backend.advance()
+        elif action == 'reset':
+            self.backend.calls.clear()
+        self.write({})
+
+class BackendControl:
+    def __init__(self, base):
+        self.client = httpx.AsyncClient(base_url=f"{base}/_control", trust_env=False)
+
+    async def calls(self, prefix):
+        calls = (await self.client.get('/calls')).json()
+        return {name.split('.', 1)[1]: n for name, n in calls.items() if name.startswith(prefix + '.')}
+
+    async def reset(self):
+        await self.client.post('/reset')
+
+    async def advance(self):
+        await self.client.post('/advance')
+
+    async def close(self):
+        await self.client.aclose()
+
+def serve_backend(backend, sockets):
+    """Processo filho: o servidor falso não disputa CPU com o bot medido"""
+    async def serve():
+        routes = [
+            (r'/bot[^/]+/(\w+)', 'telegram'),
+            (r'/ISteamUser/ResolveVanityURL/v1/', 'vanity'),
+            (r'/IPlayerService/GetOwnedGames/v1/', 'owned_games'),
+            (r'/api/appdetails', 'app_details'),
+            (r'/steamdb/PatchData/', 'patch_data'),
+        ]
+        app = tornado.web.Application(
+            [(path, FakeHandler, {'backend': backend, 'endpoint': endpoint}) for path, endpoint in routes]
+            + [(r'/_control/(\w+)', ControlHandler, {'backend': backend})]
+        )
+        HTTPServer(app).add_sockets(sockets)
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+def seed(db, backend, users):
+    """Semeia users, apps, games e library_sync direto em SQL, em blocos de 10k usuários"""
+    from updater import format_timestamp, library_hash
+
+    conn = db.conn
+    conn.executemany('INSERT OR IGNORE INTO apps (appid, name, last_buildid) VALUES (?, ?, ?)',
+                     ((appid, f"Game {appid}", str(BASE_BUILD))
+                      for appid in range(FIRST_APP, FIRST_APP + backend.apps)))
+    now = time.time()
+    for first in range(1, users + 1, 10000):
+        user_rows, game_rows, sync_rows = [], [], []
+        for telegram_id in range(first, min(first + 10000, users + 1)):
+            steam_id = str(FIRST_STEAM_ID + telegram_id)
+            games, installed = backend.library(steam_id)
+            installed = set(installed)
+            # Próxima verificação espalhada pelo intervalo padrão, como em regime
+            user_rows.append((telegram_id, steam_id, format_timestamp(now + random.uniform(0, 6 * 3600))))
+            game_rows.extend((telegram_id, game['appid'], game['appid'] in installed, game['playtime_forever'])
+                             for game in games)
+            sync_rows.append((telegram_id, library_hash(games), format_timestamp(now)))
+        conn.executemany('INSERT INTO users (telegram_id, steam_id, next_check_at) VALUES (?, ?, ?)', user_rows)
+        conn.executemany('INSERT INTO games (telegram_id, game_id, installed, last_played) VALUES (?, ?, ?, ?)',
+                         game_rows)
+        conn.executemany('INSERT INTO library_sync (telegram_id, response_hash, synced_at) VALUES (?, ?, ?)',
+                         sync_rows)
+        conn.commit()
+    conn.execute('ANALYZE')
+    conn.commit()
+
+def make_update(update_id, kind, telegram_id, backend):
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'User', 'language_code': 'en'}
+    chat = {'id': telegram_id, 'type': 'private'}
+    if kind in ('games_page', 'toggle'):
+        if kind == 'toggle':
+            games, installed = backend.library(FIRST_STEAM_ID + telegram_id)
+            game_id = random.choice(games)['appid']
+            data = f"toggle_{game_id}_{0 if game_id in installed else 1}"
+            markup = [[{'text': f"Game {game_id}", 'callback_data': data}]]
+        else:
+            data = f"games_{random.randrange(0, 5)}"
+            markup = [[{'text': '➡️', 'callback_data': data}]]
+        message = {'message_id': 1, 'date': 0, 'chat': chat, 'text': 'games',
+                   'reply_markup': {'inline_keyboard': markup}}
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': '1', 'data': data, 'message': message}}
+
+    text = kind
+    if kind == '/vincular':
+        text += f" {FIRST_STEAM_ID + telegram_id}"
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': text,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(kind)}]}}
+
+async def run_updates(application, updates, concurrency):
+    """Processa os updates com concurrency workers; retorna {tipo: [latências]} e o tempo total"""
+    latencies = defaultdict(list)
+    pending = iter(updates)
+
+    async def worker():
+        for kind, update in pending:
+            start = time.perf_counter()
+            await application.process_update(update)
+            latencies[kind].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+async def bench_handlers(bot, backend, control, args, queries):
+    from telegram import Update
+
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+
+    bot.application.add_error_handler(count_error)
+    kinds = [kind for kind, _ in COMMAND_MIX]
+    weights = [weight for _, weight in COMMAND_MIX]
+
+    def updates(batch_kinds):
+        return [
+            (kind, Update.de_json(make_update(i, kind, random.randint(1, args.users), backend), bot.application.bot))
+            for i, kind in enumerate(batch_kinds)
+        ]
+
+    # Custo por comando: passagem sequencial por tipo, contando SQL e chamadas aos backends
+    per_command = {}
+    for kind in kinds:
+        batch = updates([kind] * args.sample)
+        queries.clear()
+        await control.reset()
+        await run_updates(bot.application, batch, 1)
+        per_command[kind] = (
+            sum(queries.values()) / len(batch),
+            sum((await control.calls('telegram')).values()) / len(batch),
+            sum((await control.calls('steam')).values()) / len(batch),
+        )
+
+    # Vazão e latência com a mistura de comandos
+    batch = updates(random.choices(kinds, weights, k=args.updates))
+    latencies, elapsed = await run_updates(bot.application, batch, args.concurrency)
+
+    print(f"\nhandlers: {len(batch)} updates, concurrency {args.concurrency}: "
+          f"{elapsed:.2f}s ({len(batch) / elapsed:,.0f} updates/s), {len(errors)} errors")
+    print(f"{'command':<12} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'sql/cmd':>8} {'tg/cmd':>7} {'steam/cmd':>9}")
+    for kind in kinds:
+        values = latencies.get(kind, [])
+        sql, tg, steam = per_command[kind]
+        print(f"{kind:<12} {len(values):>6} {percentile(values, 0.5) * 1000:>8.2f} "
+              f"{percentile(values, 0.99) * 1000:>8.2f} {sql:>8.1f} {tg:>7.1f} {steam:>9.1f}")
+    values = [v for kind_values in latencies.values() for v in kind_values]
+    print(f"{'all':<12} {len(values):>6} {percentile(values, 0.5) * 1000:>8.2f} {percentile(values, 0.99) * 1000:>8.2f}")
+
+async def bench_checker(bot, backend, control, args, queries):
+    from config import Config
+
+    checker = bot.update_checker
+    db = bot.db.db
+
+    async def report(name, elapsed, found):
+        calls = await control.calls('steam')
+        outbox = db.conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        print(f"{name:<22} {elapsed:>8.2f}s {sum(calls.values()):>9} {found:>8} {outbox:>8} "
+              f"{sum(queries.values()):>8}  {dict(calls)}")
+
+    print(f"\nupdate checker ({args.change_rate:.0%} of {backend.apps} apps change per cycle)")
+    print(f"{'cycle':<22} {'elapsed':>9} {'upstream':>9} {'updates':>8} {'outbox':>8} {'sql':>8}  calls")
+
+    # Tick em regime: um bucket do intervalo padrão vencido
+    buckets = Config.DEFAULT_CHECK_INTERVAL * 60 // Config.POLL_TICK_MINUTES
+    db.conn.execute("UPDATE users SET next_check_at = datetime('now', '-1 minute') WHERE telegram_id % ? = 0",
+                    (buckets,))
+    db.conn.commit()
+    await control.advance()
+    await control.reset()
+    queries.clear()
+    start = time.perf_counter()
+    before = db.conn.execute('SELECT COUNT(*) FROM updates').fetchone()[0]
+    await checker.check_due_apps()
+    found = db.conn.execute('SELECT COUNT(*) FROM updates').fetchone()[0] - before
+    await report(f"tick (1/{buckets} users)", time.perf_counter() - start, found)
+
+    # Ciclo completo: todos os apps instalados, uma consulta por app
+    await control.advance()
+    await control.reset()
+    queries.clear()
+    start = time.perf_counter()
+    before = db.conn.execute('SELECT COUNT(*) FROM updates').fetchone()[0]
+    await checker.check_all_users()
+    found = db.conn.execute('SELECT COUNT(*) FROM updates').fetchone()[0] - before
+    await report('check_all_users', time.perf_counter() - start, found)
+
+    installed = db.conn.execute('SELECT COUNT(DISTINCT game_id) FROM games WHERE installed = TRUE').fetchone()[0]
+    print(f"{installed} distinct installed apps (lower bound of upstream calls for a full cycle)")
+
+def bench_db(db, args):
+    from config import Config
+
+    rng = random.Random(3)
+    users = args.users
+    apps = list(range(FIRST_APP, FIRST_APP + args.apps))
+
+    def installed_game(telegram_id):
+        games = db.get_installed_games(telegram_id)
+        return games[0][0] if games else FIRST_APP
+
+    paths = {
+        'get_user': lambda: db.get_user(rng.randint(1, users)),
+        'get_installed_games': lambda: db.get_installed_games(rng.randint(1, users)),
+        'get_games_page': lambda: db.get_games_page(rng.randint(1, users), 0, 10),
+        'get_user_stats': lambda: db.get_user_stats(rng.randint(1, users)),
+        'get_app_subscribers': lambda: db.get_app_subscribers(rng.sample(apps, 50)),
+        'get_due_apps': lambda: db.get_due_apps([rng.randint(1, users) for _ in range(50)]),
+        'get_due_users': lambda: db.get_due_users(Config.MAX_USERS_PER_TICK),
+        'toggle_game': lambda: db.toggle_game(rng.randint(1, users), installed_game(rng.randint(1, users))),
+    }
+
+    print(f"\ndatabase hot paths ({args.sample * 10} calls each)")
+    print(f"{'method':<22} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, call in paths.items():
+        latencies = []
+        for _ in range(args.sample * 10):
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        print(f"{name:<22} {len(latencies) / sum(latencies):>9,.0f} {percentile(latencies, 0.5) * 1000:>8.3f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.3f}")
+
+async def run(args, db_path, base):
+    from config import Config
+    from db import Database
+
+    # Conta as instruções SQL de todas as conexões (writer e leitores)
+    queries = Counter()
+    connect = Database._connect
+
+    def traced_connect(self, read_only=False):
+        conn = connect(self, read_only)
+        conn.set_trace_callback(lambda statement: queries.update(
+            [statement.split(None, 1)[0].upper()]) if not statement.startswith(('PRAGMA', 'BEGIN', 'COMMIT')) else None)
+        return conn
+
+    Database._connect = traced_connect
+    Config.HOST_RATE_DEFAULT = (1e9, 1e9)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    backend = FakeBackend(args.apps, args.games_per_user, args.installed_fraction, args.change_rate)
+    control = BackendControl(base)
+
+    from bot import SteamUpdateBot
+    bot = SteamUpdateBot(Config.TELEGRAM_TOKEN)
+    seeded = bot.db.db.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    if seeded:
+        print(f"reusing {seeded} users from {db_path}")
+        args.users = seeded
+    else:
+        start = time.perf_counter()
+        seed(bot.db.db, backend, args.users)
+        print(f"seeded {args.users} users x {args.games_per_user} games in {time.perf_counter() - start:.1f}s")
+
+    await bot.application.initialize()
+    try:
+        await bench_handlers(bot, backend, control, args, queries)
+        await bench_checker(bot, backend, control, args, queries)
+        bench_db(bot.db.db, args)
+        hosts = bot.steam_api.stats()['hosts']
+        print(f"\nSteamAPI counters: {json.dumps(hosts)}")
+    finally:
+        await bot.application.shutdown()
+        await bot.steam_api.close()
+        await bot.db.close()
+        await control.close()
+        Database._connect = connect
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--games-per-user', type=int, default=50)
+    parser.add_argument('--installed-fraction', type=float, default=0.2)
+    parser.add_argument('--apps', type=int, default=20000, help='tamanho do catálogo')
+    parser.add_argument('--change-rate', type=float, default=0.05, help='fração dos apps com build novo por ciclo')
+    parser.add_argument('--updates', type=int, default=5000, help='updates do Telegram na medição de vazão')
+    parser.add_argument('--sample', type=int, default=50, help='updates por comando na contagem de SQL')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--db', help='banco semeado reaproveitado entre execuções (mesmos --games-per-user e --apps)')
+    args = parser.parse_args()
+    random.seed(1)
+
+    # Os endpoints e o banco vêm do ambiente, lidos quando config.py é importado
+    sockets = bind_sockets(0, '127.0.0.1')
+    base = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+    tmp = None if args.db else tempfile.mkdtemp()
+    db_path = args.db or os.path.join(tmp, 'load_test.db')
+    os.environ.update({
+        'DATABASE_NAME': db_path,
+        'TELEGRAM_API_URL': f"{base}/bot",
+        'STEAM_API_URL': base,
+        'STEAM_STORE_URL': base,
+        'STEAMDB_API_URL': f"{base}/steamdb",
+    })
+    os.environ.pop('CHANGELIST_URL', None)
+    os.environ.pop('CACHE_DB_PATH', None)
+    # fork: o filho herda os sockets já abertos
+    backend = FakeBackend(args.apps, args.games_per_user, args.installed_fraction, args.change_rate)
+    server = multiprocessing.get_context('fork').Process(target=serve_backend, args=(backend, sockets), daemon=True)
+    server.start()
+    for sock in sockets:
+        sock.close()
+    try:
+        asyncio.run(run(args, db_path, base))
+    finally:
+        server.terminate()
+        server.join()
+        if tmp:
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    main()
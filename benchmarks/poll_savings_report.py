@@ -0,0 +1,113 @@
+"""Requisições ao upstream do polling adaptativo, reproduzindo o nosso histórico de builds.
+
+Para cada app instalado, repete a janela de APP_POLL_HISTORY_DAYS da tabela updates
+com três políticas: consulta a cada tick (o que seria preciso para detectar tão
+rápido quanto o adaptativo nos apps ativos), intervalo fixo do usuário (o comportamento
+anterior) e o intervalo adaptativo do UpdateChecker. Mostra requisições e atraso médio
+de detecção de cada política e a economia do adaptativo em relação ao tick.
+
+Uso: python benchmarks/poll_savings_report.py [caminho do banco]
+"""
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from urllib.request import pathname2url
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from config import Config
+from updater import app_poll_interval
+
+def load_history(path, start):
+    """{game_id: (bound em segundos, [instantes em que cada build apareceu])}"""
+    # Somente leitura: o relatório nunca escreve no banco (nem cria um vazio)
+    with closing(sqlite3.connect(f'file:{pathname2url(os.path.abspath(path))}?mode=ro', uri=True)) as conn:
+        bounds = dict(conn.execute('''SELECT g.game_id, MIN(u.check_interval) FROM games g
+                                      JOIN users u ON u.telegram_id = g.telegram_id
+                                      WHERE g.installed = TRUE AND u.steam_id IS NOT NULL
+                                      GROUP BY g.game_id'''))
+        builds = {}
+        for game_id, seen_at in conn.execute(
+                '''SELECT game_id, (julianday(MIN(update_time)) - 2440587.5) * 86400
+                   FROM updates GROUP BY game_id, build_id ORDER BY 2'''):
+            builds.setdefault(game_id, []).append(seen_at)
+    return {
+        game_id: ((bound or Config.DEFAULT_CHECK_INTERVAL) * 3600,
+                  [t for t in builds.get(game_id, []) if t >= start])
+        for game_id, bound in bounds.items()
+    }
+
+def simulate(builds, start, end, next_interval):
+    """Consulta o app de start a end; retorna (requisições, atrasos de detecção).
+
+    next_interval(builds vistos, intervalo adaptativo anterior, mudou) devolve
+    (próxima espera, intervalo adaptativo guardado ou None).
+    """
+    requests, delays = 0, []
+    t, seen, previous = start, 0, None
+    while t < end:
+        requests += 1
+        detected = seen
+        while detected < len(builds) and builds[detected] <= t:
+            delays.append(t - builds[detected])
+            detected += 1
+        changed = detected > seen
+        seen = detected
+        wait, previous = next_interval(builds[:seen], previous, changed)
+        t += wait
+    return requests, delays
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE_NAME
+    if not os.path.isfile(path):
+        sys.exit(f"Database not found: {path}")
+    end = time.time()
+    start = end - Config.APP_POLL_HISTORY_DAYS * 86400
+    try:
+        history = load_history(path, start)
+    except sqlite3.Error as e:
+        sys.exit(f"Cannot read the update history from {path} ({e}); is it a bot database?")
+    tick = Config.POLL_TICK_MINUTES * 60
+
+    def adaptive(bound):
+        def next_interval(seen, previous, changed):
+            span = seen[-1] - seen[0] if seen else 0
+            interval = app_poll_interval(len(seen), span, previous, changed, bound)
+            # Como em schedule_apps: ao chegar no bound o app sai de app_polls
+            return interval, interval if interval < bound else None
+        return next_interval
+
+    policies = {
+        'every tick': lambda bound: lambda *_: (tick, None),
+        'fixed interval': lambda bound: lambda *_: (bound, None),
+        'adaptive': adaptive,
+    }
+    totals = {}
+    for name, policy in policies.items():
+        requests, delays = 0, []
+        for bound, builds in history.values():
+            app_requests, app_delays = simulate(builds, start, end, policy(bound))
+            requests += app_requests
+            delays += app_delays
+        totals[name] = (requests, sum(delays) / len(delays) if delays else 0.0)
+
+    builds = sum(len(b) for _, b in history.values())
+    print(f"{len(history)} apps, {builds} builds in the last {Config.APP_POLL_HISTORY_DAYS} days")
+    print(f"{'policy':<16} {'requests':>10} {'req/day':>9} {'mean delay':>11}")
+    for name, (requests, delay) in totals.items():
+        print(f"{name:<16} {requests:>10} {requests / Config.APP_POLL_HISTORY_DAYS:>9.0f} {delay / 60:>9.1f}m")
+
+    tick_requests = totals['every tick'][0]
+    adaptive_requests = totals['adaptive'][0]
+    fixed_requests = totals['fixed interval'][0]
+    if tick_requests:
+        print(f"adaptive saves {1 - adaptive_requests / tick_requests:.1%} of the requests of polling every tick")
+    if fixed_requests:
+        print(f"adaptive costs {adaptive_requests / fixed_requests - 1:+.1%} requests over the fixed interval")
+
+if __name__ == '__main__':
+    main()
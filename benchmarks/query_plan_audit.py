@@ -0,0 +1,87 @@
+"""Confere via EXPLAIN QUERY PLAN que os caminhos quentes do Database usam os índices.
+
+Executa cada método, captura o SQL realmente emitido e falha (exit 1) se algum
+plano voltar a fazer full scan em games/updates ou deixar de usar o índice esperado.
+
+Uso: python benchmarks/query_plan_audit.py
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from db import Database
+
+# método -> (args, índices que o plano precisa citar)
+HOT_PATHS = {
+    'get_installed_games': ((1,), {'idx_games_user_installed'}),
+    'get_user_stats': ((1,), {'idx_games_user_installed', 'idx_last_updates_user_time'}),
+    'get_games_page': ((1, 20, 10), {'idx_games_user_playtime'}),
+    'get_due_users': ((100,), {'idx_users_next_check'}),
+    'get_due_apps': (([1, 2, 3],), {'idx_games_user_installed'}),
+    'get_app_subscribers': (([10, 11],), {'idx_games_app_installed'}),
+    'touch_app_checked': ((10,), set()),
+    'record_app_update': ((10, '1', '2', 'url', [(1, 'msg', True)]), set()),
+    'get_due_polls': ((100,), {'idx_app_polls_next'}),
+    'get_app_poll_state': (([10, 11], 90), {'idx_updates_game_time', 'idx_games_app_installed'}),
+    'get_pending_notifications': ((100, 5), {'idx_outbox_next_attempt'}),
+    'toggle_game': ((1, 11), {'idx_games_user_installed'}),
+    'sync_library': ((1, [{'appid': 10, 'playtime_forever': 5}, {'appid': 99}], 'h'), {'idx_games_user_playtime'}),
+    'get_library_sync_due': ((24, 100), {'idx_library_sync_due'}),
+    'get_queued_checks': (([1, 2, 3], 256, 50), {'idx_check_queue_time'}),
+    'get_unbaselined_apps': ((1,), {'idx_games_user_installed'}),
+}
+
+FULL_SCAN = re.compile(r'^SCAN (games|updates|\w)\b(?!.*USING (COVERING )?INDEX)')
+
+def seed(db):
+    games = [{'appid': appid, 'name': f"Game {appid}", 'playtime_forever': appid} for appid in range(10, 60)]
+    for telegram_id in range(1, 51):
+        db.add_user(telegram_id, str(76561197960287930 + telegram_id))
+        db.sync_library(telegram_id, games, 'seed')
+        for appid in range(10, 20):
+            db.toggle_game(telegram_id, appid, True)
+    db.record_app_update(10, None, '1', 'url', [(telegram_id, None, False) for telegram_id in range(1, 51)])
+
+def capture(db, method, args):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        getattr(db, method)(*args)
+    finally:
+        db.conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+
+def plan(db, statement):
+    return [row[3] for row in db.conn.execute(f'EXPLAIN QUERY PLAN {statement}')]
+
+def main():
+    # Em memória todas as leituras passam pela conexão principal, onde o trace está ligado
+    db = Database(':memory:')
+    seed(db)
+    db.conn.execute('ANALYZE')
+    failures = []
+
+    for method, (args, expected) in HOT_PATHS.items():
+        used = set()
+        for statement in capture(db, method, args):
+            details = plan(db, statement)
+            used.update(re.findall(r'USING (?:COVERING )?INDEX (\w+)', ' '.join(details)))
+            for detail in details:
+                if FULL_SCAN.match(detail):
+                    failures.append(f"{method}: full scan '{detail}' in: {' '.join(statement.split())}")
+        missing = expected - used
+        if missing:
+            failures.append(f"{method}: expected {sorted(missing)}, plan used {sorted(used)}")
+        print(f"{method:<26} {', '.join(sorted(used)) or '-'}")
+
+    db.close()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Confere o cliente SteamAPI contra um servidor HTTP falso local (tornado, no mesmo event loop).
+
+- pooling: requisições seguidas reaproveitam a mesma conexão (keep-alive) e rajadas
+  concorrentes a um host não passam de HTTP_MAX_CONNECTIONS_PER_HOST conexões;
+- timeouts: um host que não responde devolve None em tempo limitado pelo
+  HTTP_TIMEOUT e pelos retries, sem travar o chamador;
+- erros: 5xx, 404, 429, JSON inválido, success=false, resposta sem builds e porta
+  fechada devolvem None; 4xx não é repetido e o circuito aberto não chega ao host.
+
+Cada caso usa um SteamAPI novo (circuito e pool próprios). Sai com código 1 se
+algum caso falhar.
+
+Uso: python benchmarks/steam_api_check.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from collections import Counter
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', 'benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from config import Config
+from steam_api import SteamAPI
+
+TIMEOUT = 0.3  # HTTP_TIMEOUT durante a checagem
+SLOW = 2  # atraso do modo slow, bem acima do TIMEOUT
+LATENCY = 0.05  # atraso do modo ok, para as rajadas concorrentes se sobreporem
+
+class StubState:
+    def __init__(self):
+        self.requests = Counter()  # modo -> requisições recebidas
+        self.peers = set()  # portas de origem: uma por conexão do cliente
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def reset(self):
+        self.__init__()
+
+class StubHandler(tornado.web.RequestHandler):
+    """Responde conforme o modo, o primeiro segmento do caminho"""
+
+    def initialize(self, state):
+        self.state = state
+
+    def log_exception(self, typ, value, tb):
+        pass
+
+    async def get(self, mode, endpoint):
+        state = self.state
+        state.requests[mode] += 1
+        state.peers.add(self.request.connection.stream.socket.getpeername()[1])
+        state.in_flight += 1
+        state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            await self.respond(mode, endpoint)
+        finally:
+            state.in_flight -= 1
+
+    async def respond(self, mode, endpoint):
+        if mode == 'slow':
+            await asyncio.sleep(SLOW)
+        elif mode == 'error':
+            self.set_status(503)
+        elif mode == 'notfound':
+            self.set_status(404)
+        elif mode == 'throttle':
+            self.set_status(429)
+            self.set_header('Retry-After', '1')
+        elif mode == 'badjson':
+            self.write('<html>not json</html>')
+        elif mode == 'nosuccess':
+            self.write({'success': False})
+        elif mode == 'nochanges':
+            self.write({'success': True, 'changes': []})
+        else:
+            await asyncio.sleep(LATENCY)
+            if endpoint == 'PatchData':
+                self.write({'success': True, 'changes': [{'buildid': 42, 'time': 1, 'change_description': ''}]})
+            else:
+                steam_id = self.get_argument('steamid', '0')
+                self.write({'response': {'game_count': 1, 'games': [{'appid': int(steam_id[-3:])}]}})
+
+def steam_api(base, mode):
+    url = f"{base}/{mode}"
+    return SteamAPI(api_key='check', base_url=url, store_url=url, steamdb_url=url, changelist_url=url)
+
+async def check_pooling(base, state):
+    results = []
+    api = steam_api(base, 'ok')
+    try:
+        # Sequenciais: uma única conexão reaproveitada (SteamIDs distintos fogem do cache)
+        state.reset()
+        for i in range(20):
+            await api.get_owned_games(str(76561197960287000 + i))
+        results.append(('sequential requests reuse one connection', len(state.peers) == 1,
+                        f"{state.requests['ok']} requests over {len(state.peers)} connections"))
+
+        # Rajada concorrente: limitada às conexões por host e ainda reaproveitadas
+        state.reset()
+        games = await asyncio.gather(*(api.get_owned_games(str(76561197960288000 + i)) for i in range(60)))
+        limit = Config.HTTP_MAX_CONNECTIONS_PER_HOST
+        results.append(('concurrent burst capped per host',
+                        state.max_in_flight <= limit and len(state.peers) <= limit and all(games),
+                        f"{state.requests['ok']} requests, {state.max_in_flight} in flight, "
+                        f"{len(state.peers)} connections (limit {limit})"))
+    finally:
+        await api.close()
+    return results
+
+async def check_timeouts(base, state):
+    api = steam_api(base, 'slow')
+    state.reset()
+    start = time.perf_counter()
+    try:
+        build = await api.get_latest_build(10)
+    finally:
+        await api.close()
+    elapsed = time.perf_counter() - start
+    # Cada tentativa para no timeout; o backoff entre elas vai até 1.5x a base
+    bound = (Config.HTTP_MAX_RETRIES + 1) * TIMEOUT + sum(
+        1.5 * Config.HTTP_BACKOFF_BASE * 2 ** attempt for attempt in range(Config.HTTP_MAX_RETRIES)) + 0.5
+    return [('unresponsive host times out with None', build is None and elapsed < bound,
+             f"{state.requests['slow']} attempts in {elapsed:.2f}s (bound {bound:.2f}s, host sleeps {SLOW}s)")]
+
+async def check_errors(base, state, closed_base):
+    results = []
+    cases = (
+        ('error', 'HTTP 503 retried, then None', Config.HTTP_MAX_RETRIES + 1),
+        ('notfound', 'HTTP 404 not retried, None', 1),
+        ('throttle', 'HTTP 429 with Retry-After, None', None),
+        ('badjson', 'invalid JSON, None', Config.HTTP_MAX_RETRIES + 1),
+        ('nosuccess', 'success=false, None', 1),
+        ('nochanges', 'no builds, None', 1),
+    )
+    for mode, name, expected_requests in cases:
+        api = steam_api(base, mode)
+        state.reset()
+        try:
+            build = await api.get_latest_build(10)
+        finally:
+            await api.close()
+        requests = state.requests[mode]
+        passed = build is None and (expected_requests is None or requests == expected_requests)
+        results.append((name, passed, f"{requests} requests"))
+
+    api = SteamAPI(api_key='check', base_url=closed_base, store_url=closed_base,
+                   steamdb_url=closed_base, changelist_url=closed_base)
+    try:
+        games = await api.get_owned_games('76561197960287930')
+        counters = next(iter(api.stats()['hosts'].values()))
+        results.append(('connection refused, None', games is None, f"{counters['requests']} attempts"))
+    finally:
+        await api.close()
+
+    # Circuito aberto depois de BREAKER_FAILURE_THRESHOLD falhas: as próximas nem chegam ao host
+    api = steam_api(base, 'error')
+    state.reset()
+    try:
+        for _ in range(Config.BREAKER_FAILURE_THRESHOLD + 3):
+            await api.get_latest_build(10)
+        hosts = api.stats()['hosts']
+    finally:
+        await api.close()
+    counters = next(iter(hosts.values()))
+    results.append(('open circuit short-circuits without requests',
+                     counters['circuit_open'] and counters['short_circuited'] > 0
+                     and state.requests['error'] == Config.BREAKER_FAILURE_THRESHOLD,
+                     f"{state.requests['error']} requests, {counters['short_circuited']} short-circuited"))
+    return results
+
+async def run():
+    Config.HTTP_TIMEOUT = TIMEOUT
+    Config.HTTP_CONNECT_TIMEOUT = TIMEOUT
+    Config.HTTP_BACKOFF_BASE = 0.01
+    Config.HOST_RATE_DEFAULT = (1e9, 1e9)
+    Config.CACHE_TTLS = {}
+
+    state = StubState()
+    sockets = bind_sockets(0, '127.0.0.1')
+    base = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+    server = HTTPServer(tornado.web.Application([(r'/(\w+)/.*?(\w*)/?', StubHandler, {'state': state})]))
+    server.add_sockets(sockets)
+    # Porta reservada e fechada: conexão recusada
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    closed_base = f"http://127.0.0.1:{closed.getsockname()[1]}"
+    closed.close()
+
+    try:
+        results = await check_pooling(base, state)
+        results += await check_timeouts(base, state)
+        results += await check_errors(base, state, closed_base)
+    finally:
+        server.stop()
+
+    for name, passed, detail in results:
+        print(f"{'ok  ' if passed else 'FAIL'} {name:<48} {detail}")
+    return 0 if all(passed for _, passed, _ in results) else 1
+
+def main():
+    logging.getLogger().setLevel(logging.CRITICAL)
+    return asyncio.run(run())
+
+if __name__ == '__main__':
+    sys.exit(main())
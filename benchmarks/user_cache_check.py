@@ -0,0 +1,144 @@
+"""Confere que comandos e cliques de configuração não consultam users com o cache quente.
+
+Sobe o SteamUpdateBot contra uma Bot API falsa local (tornado, no mesmo event loop),
+vincula alguns usuários e, para cada caso, aquece o cache de perfis com um update
+qualquer e processa o caso com o trace do SQLite ligado em todas as conexões. Falha
+(código de saída 1) se /settings, /help ou um clique de configuração fizer um SELECT
+em users: o perfil tem que vir do cache de AsyncDatabase.get_user.
+
+Uso: python benchmarks/user_cache_check.py
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+FIRST_STEAM_ID = 76561197960287930
+USERS_SELECT = re.compile(r'^\s*SELECT\b.*\bFROM\s+users\b', re.IGNORECASE | re.DOTALL)
+
+# (nome, texto do comando ou dados do callback)
+CASES = (
+    ('/settings', '/settings'),
+    ('/help', '/help'),
+    ('setting_interval', 'setting_interval'),
+    ('setting_silent', 'setting_silent'),
+    ('setting_digest', 'setting_digest'),
+    ('setting_language', 'setting_language'),
+)
+
+class FakeTelegramHandler(tornado.web.RequestHandler):
+    """Bot API mínima: getMe e as mensagens enviadas ou editadas pelos handlers"""
+
+    def respond(self, method):
+        chat_id = int(self.get_argument('chat_id', '1'))
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Check', 'username': 'check_bot'}
+        elif method in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            result = {'message_id': 1, 'date': int(time.time()), 'text': self.get_argument('text', ''),
+                      'chat': {'id': chat_id, 'type': 'private'}}
+        else:
+            result = True
+        self.write({'ok': True, 'result': result})
+
+    def get(self, method):
+        self.respond(method)
+
+    def post(self, method):
+        self.respond(method)
+
+def make_update(update_id, telegram_id, kind):
+    user = {'id': telegram_id, 'is_bot': False, 'first_name': 'User', 'language_code': 'en'}
+    chat = {'id': telegram_id, 'type': 'private'}
+    if not kind.startswith('/'):
+        message = {'message_id': 1, 'date': 0, 'chat': chat, 'text': 'settings'}
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': '1', 'data': kind, 'message': message}}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': kind,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(kind)}]}}
+
+async def run(sockets):
+    from telegram import Update
+    from config import Config
+    from db import Database
+
+    # Trace de todas as conexões (writer e leitores), além do metrics.count_query
+    statements = []
+    connect = Database._connect
+
+    def traced_connect(self, read_only=False):
+        conn = connect(self, read_only)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    Database._connect = traced_connect
+    server = HTTPServer(tornado.web.Application([(r'/bot[^/]+/(\w+)', FakeTelegramHandler)]))
+    server.add_sockets(sockets)
+
+    from bot import SteamUpdateBot
+    bot = SteamUpdateBot(Config.TELEGRAM_TOKEN)
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+
+    bot.application.add_error_handler(count_error)
+    await bot.application.initialize()
+    failures = []
+    try:
+        update_id = 0
+        for telegram_id, (name, kind) in enumerate(CASES, start=1):
+            await bot.db.add_user(telegram_id, str(FIRST_STEAM_ID + telegram_id))
+            # Aquece o cache de perfis: só o primeiro update do usuário vai ao banco
+            for step in ('/help', kind):
+                update_id += 1
+                update = Update.de_json(make_update(update_id, telegram_id, step), bot.application.bot)
+                statements.clear()
+                await bot.application.process_update(update)
+            selects = [' '.join(s.split()) for s in statements if USERS_SELECT.match(s)]
+            print(f"{'ok  ' if not selects else 'FAIL'} {name:<18} {len(statements)} statements, "
+                  f"{len(selects)} users SELECTs")
+            failures.extend(f"{name}: {select}" for select in selects)
+    finally:
+        await bot.application.shutdown()
+        await bot.steam_api.close()
+        await bot.db.close()
+        server.stop()
+        Database._connect = connect
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    for error in errors:
+        print(f"FAIL handler error: {error}")
+    return 1 if failures or errors else 0
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    sockets = bind_sockets(0, '127.0.0.1')
+    tmp = tempfile.mkdtemp()
+    # Lidos quando config.py é importado
+    os.environ.update({
+        'DATABASE_NAME': os.path.join(tmp, 'user_cache_check.db'),
+        'TELEGRAM_API_URL': f"http://127.0.0.1:{sockets[0].getsockname()[1]}/bot",
+    })
+    os.environ.pop('CHANGELIST_URL', None)
+    os.environ.pop('CACHE_DB_PATH', None)
+    try:
+        return asyncio.run(run(sockets))
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    sys.exit(main())
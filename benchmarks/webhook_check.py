@@ -0,0 +1,188 @@
+"""Confere o modo webhook de ponta a ponta contra uma Bot API falsa local.
+
+Sobe SteamUpdateBot.serve_webhook(register=False) com WEBHOOK_PORT=0 (a porta sai de
+bot.webhook_server.port) e envia POSTs reais:
+
+- segredo ausente ou errado devolve 403; Content-Type errado 415; JSON inválido ou
+  que não é um objeto devolve 400, sem registrar erro no log;
+- um update válido devolve 200 e chega aos handlers da Application;
+- ao parar, um update lento já aceito termina de ser processado e o outbox
+  pendente é enviado antes de serve_webhook() retornar, e a porta é fechada.
+
+Sai com código 1 se algum caso falhar.
+
+Uso: python benchmarks/webhook_check.py
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import httpx
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:benchmark')
+os.environ.setdefault('STEAM_API_KEY', 'benchmark')
+
+from user_cache_check import FakeTelegramHandler, make_update
+
+SECRET = 'webhook-check-secret'
+TELEGRAM_ID = 1
+SLOW_HANDLER = 0.5  # atraso do handler lento, para o update ainda estar em processamento no stop
+NOTIFICATION = 'webhook check notification'
+
+class RecordingTelegramHandler(FakeTelegramHandler):
+    """Bot API falsa que guarda o texto de cada sendMessage"""
+
+    def initialize(self, sent):
+        self.sent = sent
+
+    def respond(self, method):
+        if method == 'sendMessage':
+            self.sent.append(self.get_argument('text', ''))
+        super().respond(method)
+
+class ErrorRecorder(logging.Handler):
+    """Guarda os registros ERROR emitidos durante os casos"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+async def wait_for(predicate, timeout=10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+async def check_requests(client, url, processed):
+    """Casos de validação e um update válido; retorna os resultados"""
+    results = []
+    valid = json.dumps(make_update(1, TELEGRAM_ID, '/help'))
+    json_headers = {'Content-Type': 'application/json'}
+    cases = (
+        ('missing secret token', None, valid, json_headers, 403),
+        ('wrong secret token', 'wrong', valid, json_headers, 403),
+        ('wrong content type', SECRET, valid, {'Content-Type': 'text/plain'}, 415),
+        ('invalid JSON', SECRET, '{not json', json_headers, 400),
+        ('JSON array instead of object', SECRET, '[1, 2]', json_headers, 400),
+        ('JSON string instead of object', SECRET, '"update"', json_headers, 400),
+    )
+    for name, secret, body, headers, expected in cases:
+        if secret is not None:
+            headers = {**headers, 'X-Telegram-Bot-Api-Secret-Token': secret}
+        response = await client.post(url, content=body, headers=headers)
+        results.append((f"{name} -> {expected}", response.status_code == expected, f"HTTP {response.status_code}"))
+
+    response = await client.post(url, content=valid, headers={
+        'X-Telegram-Bot-Api-Secret-Token': SECRET, **json_headers})
+    reached = await wait_for(lambda: 1 in processed)
+    results.append(('valid update reaches the handlers', response.status_code == 200 and reached,
+                    f"HTTP {response.status_code}, processed {sorted(processed)}"))
+    return results
+
+async def run(sockets):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from config import Config
+
+    sent = []
+    server = HTTPServer(tornado.web.Application([(r'/bot[^/]+/(\w+)', RecordingTelegramHandler, {'sent': sent})]))
+    server.add_sockets(sockets)
+
+    from bot import SteamUpdateBot
+    bot = SteamUpdateBot(Config.TELEGRAM_TOKEN)
+    processed = set()
+
+    async def slow_handler(update, context):
+        await asyncio.sleep(SLOW_HANDLER)
+        processed.add(update.update_id)
+
+    bot.application.add_handler(TypeHandler(Update, slow_handler), group=1)
+    errors = ErrorRecorder()
+    logging.getLogger().addHandler(errors)
+
+    stop_event = asyncio.Event()
+    serving = asyncio.create_task(bot.serve_webhook(register=False, stop_event=stop_event))
+    results = []
+    try:
+        if not await wait_for(lambda: bot.webhook_server is not None or serving.done()):
+            return [('webhook server started', False, 'timed out waiting for bot.webhook_server')]
+        if serving.done():
+            return [('webhook server started', False, repr(serving.exception()))]
+        port = bot.webhook_server.port
+        url = f"http://127.0.0.1:{port}/{Config.WEBHOOK_PATH}"
+        results.append(('server bound to a free port', port != 0, f"port {port}"))
+
+        async with httpx.AsyncClient() as client:
+            results += await check_requests(client, url, processed)
+            request_errors = [record.getMessage() for record in errors.records]
+            results.append(('rejected requests not logged as errors', not request_errors,
+                            f"{len(request_errors)} ERROR records {request_errors[:2]}"))
+
+            # Drenagem: um update lento já aceito e uma notificação pendente no outbox
+            await bot.db.add_user(TELEGRAM_ID, '76561197960287931')
+            await bot.db.sync_library(TELEGRAM_ID, [{'appid': 10, 'name': 'Game 10', 'playtime_forever': 1}], 'check')
+            await bot.db.toggle_game(TELEGRAM_ID, 10, True)
+            await bot.db.record_app_update(10, None, '1', 'url', [])
+            await bot.db.record_app_update(10, '1', '2', 'url', [(TELEGRAM_ID, NOTIFICATION, False)])
+            response = await client.post(url, content=json.dumps(make_update(2, TELEGRAM_ID, '/help')), headers={
+                'X-Telegram-Bot-Api-Secret-Token': SECRET, 'Content-Type': 'application/json'})
+            stop_event.set()
+            await asyncio.wait_for(serving, Config.SHUTDOWN_DRAIN_SECONDS + 10)
+            results.append(('accepted update processed before stop returns',
+                            response.status_code == 200 and 2 in processed,
+                            f"HTTP {response.status_code}, processed {sorted(processed)}"))
+            results.append(('pending outbox sent before stop returns', NOTIFICATION in sent,
+                            f"{sent.count(NOTIFICATION)} notifications sent"))
+
+            try:
+                await client.post(url, content='{}', headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+                closed = False
+            except httpx.TransportError:
+                closed = True
+            results.append(('port closed after stop', closed, f"port {port}"))
+    finally:
+        logging.getLogger().removeHandler(errors)
+        if not serving.done():
+            stop_event.set()
+            await serving
+        server.stop()
+    return results
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    sockets = bind_sockets(0, '127.0.0.1')
+    tmp = tempfile.mkdtemp()
+    # Lidos quando config.py é importado
+    os.environ.update({
+        'DATABASE_NAME': os.path.join(tmp, 'webhook_check.db'),
+        'TELEGRAM_API_URL': f"http://127.0.0.1:{sockets[0].getsockname()[1]}/bot",
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': '0',
+        'WEBHOOK_SECRET_TOKEN': SECRET,
+    })
+    for name in ('WEBHOOK_URL', 'CHANGELIST_URL', 'CACHE_DB_PATH', 'CHECK_SHARDS', 'METRICS_PORT'):
+        os.environ.pop(name, None)
+    try:
+        results = asyncio.run(run(sockets))
+    finally:
+        shutil.rmtree(tmp)
+
+    for name, passed, detail in results:
+        print(f"{'ok  ' if passed else 'FAIL'} {name:<46} {detail}")
+    return 0 if all(passed for _, passed, _ in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
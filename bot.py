@@ -1,88 +1,110 @@
-import os
-import json
+import asyncio
+import secrets
+import signal
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters
 )
-from db import Database
+from db import Database, AsyncDatabase
 from steam_api import SteamAPI
-from updater import UpdateChecker
+from updater import UpdateChecker, library_hash
+from changelist import SteamChangelistFeed
+from sharding import ShardLeases
+from notifier import NotificationDispatcher
+from webhook import WebhookServer
+from metrics import MetricsServer, metrics
+from i18n import catalog
 from config import Config
 from logger import logger
-from contextlib import closing
-
-def load_localization():
-    """Carrega os arquivos de localização da pasta 'localization'"""
-    localization = {}
-    localization_dir = os.path.join(os.path.dirname(__file__), 'localization')
-    
-    if not os.path.exists(localization_dir):
-        logger.error(f"Localization directory not found: {localization_dir}")
-        return {'en': {}}
-    
-    for filename in os.listdir(localization_dir):
-        if filename.endswith('.json'):
-            lang = filename.split('.')[0]
-            try:
-                filepath = os.path.join(localization_dir, filename)
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    localization[lang] = json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading {filename}: {e}")
-    return localization
-
-LOCALIZATION = load_localization()
 
 class SteamUpdateBot:
     def __init__(self, token):
         # Configuração da Application (substitui o Updater)
-        self.application = Application.builder().token(token).build()
-        self.db = Database()
+        self.application = (
+            Application.builder()
+            .token(token)
+            .base_url(Config.TELEGRAM_API_URL)
+            .concurrent_updates(Config.CONCURRENT_UPDATES)
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
+        # Compila e valida os catálogos de idioma uma vez, no início
+        self.catalog = catalog()
+        self.db = AsyncDatabase(Database())
         self.steam_api = SteamAPI()
-        self.update_checker = UpdateChecker(self.db, self.steam_api, token)
+        self.notifier = NotificationDispatcher(self.db, self.application.bot)
+        feed = SteamChangelistFeed(self.steam_api) if Config.CHANGELIST_URL else None
+        # Com CHECK_SHARDS o bot é um dos workers de verificação (os outros rodam worker.py)
+        leases = ShardLeases(self.db, Config.CHECK_SHARDS, Config.SHARD_LEASE_SECONDS,
+                             Config.WORKER_ID) if Config.CHECK_SHARDS else None
+        self.update_checker = UpdateChecker(self.db, self.steam_api, self.notifier, feed, leases)
+        
+        self.metrics_server = None
+        self.webhook_server = None  # definido por serve_webhook() depois de abrir a porta
+        
+        # Resolve o idioma uma vez por update, antes de qualquer handler
+        self.application.add_handler(TypeHandler(Update, self.timed(self.resolve_language)), group=-1)
         
         # Handlers de comandos
-        self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("help", self.help))
-        self.application.add_handler(CommandHandler("vincular", self.link_account))
-        self.application.add_handler(CommandHandler("games", self.list_games))
-        self.application.add_handler(CommandHandler("status", self.status))
-        self.application.add_handler(CommandHandler("stats", self.stats))
-        self.application.add_handler(CommandHandler("settings", self.settings))
-        self.application.add_handler(CommandHandler("language", self.language))
-        self.application.add_handler(CommandHandler("delete", self.delete_account))
+        self.application.add_handler(CommandHandler("start", self.timed(self.start)))
+        self.application.add_handler(CommandHandler("help", self.timed(self.help)))
+        self.application.add_handler(CommandHandler("vincular", self.timed(self.link_account)))
+        self.application.add_handler(CommandHandler("games", self.timed(self.list_games)))
+        self.application.add_handler(CommandHandler("status", self.timed(self.status)))
+        self.application.add_handler(CommandHandler("stats", self.timed(self.stats)))
+        self.application.add_handler(CommandHandler("settings", self.timed(self.settings)))
+        self.application.add_handler(CommandHandler("language", self.timed(self.language)))
+        self.application.add_handler(CommandHandler("delete", self.timed(self.delete_account)))
         
         # Handler de mensagens
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.timed(self.handle_message)))
         
         # Handler de callbacks
-        self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        self.application.add_handler(CallbackQueryHandler(self.timed(self.button_callback)))
         
         # Handler de erros
         self.application.add_error_handler(self.error_handler)
 
-    def get_text(self, update, key):
+    def timed(self, callback):
+        """Envolve o handler com latência e contagem de erros (steambot_handler_*)"""
+        return metrics.timed('steambot_handler', handler=callback.__name__)(callback)
+
+    async def resolve_language(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Guarda o idioma do usuário no contexto do update"""
+        user = await self.db.get_user(update.effective_user.id) if update.effective_user else None
+        context.language = user[2] if user and user[2] else 'en'
+
+    def get_text(self, context, key):
         """Get localized text for the user"""
-        user = self.db.get_user(update.effective_user.id)
-        lang = user[2] if user and user[2] else 'en'
-        return LOCALIZATION.get(lang, {}).get(key, LOCALIZATION['en'].get(key, key))
+        return self.catalog.text(getattr(context, 'language', None) or 'en', key)
+
+    def get_template(self, context, key):
+        """str.format pré-compilado do texto localizado, para linhas repetidas dos relatórios"""
+        return self.catalog.template(getattr(context, 'language', None) or 'en', key)
+
+    def format_text(self, context, key, **fields):
+        return self.get_template(context, key)(**fields)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        self.db.add_user(user_id)
+        await self.db.add_user(user_id)
         
-        welcome_msg = self.get_text(update, 'welcome_message')
-        help_msg = self.get_text(update, 'help_message')
+        welcome_msg = self.get_text(context, 'welcome_message')
+        help_msg = self.get_text(context, 'help_message')
         
         await update.message.reply_text(f"{welcome_msg}\n\n{help_msg}")
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_msg = self.get_text(update, 'help_message')
+        help_msg = self.get_text(context, 'help_message')
         await update.message.reply_text(help_msg)
 
     async def link_account(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -90,140 +112,177 @@ class SteamUpdateBot:
         args = context.args
         
         if not args:
-            await update.message.reply_text(self.get_text(update, 'provide_steam_id'))
+            await update.message.reply_text(self.get_text(context, 'provide_steam_id'))
             return
         
         steam_input = args[0]
-        steam_id = self.steam_api.get_steam_id_from_url(steam_input)
+        steam_id = await self.steam_api.get_steam_id_from_url(steam_input)
         
         if not steam_id:
-            await update.message.reply_text(self.get_text(update, 'invalid_steam_id'))
+            await update.message.reply_text(self.get_text(context, 'invalid_steam_id'))
             return
         
-        games = self.steam_api.get_owned_games(steam_id)
+        games = await self.steam_api.get_owned_games(steam_id)
         if not games:
-            await update.message.reply_text(self.get_text(update, 'private_profile_error'))
+            await update.message.reply_text(self.get_text(context, 'private_profile_error'))
             return
         
-        self.db.update_steam_id(user_id, steam_id)
+        await self.db.update_steam_id(user_id, steam_id)
+        await self.db.sync_library(user_id, games, library_hash(games))
         
-        for game in games:
-            self.db.add_or_update_game(
-                user_id,
-                game['appid'],
-                game.get('name', f"AppID {game['appid']}"),
-                installed=False,
-                last_played=game.get('playtime_forever', 0)
-            )
-        
-        self.update_checker.schedule_user_check(user_id)
-        await update.message.reply_text(self.get_text(update, 'account_linked_success'))
+        await self.update_checker.schedule_user_check(user_id)
+        await update.message.reply_text(self.get_text(context, 'account_linked_success'))
 
     async def list_games(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
         
         if not user or not user[1]:  # Verifica se o usuário tem Steam ID vinculado
-            await update.message.reply_text(self.get_text(update, 'link_account_first'))
+            await update.message.reply_text(self.get_text(context, 'link_account_first'))
             return
         
-        # Busca os jogos da biblioteca Steam
-        games = self.steam_api.get_owned_games(user[1])
-        if not games:
-            await update.message.reply_text(self.get_text(update, 'no_games_found'))
-            return
+        # /games <prefixo> filtra a biblioteca pelo início do nome
+        context.user_data['games_filter'] = ' '.join(context.args).strip() or None
         
-        # Verifica se a resposta da API está no formato esperado
-        if isinstance(games, dict) and 'games' in games.get('response', {}):
-            games = games['response']['games']
+        text, reply_markup = await self.games_page(user_id, 0, context)
+        if not reply_markup:
+            await update.message.reply_text(self.get_text(context, 'no_games_found'))
+            return
         
-        # Ordena os jogos por tempo jogado (decrescente)
-        games.sort(key=lambda x: x.get('playtime_forever', 0), reverse=True)
+        await update.message.reply_text(text, reply_markup=reply_markup)
+
+    async def games_page(self, user_id, page, context):
+        """Monta uma página do teclado de jogos a partir das linhas locais de games"""
+        page_size = Config.GAMES_PAGE_SIZE
+        name_filter = context.user_data.get('games_filter')
+        games, total = await self.db.get_games_page(user_id, page * page_size, page_size, name_filter)
+        if not games and page > 0:
+            # A página pedida deixou de existir (biblioteca encolheu): volta para a primeira
+            page = 0
+            games, total = await self.db.get_games_page(user_id, 0, page_size, name_filter)
+        if not games:
+            return None, None
         
-        # Prepara o teclado com os jogos
+        # Prepara o teclado com os jogos (já ordenados por tempo jogado)
         keyboard = []
-        for game in games:
-            game_id = game['appid']
-            game_name = game.get('name', f"AppID {game_id}")
-            playtime_hours = game.get('playtime_forever', 0) // 60
-            
-            # Verifica se o jogo já está marcado como instalado
-            is_installed = self.db.is_game_installed(user_id, game_id)
-            status_emoji = "✅" if is_installed else "❌"
-            
-            text = f"{status_emoji} {game_name}"
+        for game_id, game_name, is_installed, playtime in games:
+            playtime_hours = playtime // 60
+            label = game_name
             if playtime_hours > 0:
-                text += f" ({playtime_hours}h)"
+                label += f" ({playtime_hours}h)"
                 
-            keyboard.append([InlineKeyboardButton(text, callback_data=f"toggle_{game_id}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            self.get_text(update, 'select_games_to_toggle'),
-            reply_markup=reply_markup
+            keyboard.append([self.game_button(game_id, label, is_installed)])
+        
+        pages = (total + page_size - 1) // page_size
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("⬅️", callback_data=f"games_{page - 1}"))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("➡️", callback_data=f"games_{page + 1}"))
+        if navigation:
+            keyboard.append(navigation)
+        
+        text = self.get_text(context, 'select_games_to_toggle')
+        if pages > 1:
+            text += f"\n\n📄 {page + 1}/{pages}"
+        return text, InlineKeyboardMarkup(keyboard)
+
+    def game_button(self, game_id, label, installed):
+        """Botão de alternar jogo; o callback carrega o status desejado, não um flip"""
+        status_emoji = "✅" if installed else "❌"
+        return InlineKeyboardButton(
+            f"{status_emoji} {label}",
+            callback_data=f"toggle_{game_id}_{0 if installed else 1}"
         )
 
+    def toggled_keyboard(self, reply_markup, game_id, installed):
+        """Copia o teclado atual trocando só o botão do jogo alternado"""
+        if not reply_markup:
+            return None
+        keyboard = []
+        for row in reply_markup.inline_keyboard:
+            buttons = []
+            for button in row:
+                if (button.callback_data or '').split("_")[:2] == ["toggle", str(game_id)]:
+                    label = button.text.split(" ", 1)[-1]
+                    button = self.game_button(game_id, label, installed)
+                buttons.append(button)
+            keyboard.append(buttons)
+        return InlineKeyboardMarkup(keyboard)
+
     async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        installed_games = self.db.get_installed_games(user_id)
+        installed_games = await self.db.get_installed_games(user_id)
         
         if not installed_games:
-            await update.message.reply_text(self.get_text(update, 'no_installed_games'))
+            await update.message.reply_text(self.get_text(context, 'no_installed_games'))
             return
         
-        message = self.get_text(update, 'installed_games_header') + "\n\n"
+        game_line = self.get_template(context, 'status_game')
+        playtime = self.get_template(context, 'status_playtime')
+        lines = [self.get_text(context, 'installed_games_header')]
         for game_id, game_name, last_buildid, last_played in installed_games:
             played_hours = last_played // 60
-            message += f"🎮 {game_name}"
-            message += f" ({played_hours}h)" if played_hours > 0 else ""
-            message += f"\n🆔 Build ID: {last_buildid}\n\n"
+            lines.append(game_line(name=game_name, build_id=last_buildid,
+                                   playtime=playtime(hours=played_hours) if played_hours > 0 else ''))
         
-        await update.message.reply_text(message)
+        await update.message.reply_text('\n\n'.join(lines))
 
     async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        stats = self.db.get_user_stats(user_id)
+        stats = await self.db.get_user_stats(user_id)
         
         if not stats:
-            await update.message.reply_text(self.get_text(update, 'no_stats_available'))
+            await update.message.reply_text(self.get_text(context, 'no_stats_available'))
             return
         
-        message = self.get_text(update, 'stats_header') + "\n\n"
-        message += f"📊 Total updates tracked: {stats['total_updates']}\n"
-        message += f"🕒 Last update detected: {stats['last_update'] or 'Never'}\n"
-        message += f"🎮 Games installed: {stats['installed_count']}\n\n"
-        
+        sections = [
+            self.get_text(context, 'stats_header'),
+            self.format_text(context, 'stats_summary',
+                             total_updates=stats['total_updates'],
+                             last_update=stats['last_update'] or self.get_text(context, 'never'),
+                             installed_count=stats['installed_count'])
+        ]
         if stats['recent_updates']:
-            message += self.get_text(update, 'recent_updates_header') + "\n"
-            for game_name, update_time in stats['recent_updates']:
-                message += f"• {game_name} ({update_time})\n"
-        
-        await update.message.reply_text(message)
+            recent_update = self.get_template(context, 'recent_update')
+            sections.append('\n'.join(
+                [self.get_text(context, 'recent_updates_header')]
+                + [recent_update(name=game_name, update_time=update_time)
+                   for game_name, update_time in stats['recent_updates']]
+            ))
+        
+        await update.message.reply_text('\n\n'.join(sections))
 
     async def settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        user = self.db.get_user(user_id)
+        user = await self.db.get_user(user_id)
         
         if not user:
-            await update.message.reply_text(self.get_text(update, 'unexpected_error'))
+            await update.message.reply_text(self.get_text(context, 'unexpected_error'))
             return
         
         keyboard = [
             [
                 InlineKeyboardButton(
-                    self.get_text(update, 'change_check_interval'),
+                    self.get_text(context, 'change_check_interval'),
                     callback_data="setting_interval"
                 )
             ],
             [
                 InlineKeyboardButton(
-                    self.get_text(update, 'toggle_silent_mode'),
+                    self.get_text(context, 'toggle_silent_mode'),
                     callback_data="setting_silent"
                 )
             ],
             [
                 InlineKeyboardButton(
-                    self.get_text(update, 'change_language'),
+                    self.get_text(context, 'toggle_digest_mode'),
+                    callback_data="setting_digest"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    self.get_text(context, 'change_language'),
                     callback_data="setting_language"
                 )
             ]
@@ -231,10 +290,13 @@ class SteamUpdateBot:
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        settings_msg = self.get_text(update, 'current_settings') + "\n\n"
-        settings_msg += f"🕒 Check interval: {user[3]} hours\n"
-        settings_msg += f"🔇 Silent mode: {'On' if user[4] else 'Off'}\n"
-        settings_msg += f"🌐 Language: {user[2]}\n"
+        settings_msg = self.get_text(context, 'current_settings') + "\n\n" + self.format_text(
+            context, 'settings_summary',
+            interval=user[3],
+            silent=self.get_text(context, 'on' if user[4] else 'off'),
+            digest=self.get_text(context, 'on' if user[7] else 'off'),
+            language=user[2]
+        )
         
         await update.message.reply_text(settings_msg, reply_markup=reply_markup)
         
@@ -242,13 +304,13 @@ class SteamUpdateBot:
         user_id = update.effective_user.id
     
         keyboard = [
-            [InlineKeyboardButton(self.get_text(update, 'yes_delete'), callback_data="confirm_delete")],
-            [InlineKeyboardButton(self.get_text(update, 'cancel'), callback_data="cancel_delete")]
+            [InlineKeyboardButton(self.get_text(context, 'yes_delete'), callback_data="confirm_delete")],
+            [InlineKeyboardButton(self.get_text(context, 'cancel'), callback_data="cancel_delete")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await update.message.reply_text(
-            self.get_text(update, 'delete_confirmation'),
+            self.get_text(context, 'delete_confirmation'),
             reply_markup=reply_markup
         )    
 
@@ -257,16 +319,17 @@ class SteamUpdateBot:
         args = context.args
         
         if not args:
-            await update.message.reply_text(self.get_text(update, 'provide_language'))
+            await update.message.reply_text(self.get_text(context, 'provide_language'))
             return
         
         lang = args[0].lower()
-        if lang not in LOCALIZATION:
-            await update.message.reply_text(self.get_text(update, 'invalid_language'))
+        if lang not in self.catalog.languages:
+            await update.message.reply_text(self.get_text(context, 'invalid_language'))
             return
         
-        self.db.update_user_setting(user_id, 'language', lang)
-        await update.message.reply_text(self.get_text(update, 'language_changed'))
+        await self.db.update_user_setting(user_id, 'language', lang)
+        context.language = lang
+        await update.message.reply_text(self.get_text(context, 'language_changed'))
 
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -277,102 +340,95 @@ class SteamUpdateBot:
         
         try:
             if data.startswith("toggle_"):
-                game_id = int(data.split("_")[1])
+                parts = data.split("_")
+                game_id = int(parts[1])
+                # Botões novos trazem o status desejado, então um duplo clique não desfaz
+                # a mudança; botões antigos (toggle_<id>) continuam alternando
+                installed = bool(int(parts[2])) if len(parts) > 2 else None
                 
-                # Obter nome do jogo antes de fazer qualquer alteração
-                game_name = None
-                with closing(self.db.conn.cursor()) as c:
-                    c.execute('''SELECT name FROM games 
-                                WHERE telegram_id = ? AND game_id = ?''', 
-                                (user_id, game_id))
-                    result = c.fetchone()
-                    if result:
-                        game_name = result[0]
-                
-                if game_name:
-                    # Alternar status de instalação
-                    with closing(self.db.conn.cursor()) as c:
-                        c.execute('''UPDATE games SET installed = NOT installed 
-                                    WHERE telegram_id = ? AND game_id = ?''', 
-                                    (user_id, game_id))
-                        self.db.conn.commit()
-                    
-                    # Verificar novo status
-                    with closing(self.db.conn.cursor()) as c:
-                        c.execute('''SELECT installed FROM games 
-                                    WHERE telegram_id = ? AND game_id = ?''', 
-                                    (user_id, game_id))
-                        new_status = c.fetchone()[0]
-                    
-                    status_msg = self.get_text(update, 'game_installed') if new_status else self.get_text(update, 'game_uninstalled')
-                    await query.edit_message_text(f"{game_name} - {status_msg}")
+                result = await self.db.toggle_game(user_id, game_id, installed)
+                if result:
+                    game_name, new_status, installed_count = result
+                    reply_markup = self.toggled_keyboard(query.message.reply_markup, game_id, new_status)
+                    if reply_markup:
+                        # Mantém a página atual: só o botão do jogo muda
+                        try:
+                            await query.edit_message_reply_markup(reply_markup=reply_markup)
+                        except BadRequest as e:
+                            if 'not modified' not in str(e).lower():
+                                raise
+                    else:
+                        status_msg = self.get_text(context, 'game_installed') if new_status else self.get_text(context, 'game_uninstalled')
+                        await query.edit_message_text(f"{game_name} - {status_msg}")
                     
                     # Reschedule checks if needed
-                    installed_count = 0
-                    with closing(self.db.conn.cursor()) as c:
-                        c.execute('''SELECT COUNT(*) FROM games 
-                                    WHERE telegram_id = ? AND installed = TRUE''', 
-                                    (user_id,))
-                        installed_count = c.fetchone()[0]
-                    
                     if installed_count == (1 if new_status else 0):
-                        self.update_checker.schedule_user_check(user_id)
+                        await self.update_checker.schedule_user_check(user_id)
+                    elif new_status:
+                        # App recém-inscrito: grava o build de referência antes do próximo update
+                        await self.update_checker.baseline_apps(user_id, [game_id])
+                else:
+                    await query.edit_message_text(self.get_text(context, 'game_not_found'))
+            
+            elif data.startswith("games_"):
+                page = int(data.split("_")[1])
+                text, reply_markup = await self.games_page(user_id, page, context)
+                if reply_markup:
+                    await query.edit_message_text(text, reply_markup=reply_markup)
                 else:
-                    await query.edit_message_text(self.get_text(update, 'game_not_found'))
+                    await query.edit_message_text(self.get_text(context, 'no_games_found'))
             
             elif data == "confirm_delete":
-                try:
-                    with closing(self.db.conn.cursor()) as c:
-                        # Remove todos os dados do usuário
-                        c.execute('DELETE FROM users WHERE telegram_id = ?', (user_id,))
-                        c.execute('DELETE FROM games WHERE telegram_id = ?', (user_id,))
-                        c.execute('DELETE FROM updates WHERE telegram_id = ?', (user_id,))
-                        c.execute('DELETE FROM stats WHERE telegram_id = ?', (user_id,))
-                        self.db.conn.commit()
-                    
-                    # Cancela verificações agendadas
-                    self.update_checker.unschedule_user_check(user_id)
-                    
-                    await query.edit_message_text(
-                        "🗑️ Todos os seus dados foram excluídos com sucesso.\n\n"
-                        "Se quiser usar o bot novamente, digite /start"
-                    )
-                except Exception as e:
-                    logger.error(f"Error deleting account {user_id}: {e}")
-                    await query.edit_message_text("❌ Ocorreu um erro ao excluir seus dados. Por favor, tente novamente.")
+                if await self.db.delete_user(user_id):
+                    await query.edit_message_text(self.get_text(context, 'delete_success'))
+                else:
+                    logger.error(f"Error deleting account {user_id}")
+                    await query.edit_message_text(self.get_text(context, 'delete_error'))
 
             elif data == "cancel_delete":
-                await query.edit_message_text("✅ Operação cancelada. Seus dados não foram alterados.")
+                await query.edit_message_text(self.get_text(context, 'delete_canceled'))
             
             # Adicione estas condições para lidar com os botões de configuração
             elif data == "setting_interval":
                 keyboard = [
-                    [InlineKeyboardButton("1 hora", callback_data="interval_1")],
-                    [InlineKeyboardButton("3 horas", callback_data="interval_3")],
-                    [InlineKeyboardButton("6 horas", callback_data="interval_6")],
-                    [InlineKeyboardButton("12 horas", callback_data="interval_12")],
-                    [InlineKeyboardButton("24 horas", callback_data="interval_24")]
+                    [InlineKeyboardButton(
+                        self.get_text(context, 'interval_option_one') if hours == 1
+                        else self.format_text(context, 'interval_option', hours=hours),
+                        callback_data=f"interval_{hours}"
+                    )]
+                    for hours in (1, 3, 6, 12, 24)
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 await query.edit_message_text(
-                    self.get_text(update, 'select_interval'),
+                    self.get_text(context, 'select_interval'),
                     reply_markup=reply_markup
                 )
             
             elif data.startswith("interval_"):
                 interval = int(data.split("_")[1])
-                self.db.update_user_setting(user_id, 'check_interval', interval)
-                self.update_checker.schedule_user_check(user_id)
+                await self.db.update_user_setting(user_id, 'check_interval', interval)
+                await self.update_checker.schedule_user_check(user_id)
                 await query.edit_message_text(
-                    self.get_text(update, 'interval_set').format(interval=interval)
+                    self.format_text(context, 'interval_set', interval=interval)
                 )
             
             elif data == "setting_silent":
-                user = self.db.get_user(user_id)
+                user = await self.db.get_user(user_id)
                 new_status = not user[4]
-                self.db.update_user_setting(user_id, 'silent_mode', new_status)
+                await self.db.update_user_setting(user_id, 'silent_mode', new_status)
                 
-                status_msg = self.get_text(update, 'silent_mode_on') if new_status else self.get_text(update, 'silent_mode_off')
+                status_msg = self.get_text(context, 'silent_mode_on') if new_status else self.get_text(context, 'silent_mode_off')
+                await query.edit_message_text(status_msg)
+            
+            elif data == "setting_digest":
+                user = await self.db.get_user(user_id)
+                new_status = not user[7]
+                await self.db.update_user_setting(user_id, 'digest_mode', new_status)
+                
+                if new_status:
+                    status_msg = self.format_text(context, 'digest_mode_on', window=Config.DIGEST_WINDOW_MINUTES)
+                else:
+                    status_msg = self.get_text(context, 'digest_mode_off')
                 await query.edit_message_text(status_msg)
             
             elif data == "setting_language":
@@ -383,38 +439,105 @@ class SteamUpdateBot:
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 await query.edit_message_text(
-                    self.get_text(update, 'select_language'),
+                    self.get_text(context, 'select_language'),
                     reply_markup=reply_markup
                 )
             
             elif data.startswith("lang_"):
                 lang = data.split("_")[1]
-                self.db.update_user_setting(user_id, 'language', lang)
-                await query.edit_message_text(self.get_text(update, 'language_changed'))
+                await self.db.update_user_setting(user_id, 'language', lang)
+                context.language = lang
+                await query.edit_message_text(self.get_text(context, 'language_changed'))
         
         except Exception as e:
             logger.error(f"Error in button_callback: {e}")
-            await query.edit_message_text(self.get_text(update, 'unexpected_error'))
+            await query.edit_message_text(self.get_text(context, 'unexpected_error'))
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        await update.message.reply_text(self.get_text(update, 'unrecognized_command'))
+        await update.message.reply_text(self.get_text(context, 'unrecognized_command'))
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error while handling update {update}: {context.error}")
         
-        if update and update.effective_user:
+        if isinstance(update, Update) and update.effective_user:
             try:
+                await self.resolve_language(update, context)
                 await update.effective_user.send_message(
-                    self.get_text(update, 'unexpected_error_occurred')
+                    self.get_text(context, 'unexpected_error_occurred')
                 )
             except:
                 pass
 
-    def run(self):
+    async def post_init(self, application: Application):
+        # O scheduler assíncrono precisa do event loop da Application já em execução
+        self.notifier.start()
         self.update_checker.start()
-        self.application.run_polling()
-        self.update_checker.stop()
-        self.db.close()
+        if Config.METRICS_PORT is not None:
+            metrics.add_collector(self.steam_api.collect_metrics)
+            self.metrics_server = MetricsServer(Config.METRICS_LISTEN, Config.METRICS_PORT,
+                                                Config.METRICS_PROFILER, Config.PROFILE_MAX_SECONDS)
+            self.metrics_server.start()
+
+    async def post_stop(self, application: Application):
+        # Antes do shutdown da Application, enquanto o cliente HTTP do bot ainda está aberto:
+        # drena primeiro os jobs (que ainda podem enfileirar notificações) e depois o outbox
+        await self.update_checker.drain(Config.SHUTDOWN_DRAIN_SECONDS)
+        await self.notifier.stop(drain_timeout=Config.SHUTDOWN_DRAIN_SECONDS)
+
+    async def post_shutdown(self, application: Application):
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.steam_api.close()
+        await self.db.close()
+
+    async def serve_webhook(self, register=True, stop_event=None):
+        """Modo webhook: recebe os updates pelo servidor embutido até SIGINT/SIGTERM
+        (ou stop_event) e desliga drenando as filas.
+
+        Com register=False o webhook não é registrado no Telegram, o que permite
+        subir o servidor localmente e enviar updates sintéticos por POST. Com
+        WEBHOOK_PORT=0 a porta escolhida fica em self.webhook_server.port.
+        """
+        secret_token = Config.WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        server = WebhookServer(self.application, Config.WEBHOOK_LISTEN, Config.WEBHOOK_PORT,
+                               Config.WEBHOOK_PATH, secret_token)
+        stop_event = stop_event or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        # Fora do run_polling/run_webhook os hooks post_init/post_stop/post_shutdown são chamados aqui
+        await self.application.initialize()
+        try:
+            await self.post_init(self.application)
+            await self.application.start()
+            server.start()
+            self.webhook_server = server
+            if register:
+                await self.application.bot.set_webhook(
+                    url=Config.WEBHOOK_URL,
+                    secret_token=secret_token,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=Config.WEBHOOK_MAX_CONNECTIONS
+                )
+                logger.info(f"Webhook registered at {Config.WEBHOOK_URL}")
+            await stop_event.wait()
+        finally:
+            # O webhook continua registrado: o Telegram guarda os updates até o próximo início
+            await server.stop()
+            if self.application.running:
+                await self.application.stop()  # processa os updates já recebidos
+            await self.post_stop(self.application)
+            await self.post_shutdown(self.application)
+            await self.application.shutdown()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+    def run(self):
+        if Config.WEBHOOK_URL:
+            asyncio.run(self.serve_webhook())
+        else:
+            self.application.run_polling()
 
 if __name__ == '__main__':
     bot = SteamUpdateBot(Config.TELEGRAM_TOKEN)
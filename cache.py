@@ -0,0 +1,164 @@
+import asyncio
+import sqlite3
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from urllib.parse import urlencode
+from config import Config
+from logger import logger
+
+def make_cache_key(endpoint, params=None, exclude=('key',)):
+    """Chave canônica: nome do endpoint + parâmetros ordenados, sem a API key"""
+    items = sorted(
+        (str(k), str(v)) for k, v in (params or {}).items() if k not in exclude
+    )
+    return f"{endpoint}?{urlencode(items)}"
+
+class ResponseCache:
+    """LRU limitado por tamanho com TTL por entrada e camada opcional em SQLite.
+
+    A camada em disco roda em uma thread própria, fora do event loop: leituras
+    são aguardadas e escritas seguem em segundo plano (write-behind). A cada
+    prune_seconds a mesma thread apaga as entradas vencidas e corta a tabela
+    nas max_disk_entries que vencem por último.
+    """
+
+    def __init__(self, max_entries, db_path=None, max_disk_entries=Config.CACHE_DISK_MAX_ENTRIES,
+                 prune_seconds=Config.CACHE_DISK_PRUNE_SECONDS):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.prune_seconds = prune_seconds
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_hits = 0
+        self.conn = None
+        self._disk = None
+        self._next_prune = 0
+        if db_path:
+            self._init_disk(db_path)
+
+    def _init_disk(self, db_path):
+        try:
+            # A conexão só é usada pela thread da camada em disco
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            with closing(self.conn.cursor()) as c:
+                # Cache descartável: durabilidade não importa, velocidade sim
+                c.execute('PRAGMA journal_mode = WAL')
+                c.execute('PRAGMA synchronous = OFF')
+                c.execute('''CREATE TABLE IF NOT EXISTS http_cache
+                             (key TEXT PRIMARY KEY,
+                              value TEXT,
+                              expires_at REAL)''')
+                c.execute('''CREATE INDEX IF NOT EXISTS idx_http_cache_expires
+                             ON http_cache(expires_at)''')
+                self.conn.commit()
+            self._prune()
+        except sqlite3.Error as e:
+            logger.error(f"Cache disk tier disabled: {e}")
+            self.conn = None
+            return
+        self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-disk')
+
+    async def get(self, key):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+
+        if self._disk is not None:
+            entry = await asyncio.get_running_loop().run_in_executor(self._disk, self._get_disk, key, now)
+            if entry is not None:
+                value, expires_at = entry
+                self._put_memory(key, value, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self._put_memory(key, value, expires_at)
+        if self._disk is not None:
+            # Write-behind: o chamador não espera o disco
+            self._disk.submit(self._set_disk, key, value, expires_at)
+
+    def _put_memory(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_disk(self, key, now):
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''SELECT value, expires_at FROM http_cache
+                            WHERE key = ? AND expires_at > ?''', (key, now))
+                row = c.fetchone()
+            return (json.loads(row[0]), row[1]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Cache disk read failed: {e}")
+            return None
+
+    def _set_disk(self, key, value, expires_at):
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''INSERT OR REPLACE INTO http_cache (key, value, expires_at)
+                            VALUES (?, ?, ?)''', (key, json.dumps(value), expires_at))
+                self.conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Cache disk write failed: {e}")
+        if time.time() >= self._next_prune:
+            self._prune()
+
+    def _prune(self):
+        """Apaga as entradas vencidas e as que passam de max_disk_entries"""
+        self._next_prune = time.time() + self.prune_seconds
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('DELETE FROM http_cache WHERE expires_at <= ?', (time.time(),))
+                removed = c.rowcount
+                # Mantém as max_disk_entries que vencem por último
+                c.execute('''DELETE FROM http_cache WHERE expires_at <= (
+                                SELECT expires_at FROM http_cache
+                                ORDER BY expires_at DESC LIMIT 1 OFFSET ?)''', (self.max_disk_entries,))
+                removed += c.rowcount
+                self.conn.commit()
+            if removed:
+                logger.info(f"Pruned {removed} cache disk entries")
+        except sqlite3.Error as e:
+            logger.error(f"Cache disk prune failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+    async def close(self):
+        if self._disk is not None:
+            # Fecha na thread do disco, depois das escritas ainda na fila
+            await asyncio.get_running_loop().run_in_executor(self._disk, self.conn.close)
+            self._disk.shutdown(wait=False)
+            self._disk = None
+            self.conn = None
@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from steam_api import ChangeBatch
+
+class ChangelistFeed(ABC):
+    """Fonte de "apps alterados desde o change number N" usada pelo UpdateChecker"""
+
+    @abstractmethod
+    async def changes_since(self, change_number):
+        """Retorna um ChangeBatch (ou None em caso de falha)"""
+
+class SteamChangelistFeed(ChangelistFeed):
+    """Feed real: o endpoint CHANGELIST_URL consultado pelo SteamAPI"""
+
+    def __init__(self, steam_api):
+        self.steam_api = steam_api
+
+    async def changes_since(self, change_number):
+        return await self.steam_api.get_changes_since(change_number)
+
+class FakeChangelistFeed(ChangelistFeed):
+    """Feed local em memória para testes e benchmarks offline.
+
+    publish() cria um change number novo; changes_since() devolve no máximo
+    batch_size change numbers por chamada, como um upstream paginado. Pedidos
+    anteriores a oldest (histórico descartado) ou a partir de 0 voltam com
+    full_update, como o PICS.
+    """
+
+    def __init__(self, start=1, batch_size=1000):
+        self.batch_size = batch_size
+        self.oldest = start
+        self.current = start
+        self._numbers = []
+        self._apps = []
+        self.requests = 0
+
+    def publish(self, *app_ids):
+        self.current += 1
+        self._numbers.append(self.current)
+        self._apps.append(app_ids)
+        return self.current
+
+    def forget_before(self, change_number):
+        """Descarta o histórico anterior a change_number"""
+        index = bisect_right(self._numbers, change_number)
+        del self._numbers[:index], self._apps[:index]
+        self.oldest = max(self.oldest, change_number)
+
+    async def changes_since(self, change_number):
+        self.requests += 1
+        if change_number == 0 or change_number < self.oldest:
+            return ChangeBatch(current=self.current, app_ids=(), full_update=True)
+
+        start = bisect_right(self._numbers, change_number)
+        end = start + self.batch_size
+        if start == len(self._numbers):
+            return ChangeBatch(current=max(change_number, self.current), app_ids=())
+        app_ids = {app_id for apps in self._apps[start:end] for app_id in apps}
+        return ChangeBatch(current=self._numbers[min(end, len(self._numbers)) - 1], app_ids=tuple(sorted(app_ids)))
@@ -10,23 +10,130 @@ class Config:
     TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
     if not TELEGRAM_TOKEN:
         raise ValueError("TELEGRAM_TOKEN não definido. Configure no arquivo .env ou como variável de ambiente.")
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')  # + token; sobrescrevível para testes
+    # Webhook: com WEBHOOK_URL definido o bot recebe updates por um servidor HTTP embutido em vez de run_polling
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # URL pública, ex.: https://bot.example.com/telegram
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')  # gerado a cada início se ausente
+    WEBHOOK_MAX_CONNECTIONS = 40  # conexões simultâneas que o Telegram abre para o webhook
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))  # updates processados em paralelo
+    SHUTDOWN_DRAIN_SECONDS = 10  # espera pelos jobs e pelo outbox ao desligar
 
     # Steam
     STEAM_API_KEY = os.getenv('STEAM_API_KEY')
     if not STEAM_API_KEY:
         raise ValueError("STEAM_API_KEY não definido. Configure no arquivo .env ou como variável de ambiente.")
     
+    # Endpoints (sobrescrevíveis para apontar a servidores locais de teste)
+    STEAM_API_URL = os.getenv('STEAM_API_URL', 'https://api.steampowered.com')
+    STEAM_STORE_URL = os.getenv('STEAM_STORE_URL', 'https://store.steampowered.com')
+    STEAMDB_API_URL = os.getenv('STEAMDB_API_URL', 'https://steamdb.info/api')
+    
+    # HTTP
+    HTTP_TIMEOUT = 10  # seconds
+    HTTP_CONNECT_TIMEOUT = 5
+    HTTP_MAX_CONNECTIONS = 20  # pool total, reaproveitado via keep-alive
+    HTTP_MAX_CONNECTIONS_PER_HOST = 5
+    HTTP_MAX_CONCURRENCY = 10  # requisições simultâneas em voo
+    HTTP_MAX_RETRIES = 2  # novas tentativas após 5xx/erro de rede, com backoff e jitter
+    HTTP_BACKOFF_BASE = 1  # seconds, dobra a cada tentativa
+    HTTP_BACKOFF_MAX = 30
+    # Token bucket por host: (requisições por segundo, rajada); com CHECK_SHARDS o orçamento
+    # é dividido entre os workers vivos, então vale para o conjunto dos processos
+    HOST_RATE_LIMITS = {
+        'api.steampowered.com': (4, 10),  # ~100k chamadas/dia por chave
+        'store.steampowered.com': (0.6, 5),  # appdetails aceita ~200 chamadas a cada 5 minutos
+        'steamdb.info': (1, 5)
+    }
+    HOST_RATE_DEFAULT = (10, 20)  # demais hosts (feed de changelists, servidores locais)
+    # Circuit breaker por host: abre após falhas seguidas ou com Retry-After
+    BREAKER_FAILURE_THRESHOLD = 5
+    BREAKER_RESET_SECONDS = 30  # dobra a cada reabertura
+    BREAKER_MAX_SECONDS = 900
+    
     # Database
-    DATABASE_NAME = 'steam_bot.db'
+    DATABASE_NAME = os.getenv('DATABASE_NAME', 'steam_bot.db')
+    DB_READ_POOL_SIZE = 4  # threads de leitura, cada uma com sua conexão
+    DB_BUSY_TIMEOUT = 5  # seconds
+    DB_CACHE_SIZE_KB = 16384
+    USER_CACHE_SIZE = 50000  # perfis de usuário mantidos em memória
     
     # Update settings
     DEFAULT_CHECK_INTERVAL = 6  # hours
     MAX_CHECK_INTERVAL = 24
     MIN_CHECK_INTERVAL = 1
+    POLL_TICK_MINUTES = 5  # frequência do ciclo global que procura apps pendentes
+    CHECK_BATCH_SIZE = 50  # apps consultados em paralelo por lote
+    MAX_USERS_PER_TICK = 2000  # limita o tick após um reinício longo; o restante fica para os próximos
+    # Polling adaptativo: apps que atualizam com frequência são consultados antes do intervalo do usuário
+    APP_POLL_HISTORY_DAYS = 90  # janela do histórico de updates usada na cadência
+    APP_POLL_GAP_FRACTION = 0.25  # consultas por intervalo médio entre builds = 1 / fração
+    MAX_APP_POLLS_PER_TICK = 1000
+    # Modo changelist: com CHANGELIST_URL definido, só apps alterados no feed são consultados
+    CHANGELIST_URL = os.getenv('CHANGELIST_URL')
+    CHANGELIST_POLL_SECONDS = 60
+    CHANGELIST_MAX_BATCHES = 20  # lotes do feed consumidos por ciclo
+    # Ressincronização da biblioteca (GetOwnedGames) em segundo plano
+    LIBRARY_SYNC_HOURS = 24  # idade máxima da biblioteca de cada usuário
+    LIBRARY_SYNC_MINUTES = 30  # frequência do job
+    LIBRARY_SYNC_BATCH = 200  # usuários por execução
+    # Verificação em vários processos: com CHECK_SHARDS > 0 os appids são divididos em shards
+    # repartidos (leases no banco) entre o bot e os processos extras `python worker.py`
+    CHECK_SHARDS = int(os.getenv('CHECK_SHARDS', '0'))  # bem mais shards que workers equilibra a divisão, ex.: 256
+    WORKER_ID = os.getenv('WORKER_ID')  # padrão: host:pid
+    SHARD_TICK_SECONDS = 30  # cada worker renova os leases e esvazia a fila dos seus shards
+    SHARD_LEASE_SECONDS = 120  # sem renovação nesse prazo o worker é dado como morto e perde os shards
+    
+    # Manutenção do banco (retenção do histórico e compactação)
+    UPDATES_RETENTION_DAYS = 180  # o histórico mais antigo vira totais mensais; nunca menos que APP_POLL_HISTORY_DAYS
+    MAINTENANCE_HOURS = 24  # frequência do job
+    MAINTENANCE_BATCH = 5000  # linhas de updates resumidas por transação
+    VACUUM_PAGES_PER_RUN = 10000  # páginas livres devolvidas ao sistema por execução
+    
+    # /games
+    GAMES_PAGE_SIZE = 10
+    
+    # Notificações (limites do Telegram: ~30 msg/s no total, ~1 msg/s por chat)
+    NOTIFY_GLOBAL_RATE = 25
+    NOTIFY_CHAT_RATE = 1
+    NOTIFY_MAX_ATTEMPTS = 5
+    NOTIFY_BACKOFF_BASE = 30  # seconds, dobra a cada tentativa
+    NOTIFY_BACKOFF_MAX = 3600
+    OUTBOX_BATCH_SIZE = 500
+    # Mensagens avulsas por chat em cada lote: a 1 msg/s, um chat com fila longa não segura o lote
+    OUTBOX_ROWS_PER_CHAT = 5
+    OUTBOX_POLL_SECONDS = 5
+    DIGEST_WINDOW_MINUTES = 30  # janela em que as atualizações de um usuário são agrupadas
+    TELEGRAM_MESSAGE_LIMIT = 4096
     
     # Cache
-    CACHE_EXPIRATION = 3600  # 1 hour in seconds
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_DB_PATH = os.getenv('CACHE_DB_PATH')  # camada em disco opcional (SQLite)
+    CACHE_DISK_MAX_ENTRIES = 100000  # a tabela em disco é cortada nas que vencem por último
+    CACHE_DISK_PRUNE_SECONDS = 600
+    CACHE_TTLS = {  # seconds; endpoints ausentes não são cacheados
+        'vanity': 7 * 24 * 3600,  # vanity URL -> SteamID quase nunca muda
+        'owned_games': 15 * 60,
+        'app_details': 24 * 3600
+    }
+    
+    # Métricas: endpoint local de scrape (formato Prometheus), desligado sem METRICS_PORT
+    METRICS_PORT = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+    METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    METRICS_PROFILER = os.getenv('METRICS_PROFILER', '').lower() in ('1', 'true', 'yes')  # /debug/profile e /debug/sample
+    PROFILE_MAX_SECONDS = 120
     
     # Logging
     LOG_LEVEL = 'INFO'
-    LOG_FILE = 'steam_bot.log'
+    LOG_FILE = 'steam_bot.log'  # uma linha JSON por registro
+    LOG_MAX_BYTES = 10 * 1024 * 1024  # rotação por tamanho
+    LOG_BACKUP_COUNT = 5
+    # Linhas de alto volume (extra={'sample': chave}): só 1 a cada N é gravada
+    LOG_SAMPLE_EVERY = {
+        'app_update': 10,  # build novo de um app (contagem exata em steambot_checker_updates_found_total)
+        'library_resync': 50,
+        'notification': 20,  # chat que bloqueou o bot
+        'steam_client_error': 50  # 4xx da Steam/SteamDB (app inexistente, perfil privado)
+    }
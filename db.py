@@ -1,14 +1,222 @@
 import sqlite3
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
 from datetime import datetime
 import json
 from config import Config
 from logger import logger
+from metrics import metrics
+
+# Migrações versionadas via PRAGMA user_version: (versão, descrição, statements).
+# Nunca edite uma migração já publicada; acrescente uma nova no fim da lista.
+MIGRATIONS = [
+    (1, 'indexes for installed games, app fan-out and update history', [
+        # get_installed_games / contagem de instalados por usuário (parcial e cobrindo)
+        '''CREATE INDEX IF NOT EXISTS idx_games_user_installed
+           ON games(telegram_id, last_played DESC, game_id, name, last_buildid, installed)
+           WHERE installed = TRUE''',
+        # Índice invertido app -> inscritos usado pelo fan-out
+        '''CREATE INDEX IF NOT EXISTS idx_games_app_installed
+           ON games(game_id, telegram_id, name, last_buildid, last_checked, installed)
+           WHERE installed = TRUE''',
+        # Atualizações recentes por jogo em get_user_stats
+        '''CREATE INDEX IF NOT EXISTS idx_updates_user_game
+           ON updates(telegram_id, game_name, update_time)''',
+        'ANALYZE'
+    ]),
+    (2, 'persisted, bucketed next_check_at per user', [
+        'ALTER TABLE users ADD COLUMN next_check_at TIMESTAMP',
+        # Espalha os usuários existentes pelo intervalo em vez de todos de uma vez
+        '''UPDATE users SET next_check_at = datetime('now',
+               '+' || (abs(telegram_id) % (COALESCE(check_interval, 6) * 60)) || ' minutes')
+           WHERE steam_id IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_users_next_check
+           ON users(next_check_at) WHERE steam_id IS NOT NULL'''
+    ]),
+    (3, 'notification outbox', [
+        '''CREATE TABLE IF NOT EXISTS outbox
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            update_id INTEGER,
+            telegram_id INTEGER,
+            message TEXT,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(update_id) REFERENCES updates(id))''',
+        '''CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt
+           ON outbox(next_attempt_at, id)'''
+    ]),
+    (4, 'per-user notification digests', [
+        'ALTER TABLE users ADD COLUMN digest_mode BOOLEAN DEFAULT FALSE',
+        'ALTER TABLE outbox ADD COLUMN digest BOOLEAN DEFAULT FALSE',
+        # Janela de resumo pendente por usuário
+        '''CREATE INDEX IF NOT EXISTS idx_outbox_digest_window
+           ON outbox(telegram_id, next_attempt_at) WHERE digest = TRUE AND attempts = 0'''
+    ]),
+    (5, 'library pages ordered by playtime', [
+        '''CREATE INDEX IF NOT EXISTS idx_games_user_playtime
+           ON games(telegram_id, last_played DESC, game_id, name, installed)'''
+    ]),
+    (6, 'adaptive per-app polling', [
+        # Só apps com intervalo adaptativo menor que o do usuário ficam aqui
+        '''CREATE TABLE IF NOT EXISTS app_polls
+           (game_id INTEGER PRIMARY KEY,
+            poll_interval INTEGER,
+            next_poll_at TIMESTAMP)''',
+        '''CREATE INDEX IF NOT EXISTS idx_app_polls_next
+           ON app_polls(next_poll_at)''',
+        # Histórico de builds por app para o cálculo da cadência
+        '''CREATE INDEX IF NOT EXISTS idx_updates_game_time
+           ON updates(game_id, update_time, build_id)'''
+    ]),
+    (7, 'persisted checker state (last changelist change number)', [
+        '''CREATE TABLE IF NOT EXISTS checker_state
+           (key TEXT PRIMARY KEY,
+            value TEXT)'''
+    ]),
+    (8, 'shared app catalog', [
+        # Nome, build e última verificação passam a existir uma vez por app
+        '''CREATE TABLE IF NOT EXISTS apps
+           (appid INTEGER PRIMARY KEY,
+            name TEXT,
+            last_buildid TEXT,
+            last_checked TIMESTAMP,
+            metadata TEXT,
+            refreshed_at TIMESTAMP)''',
+        '''INSERT OR IGNORE INTO apps (appid, name, last_buildid, last_checked)
+           SELECT g.game_id, MAX(g.name),
+               (SELECT latest.last_buildid FROM games latest
+                WHERE latest.game_id = g.game_id AND latest.last_buildid IS NOT NULL
+                ORDER BY latest.last_checked DESC LIMIT 1),
+               MAX(g.last_checked)
+           FROM games g GROUP BY g.game_id''',
+        '''INSERT OR IGNORE INTO apps (appid, name)
+           SELECT game_id, MAX(game_name) FROM updates GROUP BY game_id''',
+        # Índices que citam as colunas removidas são recriados sem elas
+        'DROP INDEX IF EXISTS idx_games_user_installed',
+        'DROP INDEX IF EXISTS idx_games_app_installed',
+        'DROP INDEX IF EXISTS idx_games_user_playtime',
+        'DROP INDEX IF EXISTS idx_updates_user_game',
+        'ALTER TABLE games DROP COLUMN name',
+        'ALTER TABLE games DROP COLUMN last_buildid',
+        'ALTER TABLE games DROP COLUMN last_checked',
+        'ALTER TABLE updates DROP COLUMN game_name',
+        '''CREATE INDEX IF NOT EXISTS idx_games_user_installed
+           ON games(telegram_id, last_played DESC, game_id, installed)
+           WHERE installed = TRUE''',
+        '''CREATE INDEX IF NOT EXISTS idx_games_app_installed
+           ON games(game_id, telegram_id, installed)
+           WHERE installed = TRUE''',
+        '''CREATE INDEX IF NOT EXISTS idx_games_user_playtime
+           ON games(telegram_id, last_played DESC, game_id, installed)''',
+        '''CREATE INDEX IF NOT EXISTS idx_updates_user_game
+           ON updates(telegram_id, game_id, update_time)''',
+        'ANALYZE'
+    ]),
+    (9, 'incremental library resync', [
+        # Hash da última resposta do GetOwnedGames e quando a biblioteca foi sincronizada
+        '''CREATE TABLE IF NOT EXISTS library_sync
+           (telegram_id INTEGER PRIMARY KEY,
+            response_hash TEXT,
+            synced_at TIMESTAMP)''',
+        '''INSERT OR IGNORE INTO library_sync (telegram_id, synced_at)
+           SELECT telegram_id, '1970-01-01 00:00:00' FROM users WHERE steam_id IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_library_sync_due
+           ON library_sync(synced_at)'''
+    ]),
+    (10, 'sharded update checks across worker processes', [
+        # Heartbeat dos workers e dono de cada shard (o shard -1 é o agendador); epoch em segundos
+        '''CREATE TABLE IF NOT EXISTS check_workers
+           (worker_id TEXT PRIMARY KEY,
+            expires_at REAL)''',
+        '''CREATE TABLE IF NOT EXISTS shard_leases
+           (shard INTEGER PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL)''',
+        # Apps aguardando a verificação pelo dono do shard
+        '''CREATE TABLE IF NOT EXISTS check_queue
+           (appid INTEGER PRIMARY KEY,
+            shard INTEGER,
+            queued_at REAL)''',
+        '''CREATE INDEX IF NOT EXISTS idx_check_queue_shard
+           ON check_queue(shard, queued_at)'''
+    ]),
+    (11, 'monthly update rollups and last update per game for /stats', [
+        # Histórico além da retenção, resumido por usuário e mês
+        '''CREATE TABLE IF NOT EXISTS update_rollups
+           (telegram_id INTEGER,
+            month TEXT,
+            updates INTEGER,
+            last_update TIMESTAMP,
+            PRIMARY KEY (telegram_id, month))''',
+        # Última atualização de cada jogo do usuário: o /stats lê 5 linhas do índice
+        '''CREATE TABLE IF NOT EXISTS last_updates
+           (telegram_id INTEGER,
+            game_id INTEGER,
+            update_time TIMESTAMP,
+            PRIMARY KEY (telegram_id, game_id))''',
+        '''INSERT OR IGNORE INTO last_updates (telegram_id, game_id, update_time)
+           SELECT telegram_id, game_id, MAX(update_time) FROM updates GROUP BY telegram_id, game_id''',
+        '''CREATE INDEX IF NOT EXISTS idx_last_updates_user_time
+           ON last_updates(telegram_id, update_time)'''
+    ]),
+    (12, 'check queue shard computed on read', [
+        # O shard gravado no enfileiramento ficava órfão quando CHECK_SHARDS mudava
+        'DROP INDEX IF EXISTS idx_check_queue_shard',
+        'ALTER TABLE check_queue DROP COLUMN shard',
+        '''CREATE INDEX IF NOT EXISTS idx_check_queue_time
+           ON check_queue(queued_at)'''
+    ]),
+]
+
+UPSERT_LAST_UPDATE = '''INSERT INTO last_updates (telegram_id, game_id, update_time)
+                        VALUES (?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(telegram_id, game_id) DO UPDATE SET
+                            update_time = excluded.update_time'''
 
 class Database:
     def __init__(self, db_name=Config.DATABASE_NAME):
-        self.conn = sqlite3.connect(db_name)
+        self.db_name = db_name
+        self._memory = db_name == ':memory:'
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        # Cache de perfis (linhas de users) com limite LRU; None também é cacheado
+        self._user_cache = OrderedDict()
+        self._user_cache_lock = threading.Lock()
+        self._user_cache_generation = 0
+        # Conexão de escrita; o AsyncDatabase garante que só uma thread escreve
+        self.conn = self._connect()
         self._init_db()
+    
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.db_name, timeout=Config.DB_BUSY_TIMEOUT, check_same_thread=False)
+        with closing(conn.cursor()) as c:
+            if not self._memory:
+                c.execute('PRAGMA journal_mode = WAL')
+            c.execute('PRAGMA synchronous = NORMAL')
+            c.execute(f'PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT * 1000)}')
+            c.execute(f'PRAGMA cache_size = -{Config.DB_CACHE_SIZE_KB}')
+            c.execute('PRAGMA temp_store = MEMORY')
+            if read_only:
+                c.execute('PRAGMA query_only = ON')
+        conn.set_trace_callback(metrics.count_query)
+        return conn
+    
+    def _read_conn(self):
+        """Conexão de leitura da thread atual; em WAL leituras não esperam o writer"""
+        if self._memory:
+            return self.conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(read_only=True)
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
         
     def _init_db(self):
         with closing(self.conn.cursor()) as c:
@@ -54,6 +262,51 @@ class Database:
                           FOREIGN KEY(telegram_id) REFERENCES users(telegram_id))''')
             
             self.conn.commit()
+        self._migrate()
+    
+    def _migrate(self):
+        with closing(self.conn.cursor()) as c:
+            c.execute('PRAGMA user_version')
+            current = c.fetchone()[0]
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                try:
+                    c.execute('BEGIN')
+                    for statement in statements:
+                        c.execute(statement)
+                    c.execute(f'PRAGMA user_version = {version}')
+                    self.conn.commit()
+                    logger.info(f"Applied database migration {version}: {description}")
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    logger.error(f"Database migration {version} failed: {e}")
+                    raise
+    
+    # User cache
+    def cached_user(self, telegram_id):
+        """Retorna (encontrado, linha) sem tocar no SQLite"""
+        with self._user_cache_lock:
+            if telegram_id in self._user_cache:
+                self._user_cache.move_to_end(telegram_id)
+                return True, self._user_cache[telegram_id]
+        return False, None
+    
+    def _cache_user(self, telegram_id, row, generation):
+        with self._user_cache_lock:
+            # Uma escrita concorrente invalidou o cache depois do SELECT: não guarda linha velha
+            if generation != self._user_cache_generation:
+                return
+            self._user_cache[telegram_id] = row
+            self._user_cache.move_to_end(telegram_id)
+            while len(self._user_cache) > Config.USER_CACHE_SIZE:
+                self._user_cache.popitem(last=False)
+    
+    def _invalidate_users(self, *telegram_ids):
+        with self._user_cache_lock:
+            self._user_cache_generation += 1
+            for telegram_id in telegram_ids:
+                self._user_cache.pop(telegram_id, None)
     
     # User methods
     def add_user(self, telegram_id, steam_id=None):
@@ -62,6 +315,8 @@ class Database:
                 c.execute('''INSERT OR IGNORE INTO users (telegram_id, steam_id) 
                             VALUES (?, ?)''', (telegram_id, steam_id))
                 self.conn.commit()
+                if c.rowcount:
+                    self._invalidate_users(telegram_id)
             return True
         except sqlite3.Error as e:
             logger.error(f"Database error adding user: {e}")
@@ -73,16 +328,23 @@ class Database:
                 c.execute('''UPDATE users SET steam_id = ? 
                             WHERE telegram_id = ?''', (steam_id, telegram_id))
                 self.conn.commit()
+            self._invalidate_users(telegram_id)
             return True
         except sqlite3.Error as e:
             logger.error(f"Database error updating Steam ID: {e}")
             return False
     
     def get_user(self, telegram_id):
+        found, user = self.cached_user(telegram_id)
+        if found:
+            return user
+        generation = self._user_cache_generation
         try:
-            with closing(self.conn.cursor()) as c:
+            with closing(self._read_conn().cursor()) as c:
                 c.execute('''SELECT * FROM users WHERE telegram_id = ?''', (telegram_id,))
-                return c.fetchone()
+                user = c.fetchone()
+            self._cache_user(telegram_id, user, generation)
+            return user
         except sqlite3.Error as e:
             logger.error(f"Database error getting user: {e}")
             return None
@@ -93,76 +355,657 @@ class Database:
                 c.execute(f'''UPDATE users SET {setting} = ? 
                             WHERE telegram_id = ?''', (value, telegram_id))
                 self.conn.commit()
+            self._invalidate_users(telegram_id)
             return True
         except sqlite3.Error as e:
             logger.error(f"Database error updating user setting: {e}")
             return False
     
+    def delete_user(self, telegram_id):
+        """Remove todos os dados do usuário em uma única transação"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('DELETE FROM users WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM games WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM updates WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM stats WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM outbox WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM library_sync WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM last_updates WHERE telegram_id = ?', (telegram_id,))
+                c.execute('DELETE FROM update_rollups WHERE telegram_id = ?', (telegram_id,))
+                self.conn.commit()
+            self._invalidate_users(telegram_id)
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error deleting user: {e}")
+            return False
+    
     # Game methods
-    def add_or_update_game(self, telegram_id, game_id, name, installed=False, last_played=0):
+    def _upsert_apps(self, c, apps):
+        """Garante as linhas (appid, name) no catálogo compartilhado"""
+        c.executemany('''INSERT INTO apps (appid, name) VALUES (?, ?)
+                        ON CONFLICT(appid) DO UPDATE SET name = excluded.name
+                        WHERE apps.name IS NOT excluded.name''', apps)
+    
+    def sync_library(self, telegram_id, games, response_hash):
+        """Aplica a resposta do GetOwnedGames como diff contra as linhas de games.
+
+        Insere só compras novas, atualiza só tempos de jogo alterados e remove
+        jogos que saíram da biblioteca, tudo em uma transação; grava o hash da
+        resposta. Retorna (inseridos, atualizados, removidos) ou None em erro.
+        """
+        owned = {game['appid']: game for game in games}
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''SELECT game_id, last_played FROM games
+                            WHERE telegram_id = ?''', (telegram_id,))
+                stored = dict(c.fetchall())
+
+                added = [appid for appid in owned if appid not in stored]
+                changed = [
+                    (owned[appid].get('playtime_forever', 0), telegram_id, appid)
+                    for appid in owned
+                    if appid in stored and stored[appid] != owned[appid].get('playtime_forever', 0)
+                ]
+                removed = [(telegram_id, appid) for appid in stored if appid not in owned]
+
+                if added:
+                    self._upsert_apps(c, [
+                        (appid, owned[appid].get('name', f"AppID {appid}")) for appid in added
+                    ])
+                    c.executemany('''INSERT INTO games (telegram_id, game_id, last_played)
+                                    VALUES (?, ?, ?)''',
+                                    [(telegram_id, appid, owned[appid].get('playtime_forever', 0))
+                                     for appid in added])
+                c.executemany('''UPDATE games SET last_played = ?
+                                WHERE telegram_id = ? AND game_id = ?''', changed)
+                c.executemany('''DELETE FROM games
+                                WHERE telegram_id = ? AND game_id = ?''', removed)
+                self._mark_library_synced(c, telegram_id, response_hash)
+                self.conn.commit()
+            return len(added), len(changed), len(removed)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error syncing library: {e}")
+            return None
+
+    def _mark_library_synced(self, c, telegram_id, response_hash):
+        c.execute('''INSERT INTO library_sync (telegram_id, response_hash, synced_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(telegram_id) DO UPDATE SET
+                        response_hash = excluded.response_hash,
+                        synced_at = excluded.synced_at''', (telegram_id, response_hash))
+
+    def mark_library_synced(self, telegram_id, response_hash):
+        """Biblioteca sem mudanças: só renova synced_at"""
         try:
             with closing(self.conn.cursor()) as c:
-                c.execute('''INSERT OR REPLACE INTO games 
-                            (telegram_id, game_id, name, installed, last_played) 
-                            VALUES (?, ?, ?, ?, ?)''', 
-                            (telegram_id, game_id, name, installed, last_played))
+                self._mark_library_synced(c, telegram_id, response_hash)
                 self.conn.commit()
             return True
         except sqlite3.Error as e:
-            logger.error(f"Database error adding/updating game: {e}")
+            self.conn.rollback()
+            logger.error(f"Database error marking library synced: {e}")
             return False
+
+    def get_library_sync_due(self, max_age_hours, limit):
+        """Usuários vinculados com biblioteca sincronizada há mais de max_age_hours:
+        (telegram_id, steam_id, hash da última resposta), mais antigos primeiro"""
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT s.telegram_id, u.steam_id, s.response_hash
+                            FROM library_sync s
+                            CROSS JOIN users u ON u.telegram_id = s.telegram_id
+                            WHERE s.synced_at <= datetime('now', '-' || ? || ' hours')
+                            AND u.steam_id IS NOT NULL
+                            ORDER BY s.synced_at LIMIT ?''', (max_age_hours, limit))
+                return c.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting library sync due: {e}")
+            return []
+
+    def toggle_game(self, telegram_id, game_id, installed=None):
+        """Alterna (ou define, se installed for dado) o status de instalação.
+
+        Um único UPDATE ... RETURNING devolve (nome, novo status, total instalado)
+        já com a alteração aplicada; retorna None se o jogo não existir.
+        """
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''UPDATE games SET installed = COALESCE(?, NOT installed)
+                            WHERE telegram_id = ? AND game_id = ?
+                            RETURNING (SELECT name FROM apps WHERE appid = games.game_id), installed,
+                                (SELECT COUNT(*) FROM games
+                                 WHERE telegram_id = ? AND installed = TRUE)''',
+                            (installed, telegram_id, game_id, telegram_id))
+                result = c.fetchone()
+                self.conn.commit()
+            if not result:
+                return None
+            return result[0], bool(result[1]), result[2]
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error toggling game: {e}")
+            return None
+    
+    def get_games_page(self, telegram_id, offset, limit, name_prefix=None):
+        """Uma página da biblioteca por tempo de jogo; retorna (linhas, total).
+
+        Cada linha é (game_id, name, installed, last_played); o total vem na mesma
+        consulta via COUNT(*) OVER ().
+        """
+        prefix_filter = ''
+        params = [telegram_id]
+        if name_prefix:
+            prefix_filter = "AND a.name LIKE ? ESCAPE '\\'"
+            escaped = name_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"{escaped}%")
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute(f'''SELECT g.game_id, a.name, g.installed, g.last_played, COUNT(*) OVER ()
+                            FROM games g
+                            JOIN apps a ON a.appid = g.game_id
+                            WHERE g.telegram_id = ? {prefix_filter}
+                            ORDER BY g.last_played DESC, g.game_id
+                            LIMIT ? OFFSET ?''', (*params, limit, offset))
+                rows = c.fetchall()
+            total = rows[0][4] if rows else 0
+            return [row[:4] for row in rows], total
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting games page: {e}")
+            return [], 0
     
     def get_installed_games(self, telegram_id):
         try:
-            with closing(self.conn.cursor()) as c:
-                c.execute('''SELECT game_id, name, last_buildid, last_played 
-                            FROM games 
-                            WHERE telegram_id = ? AND installed = TRUE
-                            ORDER BY last_played DESC''', (telegram_id,))
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT g.game_id, a.name, a.last_buildid, g.last_played 
+                            FROM games g
+                            JOIN apps a ON a.appid = g.game_id
+                            WHERE g.telegram_id = ? AND g.installed = TRUE
+                            ORDER BY g.last_played DESC''', (telegram_id,))
                 return c.fetchall()
         except sqlite3.Error as e:
             logger.error(f"Database error getting installed games: {e}")
             return []
     
-    def update_game_buildid(self, telegram_id, game_id, build_id):
+    def get_app_metadata(self, game_id, max_age):
+        """Metadados do app (appdetails) gravados há menos de max_age segundos, ou None"""
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT metadata FROM apps
+                            WHERE appid = ? AND metadata IS NOT NULL
+                            AND refreshed_at > datetime('now', '-' || ? || ' seconds')''',
+                            (game_id, int(max_age)))
+                row = c.fetchone()
+            return json.loads(row[0]) if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Database error getting app metadata: {e}")
+            return None
+
+    def set_app_metadata(self, game_id, metadata):
+        """Grava os metadados do app e adota o nome oficial, se houver"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''INSERT INTO apps (appid, name, metadata, refreshed_at)
+                            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                            ON CONFLICT(appid) DO UPDATE SET
+                                name = COALESCE(excluded.name, apps.name),
+                                metadata = excluded.metadata,
+                                refreshed_at = excluded.refreshed_at''',
+                            (game_id, metadata.get('name'), json.dumps(metadata)))
+                self.conn.commit()
+            return True
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.conn.rollback()
+            logger.error(f"Database error setting app metadata: {e}")
+            return False
+
+    def get_app_subscribers(self, game_ids=None):
+        """Índice invertido game_id -> inscritos (jogos instalados de usuários vinculados).
+
+        Cada inscrito é (telegram_id, nome, build conhecido do app, silent_mode,
+        digest_mode, idioma); sem game_ids, indexa todos os apps instalados.
+        """
+        app_filter = ''
+        params = ()
+        if game_ids is not None:
+            app_filter = 'AND g.game_id IN (SELECT value FROM json_each(?))'
+            params = (json.dumps(list(game_ids)),)
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute(f'''SELECT g.game_id, g.telegram_id, a.name, a.last_buildid,
+                            u.silent_mode, u.digest_mode, u.language
+                            FROM games g
+                            JOIN apps a ON a.appid = g.game_id
+                            JOIN users u ON u.telegram_id = g.telegram_id
+                            WHERE g.installed = TRUE AND u.steam_id IS NOT NULL
+                            {app_filter}''', params)
+                index = {}
+                for game_id, *subscriber in c.fetchall():
+                    index.setdefault(game_id, []).append(tuple(subscriber))
+                return index
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting app subscribers: {e}")
+            return {}
+
+    def get_unbaselined_apps(self, telegram_id, game_ids=None):
+        """Apps instalados do usuário que ainda não têm build de referência (last_buildid NULL)"""
+        app_filter = ''
+        params = (telegram_id,)
+        if game_ids is not None:
+            app_filter = 'AND g.game_id IN (SELECT value FROM json_each(?))'
+            params += (json.dumps(list(game_ids)),)
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute(f'''SELECT g.game_id FROM games g
+                            JOIN apps a ON a.appid = g.game_id
+                            WHERE g.telegram_id = ? AND g.installed = TRUE
+                            AND a.last_buildid IS NULL {app_filter}''', params)
+                return [row[0] for row in c.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting unbaselined apps: {e}")
+            return []
+
+    def get_due_users(self, limit):
+        """Usuários vinculados cujo next_check_at já passou, mais atrasados primeiro:
+        (telegram_id, check_interval, segundos de atraso)"""
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT telegram_id, check_interval,
+                                   (julianday('now') - julianday(next_check_at)) * 86400 FROM users
+                            WHERE steam_id IS NOT NULL AND next_check_at <= datetime('now')
+                            ORDER BY next_check_at LIMIT ?''', (limit,))
+                return c.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting due users: {e}")
+            return []
+
+    def get_due_apps(self, telegram_ids):
+        """Apps instalados pelos usuários dados que não foram verificados dentro do intervalo de cada um.
+
+        Um app já atualizado por fan-out de outro inscrito é pulado.
+        """
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                # CROSS JOIN fixa json_each no laço externo: busca por telegram_id, sem varrer games
+                c.execute('''SELECT DISTINCT g.game_id FROM json_each(?) AS due
+                            CROSS JOIN games g ON g.telegram_id = due.value
+                            JOIN apps a ON a.appid = g.game_id
+                            JOIN users u ON u.telegram_id = g.telegram_id
+                            WHERE g.installed = TRUE
+                            AND (a.last_checked IS NULL
+                                 OR a.last_checked <= datetime('now', '-' || u.check_interval || ' hours'))''',
+                            (json.dumps(list(telegram_ids)),))
+                return [row[0] for row in c.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting due apps: {e}")
+            return []
+
+    def get_due_polls(self, limit):
+        """Apps com intervalo adaptativo cujo next_poll_at já passou"""
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT game_id FROM app_polls
+                            WHERE next_poll_at <= datetime('now')
+                            ORDER BY next_poll_at LIMIT ?''', (limit,))
+                return [row[0] for row in c.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting due polls: {e}")
+            return []
+
+    def get_app_poll_state(self, game_ids, history_days):
+        """Dados para o intervalo adaptativo de cada app.
+
+        Retorna {game_id: (builds, span, poll_interval, bound)}: builds distintos e
+        segundos entre o primeiro e o último registro em updates na janela,
+        intervalo adaptativo atual (ou None) e o menor check_interval em horas entre
+        os inscritos (None se ninguém mais tem o jogo instalado).
+        """
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT due.value,
+                            (SELECT COUNT(DISTINCT build_id) FROM updates
+                             WHERE game_id = due.value AND update_time >= datetime('now', ?)),
+                            (SELECT (julianday(MAX(update_time)) - julianday(MIN(update_time))) * 86400
+                             FROM updates
+                             WHERE game_id = due.value AND update_time >= datetime('now', ?)),
+                            (SELECT poll_interval FROM app_polls WHERE game_id = due.value),
+                            (SELECT MIN(u.check_interval) FROM games g
+                             JOIN users u ON u.telegram_id = g.telegram_id
+                             WHERE g.game_id = due.value AND g.installed = TRUE
+                             AND u.steam_id IS NOT NULL)
+                            FROM json_each(?) AS due''',
+                            (f'-{history_days} days', f'-{history_days} days', json.dumps(list(game_ids))))
+                return {row[0]: (row[1], row[2] or 0, row[3], row[4]) for row in c.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting app poll state: {e}")
+            return {}
+
+    def set_app_polls(self, schedule, removed=()):
+        """Upsert de (game_id, poll_interval, next_poll_at); removed volta ao intervalo do usuário"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.executemany('''INSERT INTO app_polls (game_id, poll_interval, next_poll_at)
+                                VALUES (?, ?, ?)
+                                ON CONFLICT(game_id) DO UPDATE SET
+                                    poll_interval = excluded.poll_interval,
+                                    next_poll_at = excluded.next_poll_at''', schedule)
+                c.executemany('DELETE FROM app_polls WHERE game_id = ?',
+                              [(game_id,) for game_id in removed])
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error setting app polls: {e}")
+            return False
+
+    def get_checker_state(self, key):
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('SELECT value FROM checker_state WHERE key = ?', (key,))
+                row = c.fetchone()
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting checker state: {e}")
+            return None
+
+    def set_checker_state(self, key, value):
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''INSERT INTO checker_state (key, value) VALUES (?, ?)
+                            ON CONFLICT(key) DO UPDATE SET value = excluded.value''',
+                            (key, str(value)))
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error setting checker state: {e}")
+            return False
+
+    def heartbeat_worker(self, worker_id, ttl):
+        """Renova por ttl segundos o heartbeat do worker e os leases que ele ainda detém;
+        retorna os workers vivos"""
+        now = time.time()
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''INSERT INTO check_workers (worker_id, expires_at) VALUES (?, ?)
+                            ON CONFLICT(worker_id) DO UPDATE SET expires_at = excluded.expires_at''',
+                            (worker_id, now + ttl))
+                c.execute('UPDATE shard_leases SET expires_at = ? WHERE owner = ?', (now + ttl, worker_id))
+                c.execute('DELETE FROM check_workers WHERE expires_at < ?', (now,))
+                c.execute('SELECT worker_id FROM check_workers')
+                workers = [row[0] for row in c.fetchall()]
+                self.conn.commit()
+            return workers
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error in worker heartbeat: {e}")
+            return []
+
+    def claim_shards(self, worker_id, shards, ttl):
+        """Renova ou toma (se livre ou expirado) o lease de cada shard pedido, devolve os
+        demais shards do worker e retorna os shards que ele detém agora.
+
+        Tudo em uma transação do writer: dois workers nunca detêm o mesmo shard.
+        """
+        now = time.time()
+        wanted = json.dumps(list(shards))
+        try:
+            with closing(self.conn.cursor()) as c:
+                # WHERE true desfaz a ambiguidade do upsert com SELECT
+                c.execute('''INSERT INTO shard_leases (shard, owner, expires_at)
+                            SELECT value, ?, ? FROM json_each(?) WHERE true
+                            ON CONFLICT(shard) DO UPDATE SET
+                                owner = excluded.owner,
+                                expires_at = excluded.expires_at
+                            WHERE shard_leases.owner = excluded.owner
+                               OR shard_leases.expires_at < ?''',
+                            (worker_id, now + ttl, wanted, now))
+                c.execute('''DELETE FROM shard_leases
+                            WHERE owner = ? AND shard NOT IN (SELECT value FROM json_each(?))''',
+                            (worker_id, wanted))
+                c.execute('''SELECT shard FROM shard_leases
+                            WHERE owner = ? AND expires_at > ?''', (worker_id, now))
+                held = [row[0] for row in c.fetchall()]
+                self.conn.commit()
+            return held
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error claiming shards: {e}")
+            return []
+
+    def release_worker(self, worker_id):
+        """Desligamento: libera os shards e o heartbeat para os outros workers assumirem já"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('DELETE FROM shard_leases WHERE owner = ?', (worker_id,))
+                c.execute('DELETE FROM check_workers WHERE worker_id = ?', (worker_id,))
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error releasing worker: {e}")
+            return False
+
+    def queue_app_checks(self, game_ids):
+        """Enfileira os apps para o dono do shard de cada um; retorna quantos entraram"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''INSERT OR IGNORE INTO check_queue (appid, queued_at)
+                            SELECT value, ? FROM json_each(?)''', (time.time(), json.dumps(list(game_ids))))
+                queued = c.rowcount
+                self.conn.commit()
+            return queued
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error queueing app checks: {e}")
+            return 0
+
+    def get_queued_checks(self, shards, shard_count, limit):
+        """Apps na fila dos shards dados (de shard_count), mais antigos primeiro.
+
+        O shard sai do appid na leitura, com o mesmo hash multiplicativo dos buckets
+        de next_check_time: mudar CHECK_SHARDS não deixa linhas sem dono na fila.
+        """
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT appid FROM check_queue
+                            WHERE (appid * 2654435761) % 4294967296 % ? IN (SELECT value FROM json_each(?))
+                            ORDER BY queued_at LIMIT ?''', (shard_count, json.dumps(list(shards)), limit))
+                return [row[0] for row in c.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting queued checks: {e}")
+            return []
+
+    def finish_queued_checks(self, game_ids, failed=()):
+        """Tira da fila os apps consultados; os que falharam voltam para o fim da fila"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''DELETE FROM check_queue
+                            WHERE appid IN (SELECT value FROM json_each(?))''', (json.dumps(list(game_ids)),))
+                if failed:
+                    c.execute('''UPDATE check_queue SET queued_at = ?
+                                WHERE appid IN (SELECT value FROM json_each(?))''',
+                              (time.time(), json.dumps(list(failed))))
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error finishing queued checks: {e}")
+            return False
+
+    def set_next_checks(self, schedule):
+        """Persiste next_check_at; schedule é uma lista de (telegram_id, next_check_at)"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.executemany('''UPDATE users SET next_check_at = ?
+                                WHERE telegram_id = ?''',
+                                [(next_check_at, telegram_id) for telegram_id, next_check_at in schedule])
+                self.conn.commit()
+            self._invalidate_users(*(telegram_id for telegram_id, _ in schedule))
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error setting next checks: {e}")
+            return False
+
+    def reset_user_checks(self, telegram_id, next_check_at):
+        """Agenda o usuário para next_check_at e marca seus jogos como pendentes"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''UPDATE users SET next_check_at = ?
+                            WHERE telegram_id = ?''', (next_check_at, telegram_id))
+                c.execute('''UPDATE apps SET last_checked = NULL
+                            WHERE appid IN (SELECT game_id FROM games
+                                            WHERE telegram_id = ? AND installed = TRUE)''', (telegram_id,))
+                self.conn.commit()
+            self._invalidate_users(telegram_id)
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error resetting user checks: {e}")
+            return False
+
+    def record_app_update(self, game_id, known_build, build_id, changelog_url, subscribers):
+        """Grava o build novo de um app e o histórico dos inscritos em uma única transação.
+
+        O build e last_checked vivem em uma única linha de apps; subscribers é a
+        lista de (telegram_id, message, digest) que recebem um registro em updates,
+        com message indo para o outbox (None em modo silencioso). A troca do build é
+        um compare-and-set sobre known_build: se outro worker (um dono antigo do
+        shard) já gravou o build, nada é registrado e retorna False.
+        """
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''UPDATE apps SET last_buildid = ?, last_checked = CURRENT_TIMESTAMP
+                            WHERE appid = ? AND last_buildid IS ?''', (build_id, game_id, known_build))
+                if c.rowcount == 0:
+                    self.conn.rollback()
+                    logger.info(f"Build {build_id} for app {game_id} already recorded elsewhere")
+                    return False
+                outbox = []
+                for telegram_id, message, digest in subscribers:
+                    c.execute('''INSERT INTO updates
+                                (telegram_id, game_id, build_id, changelog_url)
+                                VALUES (?, ?, ?, ?)''',
+                                (telegram_id, game_id, build_id, changelog_url))
+                    if message:
+                        outbox.append((c.lastrowid, telegram_id, message, digest))
+                self._queue_notifications(c, outbox)
+                c.executemany('''INSERT OR IGNORE INTO stats (telegram_id, total_updates)
+                                VALUES (?, 0)''', [(s[0],) for s in subscribers])
+                c.executemany('''UPDATE stats SET total_updates = total_updates + 1,
+                                last_update = CURRENT_TIMESTAMP
+                                WHERE telegram_id = ?''', [(s[0],) for s in subscribers])
+                c.executemany(UPSERT_LAST_UPDATE, [(s[0], game_id) for s in subscribers])
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error recording app update: {e}")
+            return False
+
+    def touch_app_checked(self, game_id):
+        """Renova last_checked de um app sem mudança de build"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''UPDATE apps SET last_checked = CURRENT_TIMESTAMP
+                            WHERE appid = ?''', (game_id,))
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Database error touching app check: {e}")
+            return False
+
+    # Outbox methods
+    def _queue_notifications(self, c, notifications):
+        """Insere (update_id, telegram_id, message, digest) no outbox.
+
+        Linhas de resumo entram na janela pendente do usuário, se houver, para
+        saírem juntas; senão abrem uma nova janela de DIGEST_WINDOW_MINUTES.
+        """
+        c.executemany('''INSERT INTO outbox (update_id, telegram_id, message, digest, next_attempt_at)
+                        VALUES (?, ?, ?, ?, CASE WHEN ? THEN COALESCE(
+                            (SELECT MIN(next_attempt_at) FROM outbox
+                             WHERE telegram_id = ? AND digest = TRUE AND attempts = 0),
+                            datetime('now', '+' || ? || ' minutes'))
+                        ELSE CURRENT_TIMESTAMP END)''',
+                        [(update_id, telegram_id, message, bool(digest), bool(digest),
+                          telegram_id, Config.DIGEST_WINDOW_MINUTES)
+                         for update_id, telegram_id, message, digest in notifications])
+    
+    def get_pending_notifications(self, limit, per_chat):
+        """Notificações prontas para envio, das mais antigas para as mais novas:
+        (id, telegram_id, mensagem, tentativas, digest, idioma do usuário).
+
+        No máximo per_chat linhas avulsas por chat, para o lote não esperar um chat
+        com fila longa; as de resumo vêm todas, já que viram poucas mensagens.
+        """
+        try:
+            with closing(self._read_conn().cursor()) as c:
+                c.execute('''SELECT id, telegram_id, message, attempts, digest, language
+                            FROM (SELECT o.id, o.telegram_id, o.message, o.attempts, o.digest,
+                                      u.language, o.next_attempt_at,
+                                      ROW_NUMBER() OVER (PARTITION BY o.telegram_id, o.digest
+                                                         ORDER BY o.next_attempt_at, o.id) AS position
+                                  FROM outbox o
+                                  LEFT JOIN users u ON u.telegram_id = o.telegram_id
+                                  WHERE o.next_attempt_at <= datetime('now'))
+                            WHERE digest OR position <= ?
+                            ORDER BY next_attempt_at, id LIMIT ?''', (per_chat, limit))
+                return c.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Database error getting pending notifications: {e}")
+            return []
+    
+    def mark_notified(self, outbox_ids):
+        """Marca as atualizações como notificadas e remove as linhas do outbox, em lote"""
+        ids = json.dumps(list(outbox_ids))
         try:
             with closing(self.conn.cursor()) as c:
-                c.execute('''UPDATE games SET last_buildid = ?, last_checked = CURRENT_TIMESTAMP
-                            WHERE telegram_id = ? AND game_id = ?''', 
-                            (build_id, telegram_id, game_id))
+                c.execute('''UPDATE updates SET notified = TRUE
+                            WHERE id IN (SELECT update_id FROM outbox
+                                         WHERE id IN (SELECT value FROM json_each(?)))''', (ids,))
+                c.execute('''DELETE FROM outbox WHERE id IN (SELECT value FROM json_each(?))''', (ids,))
                 self.conn.commit()
             return True
         except sqlite3.Error as e:
-            logger.error(f"Database error updating game buildid: {e}")
+            self.conn.rollback()
+            logger.error(f"Database error marking notifications: {e}")
             return False
     
-    # Update methods
-    def record_update(self, telegram_id, game_id, game_name, build_id, changelog_url):
+    def reschedule_notifications(self, retries):
+        """retries é uma lista de (outbox_id, delay em segundos)"""
         try:
             with closing(self.conn.cursor()) as c:
-                # Record the update
-                c.execute('''INSERT INTO updates 
-                            (telegram_id, game_id, game_name, build_id, changelog_url) 
-                            VALUES (?, ?, ?, ?, ?)''', 
-                            (telegram_id, game_id, game_name, build_id, changelog_url))
-                
-                # Update stats
-                c.execute('''INSERT OR IGNORE INTO stats (telegram_id, total_updates) 
-                            VALUES (?, 0)''', (telegram_id,))
-                c.execute('''UPDATE stats SET total_updates = total_updates + 1, 
-                            last_update = CURRENT_TIMESTAMP 
-                            WHERE telegram_id = ?''', (telegram_id,))
-                
+                c.executemany('''UPDATE outbox SET attempts = attempts + 1,
+                                next_attempt_at = datetime('now', '+' || ? || ' seconds')
+                                WHERE id = ?''', [(int(delay), outbox_id) for outbox_id, delay in retries])
                 self.conn.commit()
             return True
         except sqlite3.Error as e:
-            logger.error(f"Database error recording update: {e}")
+            self.conn.rollback()
+            logger.error(f"Database error rescheduling notifications: {e}")
+            return False
+    
+    def drop_notifications(self, outbox_ids):
+        """Descarta notificações que não podem ser entregues (bot bloqueado, chat inexistente)"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''DELETE FROM outbox WHERE id IN (SELECT value FROM json_each(?))''',
+                          (json.dumps(list(outbox_ids)),))
+                self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error dropping notifications: {e}")
             return False
     
     # Stats methods
     def get_user_stats(self, telegram_id):
         try:
-            with closing(self.conn.cursor()) as c:
+            with closing(self._read_conn().cursor()) as c:
                 c.execute('''SELECT total_updates, last_update FROM stats 
                             WHERE telegram_id = ?''', (telegram_id,))
                 stats = c.fetchone()
@@ -171,11 +1014,12 @@ class Database:
                             WHERE telegram_id = ? AND installed = TRUE''', (telegram_id,))
                 installed_count = c.fetchone()[0]
                 
-                c.execute('''SELECT game_name, MAX(update_time) as last_update 
-                            FROM updates 
-                            WHERE telegram_id = ? 
-                            GROUP BY game_name 
-                            ORDER BY last_update DESC LIMIT 5''', (telegram_id,))
+                # Mantida a cada update: não depende do tamanho do histórico
+                c.execute('''SELECT a.name, l.update_time
+                            FROM last_updates l
+                            JOIN apps a ON a.appid = l.game_id
+                            WHERE l.telegram_id = ?
+                            ORDER BY l.update_time DESC LIMIT 5''', (telegram_id,))
                 recent_updates = c.fetchall()
                 
                 return {
@@ -187,13 +1031,148 @@ class Database:
         except sqlite3.Error as e:
             logger.error(f"Database error getting user stats: {e}")
             return None
-    def is_game_installed(self, telegram_id, game_id):
-        with closing(self.conn.cursor()) as c:
-            c.execute('''SELECT installed FROM games 
-                        WHERE telegram_id = ? AND game_id = ?''', 
-                        (telegram_id, game_id))
-            result = c.fetchone()
-            return result[0] if result else False
-    
+
+    # Maintenance methods
+    def rollup_updates(self, retention_days, batch):
+        """Resume em update_rollups (usuário, mês) e apaga até batch linhas de updates
+        mais antigas que a retenção; retorna quantas saíram.
+
+        O id cresce com update_time, então as linhas antigas são um prefixo da tabela
+        e cada lote é uma busca por faixa de rowid, sem índice em update_time.
+        """
+        cutoff = f'-{retention_days} days'
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''SELECT MAX(id) FROM
+                            (SELECT id, update_time FROM updates ORDER BY id LIMIT ?)
+                            WHERE update_time < datetime('now', ?)''', (batch, cutoff))
+                last_id = c.fetchone()[0]
+                if last_id is None:
+                    return 0
+                c.execute('''INSERT INTO update_rollups (telegram_id, month, updates, last_update)
+                            SELECT telegram_id, strftime('%Y-%m', update_time), COUNT(*), MAX(update_time)
+                            FROM updates
+                            WHERE id <= ? AND update_time < datetime('now', ?)
+                            GROUP BY telegram_id, strftime('%Y-%m', update_time)
+                            ON CONFLICT(telegram_id, month) DO UPDATE SET
+                                updates = update_rollups.updates + excluded.updates,
+                                last_update = MAX(update_rollups.last_update, excluded.last_update)''',
+                            (last_id, cutoff))
+                c.execute('''DELETE FROM updates
+                            WHERE id <= ? AND update_time < datetime('now', ?)''', (last_id, cutoff))
+                removed = c.rowcount
+                self.conn.commit()
+            return removed
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error rolling up updates: {e}")
+            return 0
+
+    def prune_last_updates(self, retention_days):
+        """Aplica a retenção também à última atualização por jogo usada no /stats"""
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('''DELETE FROM last_updates
+                            WHERE update_time < datetime('now', ?)''', (f'-{retention_days} days',))
+                removed = c.rowcount
+                self.conn.commit()
+            return removed
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Database error pruning last updates: {e}")
+            return 0
+
+    def compact(self, vacuum_pages):
+        """Devolve até vacuum_pages páginas livres ao sistema, atualiza as estatísticas do
+        planejador e trunca o WAL; retorna as páginas liberadas.
+
+        Bancos criados sem auto_vacuum passam por um VACUUM completo, uma única vez.
+        """
+        try:
+            with closing(self.conn.cursor()) as c:
+                c.execute('PRAGMA auto_vacuum')
+                if c.fetchone()[0] != 2:
+                    logger.info("Enabling incremental auto_vacuum (one-time full VACUUM)")
+                    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    c.execute('VACUUM')
+                c.execute('PRAGMA freelist_count')
+                free_pages = c.fetchone()[0]
+                # O pragma só libera as páginas quando todas as linhas do resultado são lidas
+                c.execute(f'PRAGMA incremental_vacuum({int(vacuum_pages)})').fetchall()
+                c.execute('PRAGMA freelist_count')
+                freed = free_pages - c.fetchone()[0]
+                c.execute('PRAGMA optimize')
+                if not self._memory:
+                    c.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            return freed
+        except sqlite3.Error as e:
+            logger.error(f"Database error compacting database: {e}")
+            return 0
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        try:
+            # Atualiza as estatísticas do planejador para os padrões de consulta da sessão
+            self.conn.execute('PRAGMA optimize')
+        except sqlite3.Error as e:
+            logger.error(f"Database error optimizing: {e}")
+        self.conn.close()
+
+class AsyncDatabase:
+    """Expõe os métodos do Database como corrotinas, fora do event loop.
+
+    Escritas passam por uma única thread dedicada (um writer por vez no SQLite);
+    leituras rodam em um pool de threads, cada uma com sua conexão somente leitura.
+    """
+    READ_METHODS = frozenset({
+        'get_user', 'get_installed_games', 'get_app_subscribers',
+        'get_due_users', 'get_due_apps', 'get_user_stats', 'get_games_page',
+        'get_pending_notifications', 'get_due_polls', 'get_app_poll_state',
+        'get_checker_state', 'get_app_metadata', 'get_library_sync_due', 'get_queued_checks',
+        'get_unbaselined_apps'
+    })
+
+    def __init__(self, db, read_pool_size=Config.DB_READ_POOL_SIZE):
+        self.db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix='db-reader')
+        self._get_user = self._wrap('get_user')
+
+    def __getattr__(self, name):
+        call = self._wrap(name)
+        setattr(self, name, call)
+        return call
+
+    def _wrap(self, name):
+        method = getattr(self.db, name)
+        executor = self._readers if name in self.READ_METHODS else self._writer
+        pool = 'read' if executor is self._readers else 'write'
+
+        def run(queued_at, args, kwargs):
+            # Espera na fila do executor (writer único) separada do tempo do método
+            metrics.observe('steambot_db_queue_seconds', time.perf_counter() - queued_at, pool=pool)
+            with metrics.db_method(name):
+                return method(*args, **kwargs)
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, run, time.perf_counter(), args, kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def get_user(self, telegram_id):
+        # Acerto no cache de perfis responde sem o salto para a thread de leitura
+        found, user = self.db.cached_user(telegram_id)
+        metrics.inc('steambot_db_user_cache_total', result='hit' if found else 'miss')
+        if found:
+            return user
+        return await self._get_user(telegram_id)
+
+    async def close(self):
+        # Drena as filas antes de fechar as conexões
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.db.close()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import json
+import os
+import string
+import sys
+from logger import logger
+
+DEFAULT_LANGUAGE = 'en'
+LOCALIZATION_DIR = os.path.join(os.path.dirname(__file__), 'localization')
+
+def placeholders(text):
+    """Campos {nome} de um texto"""
+    return frozenset(name for _, name, _, _ in string.Formatter().parse(text) if name)
+
+class Catalog:
+    """Catálogos de localization/*.json compilados uma única vez.
+
+    Cada idioma vira uma tabela plana chave -> texto com o fallback já resolvido
+    (idioma, depois o padrão, depois a própria chave) e strings internadas; os
+    textos com campos {nome} guardam também o str.format pronto, usado por template().
+    """
+
+    def __init__(self, catalogs, default=DEFAULT_LANGUAGE):
+        self.catalogs = catalogs
+        self.default = default
+        self.languages = frozenset(catalogs)
+        fallback = catalogs.get(default, {})
+        keys = set().union(*catalogs.values()) if catalogs else set()
+
+        self._texts = {}
+        self._templates = {}
+        for lang, catalog in catalogs.items():
+            texts = {sys.intern(key): sys.intern(catalog.get(key, fallback.get(key, key))) for key in keys}
+            self._texts[lang] = texts
+            self._templates[lang] = {key: text.format for key, text in texts.items() if placeholders(text)}
+        # Idiomas sem catálogo caem direto no padrão
+        self._default_texts = self._texts.get(default, {})
+        self._default_templates = self._templates.get(default, {})
+
+    @classmethod
+    def load(cls, directory=LOCALIZATION_DIR, default=DEFAULT_LANGUAGE):
+        """Lê os arquivos <idioma>.json da pasta de localização"""
+        catalogs = {}
+        if not os.path.exists(directory):
+            logger.error(f"Localization directory not found: {directory}")
+            return cls({default: {}}, default)
+
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.json'):
+                lang = filename.split('.')[0]
+                try:
+                    with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                        catalogs[lang] = json.load(f)
+                except Exception as e:
+                    logger.error(f"Error loading {filename}: {e}")
+        return cls(catalogs, default)
+
+    def text(self, lang, key):
+        return self._texts.get(lang, self._default_texts).get(key, key)
+
+    def template(self, lang, key):
+        """str.format pré-compilado do texto, para chamar com os campos"""
+        template = self._templates.get(lang, self._default_templates).get(key)
+        return template or self.text(lang, key).format
+
+    def validate(self):
+        """Confere a paridade entre os idiomas: mesmas chaves e, em cada chave, os
+        mesmos campos {nome} do idioma padrão. Retorna a lista de problemas."""
+        problems = []
+        keys = set().union(*self.catalogs.values()) if self.catalogs else set()
+        fallback = self.catalogs.get(self.default, {})
+        for lang, catalog in sorted(self.catalogs.items()):
+            missing = sorted(keys - set(catalog))
+            if missing:
+                problems.append(f"{lang} is missing {len(missing)} keys: {', '.join(missing)}")
+            for key, text in sorted(catalog.items()):
+                if key in fallback and placeholders(text) != placeholders(fallback[key]):
+                    problems.append(f"{lang}.{key} has fields {sorted(placeholders(text))}, "
+                                    f"{self.default} has {sorted(placeholders(fallback[key]))}")
+        return problems
+
+_catalog = None
+
+def catalog():
+    """Catálogo compilado na primeira chamada (não no import) e validado uma vez"""
+    global _catalog
+    if _catalog is None:
+        compiled = Catalog.load()
+        for problem in compiled.validate():
+            logger.error(f"Localization: {problem}")
+        _catalog = compiled
+    return _catalog
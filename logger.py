@@ -1,15 +1,77 @@
+import atexit
+import json
 import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config import Config
 
+# Atributos padrão do LogRecord; o resto veio de extra= e vira campo do JSON
+RESERVED_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'taskName', 'sample'}
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em extra= (telegram_id, app_id...)"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update((key, value) for key, value in record.__dict__.items() if key not in RESERVED_ATTRS)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Amostra registros de alto volume marcados com extra={'sample': chave}.
+
+    Deixa passar 1 a cada LOG_SAMPLE_EVERY[chave] (o primeiro sempre) e anota o
+    peso em sampled; WARNING e acima nunca são descartados.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.counts = {}
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        every = self.every.get(key, 1)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % every:
+            return False
+        if every > 1:
+            record.sampled = every
+        return True
+
 def setup_logger():
-    logging.basicConfig(
-        level=Config.LOG_LEVEL,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(Config.LOG_FILE),
-            logging.StreamHandler()
-        ]
-    )
+    """Logging sem I/O no event loop: o handler só enfileira (a mensagem e o traceback
+    já formatados) e uma thread (QueueListener) grava no arquivo rotativo (JSON) e no
+    console (texto)"""
+    file_handler = RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES,
+                                       backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_EVERY))
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # Esvazia a fila ao sair
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(Config.LOG_LEVEL)
+    root.handlers = [queue_handler]
+    # O httpx loga cada requisição em INFO, incluindo a API key na query string
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    # O tornado loga cada requisição do webhook/métricas; só erros interessam
+    logging.getLogger('tornado.access').setLevel(logging.WARNING)
     return logging.getLogger(__name__)
 
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
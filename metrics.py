@@ -0,0 +1,234 @@
+import asyncio
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from logger import logger
+
+# Limites (segundos) dos histogramas de latência
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+class Metrics:
+    """Contadores, gauges e histogramas em memória, exportados no formato de texto do Prometheus.
+
+    Seguro entre threads: os métodos do Database rodam nas threads do AsyncDatabase.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (nome, labels) -> valor
+        self._gauges = {}
+        self._histograms = {}  # (nome, labels) -> [contagem por bucket..., soma, total]
+        self._collectors = []
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observa a duração do bloco em {name}_seconds e conta exceções em {name}_errors_total"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorador de timer() para corrotinas"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def db_method(self, method):
+        """Marca o método do Database em execução na thread para atribuir as consultas a ele"""
+        self._local.db_method = method
+        try:
+            with self.timer('steambot_db_method', method=method):
+                yield
+        finally:
+            self._local.db_method = None
+
+    def count_query(self, statement):
+        """Trace callback das conexões SQLite: uma consulta a mais no método atual"""
+        if not statement.startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK')):
+            self.inc('steambot_db_queries_total', method=getattr(self._local, 'db_method', None) or 'other')
+
+    def add_collector(self, collector):
+        """collector() -> [(nome, valor, labels)] de gauges lidos na hora da coleta"""
+        self._collectors.append(collector)
+
+    def render(self):
+        gauges = dict(self._gauges)
+        for collector in self._collectors:
+            try:
+                for name, value, labels in collector():
+                    gauges[self._key(name, labels)] = value
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {e}")
+
+        lines = []
+        with self._lock:
+            for kind, samples in (('counter', self._counters), ('gauge', gauges)):
+                by_name = defaultdict(list)
+                for (name, labels), value in samples.items():
+                    by_name[name].append((labels, value))
+                for name in sorted(by_name):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines.extend(f"{name}{_labels(labels)} {value:g}" for labels, value in sorted(by_name[name]))
+
+            by_name = defaultdict(list)
+            for (name, labels), histogram in self._histograms.items():
+                by_name[name].append((labels, list(histogram)))
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(by_name[name]):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {histogram[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram[-2]:g}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram[-1]}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def sample_stacks(seconds, interval):
+    """Profiler por amostragem: pilhas de todas as threads a cada interval segundos,
+    no formato collapsed (uma pilha por linha + contagem) usado por flamegraphs"""
+    stacks = Counter()
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[';'.join([names.get(ident, str(ident))] + stack[::-1])] += 1
+        time.sleep(interval)
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render())
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """GET /debug/profile?seconds=N (cProfile do event loop) e /debug/sample?seconds=N
+    (amostragem de todas as threads); uma captura por vez"""
+
+    busy = False
+
+    def initialize(self, mode, max_seconds):
+        self.mode = mode
+        self.max_seconds = max_seconds
+
+    async def get(self):
+        seconds = min(float(self.get_argument('seconds', '10')), self.max_seconds)
+        if ProfileHandler.busy:
+            raise tornado.web.HTTPError(409, reason="Profile already running")
+        ProfileHandler.busy = True
+        try:
+            if self.mode == 'sample':
+                interval = float(self.get_argument('interval', '0.005'))
+                result = await asyncio.to_thread(sample_stacks, seconds, interval)
+            else:
+                # Perfila a thread do event loop: handlers, checker e dispatcher
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    profiler.disable()
+                out = io.StringIO()
+                stats = pstats.Stats(profiler, stream=out).sort_stats(self.get_argument('sort', 'cumulative'))
+                stats.print_stats(int(self.get_argument('limit', '60')))
+                result = out.getvalue()
+        finally:
+            ProfileHandler.busy = False
+        logger.info(f"Served {self.mode} profile of {seconds:g}s")
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.write(result)
+
+class MetricsServer:
+    """Endpoint local de scrape (/metrics) e, com profiler=True, os endpoints de profiling"""
+
+    def __init__(self, listen, port, profiler=False, max_profile_seconds=120):
+        self.listen = listen
+        self.port = port
+        self.profiler = profiler
+        self.max_profile_seconds = max_profile_seconds
+        self._server = None
+
+    def start(self):
+        routes = [(r'/metrics', MetricsHandler)]
+        if self.profiler:
+            routes += [
+                (r'/debug/profile', ProfileHandler, {'mode': 'profile', 'max_seconds': self.max_profile_seconds}),
+                (r'/debug/sample', ProfileHandler, {'mode': 'sample', 'max_seconds': self.max_profile_seconds}),
+            ]
+        sockets = bind_sockets(self.port, self.listen)
+        self.port = sockets[0].getsockname()[1]
+        self._server = HTTPServer(tornado.web.Application(routes))
+        self._server.add_sockets(sockets)
+        logger.info(f"Metrics server listening on {self.listen}:{self.port}"
+                    f"{' (profiler enabled)' if self.profiler else ''}")
+
+    async def stop(self):
+        if self._server:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from datetime import timedelta
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+from config import Config
+from ratelimit import TokenBucket
+from i18n import catalog
+from logger import logger
+
+def utf16_len(text):
+    """Tamanho como o Telegram conta o limite das mensagens: unidades UTF-16"""
+    return len(text.encode('utf-16-le')) // 2
+
+def truncate_utf16(text, units):
+    """Corta o texto em até units unidades UTF-16 sem partir um par substituto"""
+    if utf16_len(text) <= units:
+        return text
+    return text.encode('utf-16-le')[:units * 2].decode('utf-16-le', errors='ignore')
+
+def build_digests(rows, limit=None, lang=None):
+    """Junta as linhas de resumo de um chat em mensagens de até limit unidades UTF-16.
+
+    O cabeçalho vem do catálogo no idioma do chat. Retorna uma lista de
+    (outbox_ids, texto, menor número de tentativas).
+    """
+    separator = "\n\n"
+    header = catalog().template(lang, 'digest_header')
+    # Reserva o cabeçalho mais longo possível: o de todas as linhas em um só resumo
+    reserve = utf16_len(header(count=len(rows)) + separator)
+    budget = (limit or Config.TELEGRAM_MESSAGE_LIMIT) - reserve
+    chunks, current, length = [], [], 0
+    for outbox_id, _, message, attempts, _, _ in rows:
+        text = truncate_utf16(message, budget)
+        size = utf16_len(text)
+        added = size + (len(separator) if current else 0)
+        if current and length + added > budget:
+            chunks.append(current)
+            current, length, added = [], 0, size
+        current.append((outbox_id, text, attempts))
+        length += added
+    if current:
+        chunks.append(current)
+
+    return [
+        (
+            [outbox_id for outbox_id, _, _ in chunk],
+            header(count=len(chunk)) + separator + separator.join(text for _, text, _ in chunk),
+            min(attempts for _, _, attempts in chunk)
+        )
+        for chunk in chunks
+    ]
+
+class NotificationDispatcher:
+    """Envia o outbox respeitando os limites do Telegram (global e por chat).
+
+    Linhas entregues são marcadas como notificadas em lote; 429 pausa todos os
+    envios pelo retry_after informado e falhas de rede voltam com backoff.
+    """
+
+    def __init__(self, db, bot):
+        self.db = db
+        self.bot = bot
+        self.global_bucket = TokenBucket(Config.NOTIFY_GLOBAL_RATE, Config.NOTIFY_GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.paused_until = 0
+        self._wakeup = None
+        self._task = None
+        self._draining = False
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Notification dispatcher started")
+
+    async def stop(self, drain_timeout=0):
+        """Para o dispatcher; com drain_timeout, antes envia o que já está pronto no
+        outbox (o restante continua persistido para o próximo início)"""
+        if self._task and drain_timeout:
+            self._draining = True
+            self.wake()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Outbox not drained after {drain_timeout}s, stopping anyway")
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("Notification dispatcher stopped")
+
+    def wake(self):
+        """Avisa que há notificações novas no outbox"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.dispatch_pending()
+            except Exception as e:
+                logger.error(f"Error dispatching notifications: {e}")
+                sent = 0
+            if sent:
+                continue  # ainda pode haver mais linhas prontas
+            if self._draining:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), Config.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch_pending(self):
+        """Envia um lote do outbox; retorna quantas linhas foram processadas"""
+        rows = await self.db.get_pending_notifications(Config.OUTBOX_BATCH_SIZE, Config.OUTBOX_ROWS_PER_CHAT)
+        if not rows:
+            return 0
+
+        # Um task por chat mantém a ordem das mensagens de cada usuário
+        by_chat = {}
+        for row in rows:
+            by_chat.setdefault(row[1], []).append(row)
+
+        delivered, retries, dropped = [], [], []
+        # Um erro inesperado em um chat não pode descartar o que os outros já entregaram:
+        # as linhas dele continuam pendentes e o restante é persistido normalmente
+        results = await asyncio.gather(*(
+            self._send_chat(chat_rows, delivered, retries, dropped)
+            for chat_rows in by_chat.values()
+        ), return_exceptions=True)
+        for chat_id, result in zip(by_chat, results):
+            if isinstance(result, Exception):
+                logger.error("Error sending notifications to %s: %s", chat_id, result,
+                             extra={'telegram_id': chat_id})
+
+        if delivered:
+            await self.db.mark_notified(delivered)
+        if retries:
+            await self.db.reschedule_notifications(retries)
+        if dropped:
+            await self.db.drop_notifications(dropped)
+
+        # Descarta buckets de chats ociosos para não crescer sem limite
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.is_idle()]:
+            del self.chat_buckets[chat_id]
+        return len(rows)
+
+    async def _send_chat(self, rows, delivered, retries, dropped):
+        # Linhas comuns saem uma a uma; as de resumo viram poucas mensagens agrupadas
+        messages = [([row[0]], row[2], row[3]) for row in rows if not row[4]]
+        digest_rows = [row for row in rows if row[4]]
+        if len(digest_rows) == 1:
+            messages.append(([digest_rows[0][0]], digest_rows[0][2], digest_rows[0][3]))
+        elif digest_rows:
+            messages.extend(build_digests(digest_rows, lang=digest_rows[0][5]))
+
+        bucket = self.chat_buckets.setdefault(rows[0][1], TokenBucket(Config.NOTIFY_CHAT_RATE))
+        telegram_id = rows[0][1]
+        for index, (outbox_ids, message, attempts) in enumerate(messages):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            try:
+                await self.bot.send_message(telegram_id, message)
+                delivered.extend(outbox_ids)
+            except RetryAfter as e:
+                # Flood control vale para o bot inteiro: pausa todos os envios
+                retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                logger.warning("Telegram flood control, pausing notifications for %ss", retry_after,
+                               extra={'telegram_id': telegram_id})
+                retries.extend((outbox_id, retry_after) for ids, _, _ in messages[index:] for outbox_id in ids)
+                return
+            except (Forbidden, BadRequest, ChatMigrated) as e:
+                logger.info("Dropping notifications %s for %s: %s", outbox_ids, telegram_id, e,
+                            extra={'telegram_id': telegram_id, 'sample': 'notification'})
+                dropped.extend(outbox_ids)
+            except Exception as e:
+                # Rede, Conflict ou qualquer outro TelegramError: volta com backoff
+                if attempts + 1 >= Config.NOTIFY_MAX_ATTEMPTS:
+                    logger.error("Giving up notifications %s for %s: %s", outbox_ids, telegram_id, e,
+                                 extra={'telegram_id': telegram_id})
+                    dropped.extend(outbox_ids)
+                else:
+                    delay = min(Config.NOTIFY_BACKOFF_BASE * 2 ** attempts, Config.NOTIFY_BACKOFF_MAX)
+                    logger.warning("Failed to send notification to %s, retrying in %ss: %s", telegram_id, delay, e,
+                                   extra={'telegram_id': telegram_id})
+                    retries.extend((outbox_id, delay) for outbox_id in outbox_ids)
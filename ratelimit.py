@@ -0,0 +1,89 @@
+import asyncio
+import random
+import time
+
+class TokenBucket:
+    """Token bucket assíncrono: rate tokens por segundo, rajada de até capacity"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def set_rate(self, rate, capacity):
+        """Troca a taxa e a rajada mantendo os tokens já acumulados (até a nova rajada)"""
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    def is_idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+class CircuitBreaker:
+    """Circuit breaker por host: abre após falhas seguidas ou um Retry-After.
+
+    Enquanto aberto, allow() recusa as chamadas; passado o tempo de espera deixa
+    passar uma chamada de teste (half-open) que fecha o circuito se der certo ou
+    o reabre com espera dobrada (com jitter) se falhar.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, max_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.failures = 0
+        self.opens = 0
+        self.open_until = 0
+        self.probe_started = None
+
+    @property
+    def is_open(self):
+        return time.monotonic() < self.open_until
+
+    def allow(self):
+        if self.is_open:
+            return False
+        if self.opens and self.failures >= self.failure_threshold:
+            # Half-open: só uma chamada de teste por vez (uma sonda cancelada expira)
+            now = time.monotonic()
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opens = 0
+        self.probe_started = None
+
+    def record_failure(self, retry_after=None):
+        """Conta uma falha; retorna por quantos segundos o circuito abriu (0 se segue fechado)"""
+        self.failures += 1
+        self.probe_started = None
+        if retry_after is None and self.failures < self.failure_threshold:
+            return 0
+        if retry_after is not None:
+            timeout = min(retry_after, self.max_timeout)
+        else:
+            timeout = min(self.reset_timeout * 2 ** self.opens, self.max_timeout)
+            timeout *= random.uniform(0.5, 1.5)
+        self.failures = max(self.failures, self.failure_threshold)
+        self.opens += 1
+        self.open_until = max(self.open_until, time.monotonic() + timeout)
+        return timeout
@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import os
+import socket
+from logger import logger
+from metrics import metrics
+
+SCHEDULER_SHARD = -1  # lease do agendador: usuários vencidos, feed de changelists e ressincronização
+
+def rendezvous_owner(shard, workers):
+    """Hashing de rendezvous: o worker de maior peso para o shard.
+
+    Com um worker a mais ou a menos só os shards que ele ganha ou perde trocam de dono.
+    """
+    return max(workers, key=lambda worker: hashlib.sha1(f'{worker}:{shard}'.encode()).digest())
+
+class ShardLeases:
+    """Shards do espaço de appids divididos entre processos por leases no banco.
+
+    refresh() renova o heartbeat do worker e fica com os shards em que ele vence o
+    rendezvous entre os workers vivos. Um shard só muda de dono quando o atual o
+    devolve (outro worker entrou) ou deixa o lease expirar (morreu). Entre um
+    refresh() e outro, uma task renova os leases a cada ttl/3: um lote mais longo
+    que o ttl não perde o shard para outro worker no meio da verificação.
+    """
+
+    def __init__(self, db, shards, ttl, worker_id=None):
+        self.db = db
+        self.shards = shards
+        self.ttl = ttl
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.owned = []
+        self.leader = False
+        self.workers = 1  # workers vivos no último refresh()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._keep_alive())
+
+    async def _keep_alive(self):
+        # Só renova: devolver shards fica para o refresh(), entre um lote e outro
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self.db.heartbeat_worker(self.worker_id, self.ttl)
+
+    async def refresh(self):
+        """Renova os leases e retorna os shards de apps deste worker"""
+        workers = await self.db.heartbeat_worker(self.worker_id, self.ttl)
+        if self.worker_id not in workers:
+            # Erro no banco: sem leases confirmados, não processa nada
+            self.owned, self.leader = [], False
+            return self.owned
+
+        wanted = [shard for shard in range(SCHEDULER_SHARD, self.shards)
+                  if rendezvous_owner(shard, workers) == self.worker_id]
+        held = set(await self.db.claim_shards(self.worker_id, wanted, self.ttl))
+        owned = sorted(held - {SCHEDULER_SHARD})
+        if owned != self.owned or self.leader != (SCHEDULER_SHARD in held):
+            logger.info("Worker %s holds %s of %s shards%s (%s workers alive)",
+                        self.worker_id, len(owned), self.shards,
+                        ' and the scheduler' if SCHEDULER_SHARD in held else '', len(workers))
+        self.owned = owned
+        self.leader = SCHEDULER_SHARD in held
+        self.workers = len(workers)
+        metrics.set('steambot_shard_workers', len(workers))
+        metrics.set('steambot_shards_owned', len(owned))
+        return owned
+
+    async def release(self):
+        """Devolve os shards ao desligar, sem esperar o lease expirar"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.db.release_worker(self.worker_id)
+        self.owned, self.leader = [], False
+        logger.info("Worker %s released its shards", self.worker_id)
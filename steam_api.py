@@ -1,43 +1,221 @@
-import requests
+import asyncio
+import httpx
 import json
-from datetime import datetime
-from urllib.parse import quote
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
 from config import Config
 from logger import logger
+from cache import ResponseCache, make_cache_key
+from ratelimit import CircuitBreaker, TokenBucket
+from metrics import metrics
 import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+@dataclass(frozen=True)
+class BuildInfo:
+    """Resultado de uma única consulta ao PatchData do SteamDB"""
+    build_id: str
+    time: Optional[int]
+    changelog: Optional[str]
+    url: str
+
+@dataclass(frozen=True)
+class ChangeBatch:
+    """Apps alterados entre o change number pedido e current"""
+    current: int
+    app_ids: Tuple[int, ...]
+    full_update: bool = False  # o feed não cobre o intervalo pedido: é preciso verificar tudo
+
+def parse_retry_after(value):
+    """Segundos de um cabeçalho Retry-After (número ou data HTTP); None se ausente/inválido"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
 
 class SteamAPI:
-    def __init__(self, api_key=Config.STEAM_API_KEY):
+    def __init__(self, api_key=Config.STEAM_API_KEY, base_url=Config.STEAM_API_URL,
+                 store_url=Config.STEAM_STORE_URL, steamdb_url=Config.STEAMDB_API_URL,
+                 changelist_url=Config.CHANGELIST_URL):
         self.api_key = api_key
-        self.base_url = "https://api.steampowered.com"
-        self.steamdb_url = "https://steamdb.info/api"
-        self.cache = {}
-        self.cache_expiration = Config.CACHE_EXPIRATION
+        self.base_url = base_url
+        self.store_url = store_url
+        self.steamdb_url = steamdb_url
+        self.changelist_url = changelist_url
+        self.cache = ResponseCache(Config.CACHE_MAX_ENTRIES, Config.CACHE_DB_PATH)
+        
+        # Cliente HTTP criado sob demanda dentro do event loop
+        self._client = None
+        self._concurrency = None
+        self._host_limits = {}
+        # Limite de taxa, circuit breaker e contadores por host
+        self._hosts = {}
+        # Processos que dividem os limites por host (workers vivos, com CHECK_SHARDS)
+        self._rate_share = 1
+    
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=Config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=Config.HTTP_MAX_CONNECTIONS
+                ),
+                headers={'User-Agent': 'SteamUpdateBot'}
+            )
+            self._concurrency = asyncio.Semaphore(Config.HTTP_MAX_CONCURRENCY)
+            self._host_limits = {}
+        return self._client
+    
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(Config.HTTP_MAX_CONNECTIONS_PER_HOST)
+        return self._host_limits[host]
+    
+    def _host_rate(self, host):
+        """(taxa, rajada) deste processo: o orçamento do host dividido entre os workers"""
+        rate, burst = Config.HOST_RATE_LIMITS.get(host, Config.HOST_RATE_DEFAULT)
+        return rate / self._rate_share, max(1, burst / self._rate_share)
+
+    def share_rate_limits(self, workers):
+        """Divide os limites por host entre `workers` processos, para que juntos
+        respeitem o orçamento configurado de cada host"""
+        workers = max(1, workers)
+        if workers == self._rate_share:
+            return
+        self._rate_share = workers
+        for host, bucket, _, _ in self._hosts.values():
+            bucket.set_rate(*self._host_rate(host))
+        logger.info(f"Host rate limits shared by {workers} workers")
+
+    def _host_state(self, url):
+        host = urlsplit(url).hostname
+        if host not in self._hosts:
+            self._hosts[host] = (
+                host,
+                TokenBucket(*self._host_rate(host)),
+                CircuitBreaker(Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_SECONDS,
+                               Config.BREAKER_MAX_SECONDS),
+                dict.fromkeys(('requests', 'ok', 'throttled', 'failed', 'retries', 'short_circuited'), 0)
+            )
+        return self._hosts[host]
+    
+    def host_available(self, url):
+        """False enquanto o circuito do host da URL estiver aberto"""
+        _, _, breaker, _ = self._host_state(url)
+        return not breaker.is_open
+    
+    def stats(self):
+        return {
+            'cache': self.cache.stats(),
+            'hosts': {
+                host: dict(counters, circuit_open=breaker.is_open)
+                for host, _, breaker, counters in self._hosts.values()
+            }
+        }
+    
+    def collect_metrics(self):
+        """Gauges do cache e dos circuitos por host, lidos a cada scrape"""
+        cache = self.cache.stats()
+        samples = [
+            ('steambot_steam_cache_entries', cache['size'], {}),
+            ('steambot_steam_cache_hit_ratio', cache['hit_ratio'], {})
+        ]
+        for host, _, breaker, _ in self._hosts.values():
+            samples.append(('steambot_steam_circuit_open', int(breaker.is_open), {'host': host}))
+        return samples
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.cache.close()
     
-    def _make_request(self, url, params=None, use_cache=True):
-        cache_key = f"{url}?{str(params)}"
+    async def _make_request(self, endpoint, url, params=None):
+        # TTL por endpoint; endpoints sem TTL nunca são cacheados
+        ttl = Config.CACHE_TTLS.get(endpoint)
+        cache_key = make_cache_key(endpoint, params)
         
         # Check cache first
-        if use_cache and cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if time.time() - timestamp < self.cache_expiration:
+        if ttl:
+            cached_data = await self.cache.get(cache_key)
+            metrics.inc('steambot_steam_cache_total', endpoint=endpoint,
+                        result='miss' if cached_data is None else 'hit')
+            if cached_data is not None:
                 return cached_data
         
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Cache the response
-            if use_cache:
-                self.cache[cache_key] = (data, time.time())
+        start = time.perf_counter()
+        data, outcome = await self._fetch(url, params)
+        metrics.observe('steambot_steam_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('steambot_steam_requests_total', endpoint=endpoint, outcome=outcome)
+        
+        # Cache the response
+        if ttl and outcome == 'ok':
+            self.cache.set(cache_key, data, ttl)
+        return data
+    
+    async def _fetch(self, url, params):
+        """GET com limite de taxa, circuit breaker e retries; retorna (dados, resultado)"""
+        host, bucket, breaker, counters = self._host_state(url)
+        error = None
+        for attempt in range(Config.HTTP_MAX_RETRIES + 1):
+            if not breaker.allow():
+                counters['short_circuited'] += 1
+                return None, 'short_circuited'
+            await bucket.acquire()
+            counters['requests'] += 1
+            retry_after = None
+            try:
+                client = self._get_client()
+                async with self._concurrency, self._host_limit(url):
+                    response = await client.get(url, params=params)
+                if response.status_code == 429 or response.status_code >= 500:
+                    # Host sobrecarregado: conta como throttled se pediu para esperar
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    throttled = response.status_code == 429 or retry_after is not None
+                    counters['throttled' if throttled else 'failed'] += 1
+                    error = f"HTTP {response.status_code}"
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    breaker.record_success()
+                    counters['ok'] += 1
+                    return data, 'ok'
+            except httpx.HTTPStatusError as e:
+                # Outros 4xx: o pedido é que é inválido, o host está saudável
+                breaker.record_success()
+                counters['failed'] += 1
+                # Rotineiro (app fora do SteamDB, perfil privado): amostrado, sem a query com a key
+                logger.info("Steam API request to %s%s failed: HTTP %s", host, e.request.url.path,
+                            e.response.status_code, extra={'sample': 'steam_client_error'})
+                return None, 'client_error'
+            except (httpx.HTTPError, ValueError) as e:
+                counters['failed'] += 1
+                error = str(e) or type(e).__name__
             
-            return data
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Steam API request failed: {e}")
-            return None
+            opened = breaker.record_failure(retry_after)
+            if opened:
+                logger.warning("Circuit open for %s for %.1fs after %s", host, opened, error)
+                return None, 'circuit_opened'
+            if attempt < Config.HTTP_MAX_RETRIES:
+                counters['retries'] += 1
+                delay = min(Config.HTTP_BACKOFF_BASE * 2 ** attempt, Config.HTTP_BACKOFF_MAX)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        
+        logger.error("Steam API request to %s failed: %s", host, error)
+        return None, 'failed'
     
-    def get_steam_id_from_url(self, profile_url):
+    async def get_steam_id_from_url(self, profile_url):
         """Convert Steam profile URL to SteamID64"""
         try:
             # If already a SteamID64 (17 digits)
@@ -56,7 +234,7 @@ class SteamAPI:
                     'key': self.api_key,
                     'vanityurl': vanity_name
                 }
-                data = self._make_request(url, params)
+                data = await self._make_request('vanity', url, params)
                 return data.get('response', {}).get('steamid') if data else None
             else:
                 # Direct ID
@@ -66,7 +244,7 @@ class SteamAPI:
             logger.error(f"Error extracting Steam ID from URL: {e}")
             return None
     
-    def get_owned_games(self, steam_id):
+    async def get_owned_games(self, steam_id):
         url = f"{self.base_url}/IPlayerService/GetOwnedGames/v1/"
         params = {
             'key': self.api_key,
@@ -74,24 +252,25 @@ class SteamAPI:
             'include_appinfo': True,
             'include_played_free_games': True
         }
-        data = self._make_request(url, params)
+        data = await self._make_request('owned_games', url, params)
         return data.get('response', {}).get('games', []) if data else None
     
-    def get_app_details(self, app_id):
-        url = f"https://store.steampowered.com/api/appdetails"
+    async def get_app_details(self, app_id):
+        url = f"{self.store_url}/api/appdetails"
         params = {
             'appids': app_id,
             'l': 'english'
         }
-        data = self._make_request(url, params)
+        data = await self._make_request('app_details', url, params)
         return data.get(str(app_id), {}).get('data') if data else None
     
-    def get_steamdb_changelog(self, app_id):
+    async def get_latest_build(self, app_id):
+        """Fetch the latest SteamDB PatchData entry for an app as a single BuildInfo"""
         url = f"{self.steamdb_url}/PatchData/"
         params = {
             'appid': app_id
         }
-        data = self._make_request(url, params, use_cache=False)
+        data = await self._make_request('patch_data', url, params)
         
         if not data or not data.get('success'):
             return None
@@ -101,14 +280,32 @@ class SteamAPI:
             return None
         
         latest_change = changes[0]
-        return {
-            'build_id': latest_change.get('buildid'),
-            'time': latest_change.get('time'),
-            'changelog': latest_change.get('change_description'),
-            'url': f"https://steamdb.info/app/{app_id}/patchnotes/"
-        }
+        build_id = latest_change.get('buildid')
+        if not build_id:
+            return None
+        
+        return BuildInfo(
+            build_id=str(build_id),
+            time=latest_change.get('time'),
+            changelog=latest_change.get('change_description'),
+            url=f"https://steamdb.info/app/{app_id}/patchnotes/"
+        )
     
-    def get_current_build_id(self, app_id):
-        """Get the current build ID from SteamDB"""
-        changelog = self.get_steamdb_changelog(app_id)
-        return changelog.get('build_id') if changelog else None
\ No newline at end of file
+    async def get_changes_since(self, change_number):
+        """Apps alterados desde change_number segundo o feed de changelists (PICS).
+
+        O feed responde no formato do PICSChangesSince da Steam:
+        current_change_number, force_full_app_update e app_changes[].appid.
+        """
+        params = {
+            'since': change_number
+        }
+        data = await self._make_request('changelist', self.changelist_url, params)
+        if not data or 'current_change_number' not in data:
+            return None
+        
+        return ChangeBatch(
+            current=int(data['current_change_number']),
+            app_ids=tuple(sorted({int(change['appid']) for change in data.get('app_changes', [])})),
+            full_update=bool(data.get('force_full_app_update') or data.get('force_full_update'))
+        )
@@ -1,127 +1,506 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timedelta
-from telegram import Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from datetime import datetime, timedelta, timezone
 from config import Config
 from logger import logger
+from metrics import metrics
+from i18n import catalog
+import asyncio
+import functools
+import hashlib
+import json
+import random
 import time
 
+def format_timestamp(ts):
+    """Formato de CURRENT_TIMESTAMP do SQLite (UTC), comparável com datetime('now')"""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def next_check_time(telegram_id, check_interval, now=None):
+    """Próxima verificação do usuário dentro do seu bucket fixo no intervalo.
+
+    O intervalo é dividido em buckets do tamanho do tick; cada usuário cai sempre
+    no mesmo bucket (hash do telegram_id) com jitter dentro dele, o que espalha
+    a carga uniformemente sem depender de quando o usuário se vinculou.
+    """
+    now = time.time() if now is None else now
+    period = check_interval * 3600
+    bucket_width = Config.POLL_TICK_MINUTES * 60
+    buckets = max(1, period // bucket_width)
+    bucket = (telegram_id * 2654435761) % 2**32 % buckets
+    next_at = now - now % period + bucket * bucket_width + random.uniform(0, bucket_width)
+    while next_at <= now:
+        next_at += period
+    return next_at
+
+def library_hash(games):
+    """Hash estável da resposta do GetOwnedGames (appid e tempo de jogo)"""
+    owned = sorted((game['appid'], game.get('playtime_forever', 0)) for game in games)
+    return hashlib.sha1(json.dumps(owned).encode()).hexdigest()
+
+def app_poll_interval(builds, span, previous, changed, bound):
+    """Intervalo adaptativo (segundos) de um app, limitado ao bound do usuário.
+
+    Após um build novo o intervalo cai para a cadência do histórico (uma fração
+    do tempo médio entre builds); cada consulta sem mudança dobra o intervalo até
+    voltar ao bound, onde o app fica até o próximo build.
+    """
+    tick = Config.POLL_TICK_MINUTES * 60
+    if not changed:
+        interval = previous * 2 if previous else bound
+    elif builds >= 2:
+        interval = span / (builds - 1) * Config.APP_POLL_GAP_FRACTION
+    else:
+        interval = bound  # sem histórico suficiente: fica no intervalo do usuário
+    return int(min(bound, max(tick, interval)))
+
 class UpdateChecker:
-    def __init__(self, db, steam_api, bot_token):
+    """Verifica builds novos por polling dos usuários vencidos ou, com um feed de
+    changelists, só dos apps que o feed aponta como alterados.
+
+    Com leases (ShardLeases) roda como um de vários processos: o dono do lease do
+    agendador seleciona os apps e os enfileira, e cada worker verifica os apps dos
+    seus shards. Sem notifier (worker.py) o outbox é enviado pelo processo do bot.
+    """
+
+    def __init__(self, db, steam_api, notifier, feed=None, leases=None):
         self.db = db
         self.steam_api = steam_api
-        self.bot = Bot(token=bot_token)
-        self.scheduler = BackgroundScheduler()
-        self.jobs = {}
-    
+        self.notifier = notifier
+        self.feed = feed
+        self.leases = leases
+        self.catalog = catalog()
+        self.scheduler = AsyncIOScheduler()
+        self.poll_job = None
+        self.sync_job = None
+        self.maintenance_job = None
+        self._running = set()  # tasks dos jobs em execução, aguardados em drain()
+        self._baselines = set()  # referências fortes das tasks de baseline_apps()
+
     def start(self):
+        """Inicia o scheduler; deve ser chamado com o event loop da aplicação em execução"""
+        # Um único timer: a cada tick processa os usuários cujo bucket venceu ou o feed
+        if self.leases:
+            job, interval = self.check_shards_tick, {'seconds': Config.SHARD_TICK_SECONDS}
+        elif self.feed:
+            job, interval = self.ingest_changes, {'seconds': Config.CHANGELIST_POLL_SECONDS}
+        else:
+            job, interval = self.check_due_apps, {'minutes': Config.POLL_TICK_MINUTES}
+        self.poll_job = self.scheduler.add_job(
+            self._tracked(job),
+            'interval',
+            **interval,
+            next_run_time=datetime.now() + timedelta(minutes=1),
+            max_instances=1,
+            coalesce=True
+        )
+        self.sync_job = self.scheduler.add_job(
+            self._tracked(self.resync_libraries),
+            'interval',
+            minutes=Config.LIBRARY_SYNC_MINUTES,
+            max_instances=1,
+            coalesce=True
+        )
+        self.maintenance_job = self.scheduler.add_job(
+            self._tracked(self.maintain_database),
+            'interval',
+            hours=Config.MAINTENANCE_HOURS,
+            next_run_time=datetime.now() + timedelta(minutes=10),
+            max_instances=1,
+            coalesce=True
+        )
         self.scheduler.start()
+        if self.leases:
+            self.leases.start()
         logger.info("Update checker scheduler started")
-    
+
     def stop(self):
         self.scheduler.shutdown()
         logger.info("Update checker scheduler stopped")
-    
-    def schedule_user_check(self, telegram_id):
-        """Schedule or reschedule a user's update check"""
-        user = self.db.get_user(telegram_id)
+
+    def _tracked(self, job):
+        """Envolve o job para que drain() saiba quais execuções estão em andamento"""
+        @functools.wraps(job)
+        async def run():
+            task = asyncio.current_task()
+            self._running.add(task)
+            try:
+                with metrics.timer('steambot_checker_job', job=job.__name__):
+                    return await job()
+            finally:
+                self._running.discard(task)
+        return run
+
+    async def drain(self, timeout):
+        """Desligamento gracioso: não dispara novos jobs e espera os em andamento
+        por até timeout segundos antes de parar o scheduler"""
+        if not self.scheduler.running:
+            return
+        self.scheduler.pause()
+        tasks = self._running | self._baselines
+        if tasks:
+            logger.info(f"Waiting for {len(tasks)} update checker jobs to finish")
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning(f"{len(pending)} update checker jobs still running after {timeout}s, cancelling")
+                for task in pending:
+                    task.cancel()
+        self.stop()
+        if self.leases:
+            await self.leases.release()
+
+    async def schedule_user_check(self, telegram_id):
+        """Coloca o usuário no próximo tick, com jitter para não acumular reagendamentos"""
+        user = await self.db.get_user(telegram_id)
         if not user or not user[1]:  # No Steam ID
             return False
-        
-        # Remove existing job if any
-        self.unschedule_user_check(telegram_id)
-        
-        # Get user's check interval (default is 6 hours)
+
+        next_at = time.time() + random.uniform(0, Config.POLL_TICK_MINUTES * 60)
+        await self.db.reset_user_checks(telegram_id, format_timestamp(next_at))
+        await self.baseline_apps(telegram_id)
         check_interval = user[3] or Config.DEFAULT_CHECK_INTERVAL
-        
-        # Schedule new job
-        job = self.scheduler.add_job(
-            self.check_user_updates,
-            'interval',
-            hours=check_interval,
-            args=[telegram_id],
-            next_run_time=datetime.now() + timedelta(minutes=1)
-        )
-        
-        self.jobs[telegram_id] = job
-        logger.info(f"Scheduled update checks every {check_interval} hours for user {telegram_id}")
+        logger.info("Scheduled update checks every %s hours for user %s", check_interval, telegram_id,
+                    extra={'telegram_id': telegram_id})
         return True
-    
-    def unschedule_user_check(self, telegram_id):
-        """Remove a user's scheduled update checks"""
-        if telegram_id in self.jobs:
-            self.jobs[telegram_id].remove()
-            del self.jobs[telegram_id]
-            logger.info(f"Unscheduled update checks for user {telegram_id}")
-            return True
-        return False
-    
-    def check_user_updates(self, telegram_id):
-        """Check for updates in user's installed games"""
-        logger.info(f"Checking updates for user {telegram_id}")
-        
-        user = self.db.get_user(telegram_id)
-        if not user or not user[1]:  # No Steam ID
-            return False
-        
-        steam_id = user[1]
-        installed_games = self.db.get_installed_games(telegram_id)
-        if not installed_games:
+
+    async def baseline_apps(self, telegram_id, game_ids=None):
+        """Grava o build atual dos apps instalados do usuário que ainda não têm referência.
+
+        Vale para todos os modos: no modo changelist nada mais consultaria o app antes
+        da primeira mudança no feed, que viraria a referência sem notificar ninguém.
+        As consultas rodam em segundo plano (aguardadas pelo drain()) para não segurar
+        a resposta do comando; retorna a task, ou None se não havia app sem referência.
+        """
+        game_ids = await self.db.get_unbaselined_apps(telegram_id, game_ids)
+        if not game_ids:
+            return None
+        index = await self.db.get_app_subscribers(game_ids)
+
+        async def baseline_checks():
+            updates_found, failed = await self.run_checks(index)
+            if failed and self.feed:
+                # No modo changelist nenhum tick voltaria a eles antes da próxima mudança
+                await self.db.queue_app_checks(failed)
+            return updates_found
+
+        task = asyncio.create_task(self._tracked(baseline_checks)())
+        self._baselines.add(task)
+        task.add_done_callback(self._baselines.discard)
+        return task
+
+    async def check_due_apps(self):
+        """Tick: verifica os apps dos usuários vencidos e os apps adaptativos vencidos,
+        depois reagenda os usuários no seu bucket"""
+        if self.paused():
+            logger.info("Update checks paused: SteamDB circuit is open")
+            return 0
+
+        users = await self.db.get_due_users(Config.MAX_USERS_PER_TICK)
+        # Atraso do usuário mais atrasado: cresce se os ticks não dão conta da carga
+        metrics.set('steambot_checker_lag_seconds', max(0, users[0][2]) if users else 0)
+        metrics.set('steambot_checker_due_users', len(users))
+
+        game_ids = set()
+        if users:
+            game_ids.update(await self.db.get_due_apps([telegram_id for telegram_id, _, _ in users]))
+        # Apps que atualizam com frequência vencem antes do intervalo dos usuários
+        polls = await self.db.get_due_polls(Config.MAX_APP_POLLS_PER_TICK)
+        game_ids.update(polls)
+
+        updates_found = 0
+        if game_ids:
+            index = await self.db.get_app_subscribers(game_ids)
+            orphans = [game_id for game_id in polls if game_id not in index]
+            if orphans:
+                await self.db.set_app_polls([], orphans)
+            # Os apps sem resposta mantêm o last_checked antigo e voltam no próximo tick
+            updates_found, _ = await self.run_checks(index)
+
+        if not users or self.paused():
+            # Circuito aberto no meio do tick: os usuários seguem vencidos e os apps
+            # que ficaram sem consulta (last_checked antigo) voltam no próximo tick
+            return updates_found
+
+        now = time.time()
+        await self.db.set_next_checks([
+            (telegram_id, format_timestamp(next_check_time(
+                telegram_id, check_interval or Config.DEFAULT_CHECK_INTERVAL, now)))
+            for telegram_id, check_interval, _ in users
+        ])
+        return updates_found
+
+    async def ingest_changes(self):
+        """Modo changelist: consome os apps alterados desde o último change number
+        processado e consulta o build apenas dos que têm inscritos"""
+        # Consultas que falharam em ticks anteriores (com shards, ficam com os donos)
+        updates_found = 0 if self.leases else await self.check_shards()
+        state = await self.db.get_checker_state('change_number')
+        since = int(state) if state is not None else None
+
+        for _ in range(Config.CHANGELIST_MAX_BATCHES):
+            batch = await self.feed.changes_since(since or 0)
+            if batch is None:
+                break
+
+            if since is None or batch.full_update:
+                # Sem ponto de partida confiável: verifica todos os apps inscritos uma vez
+                logger.info("Full app check at change number %s", batch.current)
+                found, failed = await self.run_checks(await self.db.get_app_subscribers())
+                updates_found += found
+            elif batch.app_ids:
+                index = await self.db.get_app_subscribers(batch.app_ids)
+                logger.info("Changes %s..%s: %s apps changed, %s with subscribers",
+                            since, batch.current, len(batch.app_ids), len(index))
+                found, failed = await self.run_checks(index) if index else (0, [])
+                updates_found += found
+            else:
+                failed = []
+
+            if self.paused():
+                # Lookups recusados pelo circuito: não avança o change number para reprocessar o lote
+                logger.info("Changelist ingestion paused: SteamDB circuit is open")
+                break
+            if since is not None and batch.current <= since:
+                break
+            if failed:
+                # O feed não volta a listar esses apps: ficam na fila antes de
+                # avançar o change number e são reconsultados no início do próximo tick
+                logger.warning("Retrying %s failed app lookups on the next tick", len(failed))
+                await self.db.queue_app_checks(failed)
+            # Persistido a cada lote: um reinício continua de onde parou
+            since = batch.current
+            await self.db.set_checker_state('change_number', since)
+            metrics.set('steambot_changelist_change_number', since)
+
+        return updates_found
+
+    async def run_checks(self, index):
+        """Verifica os apps do índice aqui ou, com shards, enfileira para o dono de cada um.
+        Retorna (updates encontrados, apps que não puderam ser consultados)"""
+        if not self.leases:
+            return await self.check_apps(index)
+        queued = await self.db.queue_app_checks(list(index))
+        logger.info("Queued %s of %s app checks for the shard owners", queued, len(index))
+        return 0, []
+
+    async def refresh_leases(self):
+        """Renova os leases e divide os limites por host da Steam entre os workers vivos"""
+        shards = await self.leases.refresh()
+        self.steam_api.share_rate_limits(self.leases.workers)
+        return shards
+
+    async def check_shards_tick(self):
+        """Tick com shards: o dono do lease do agendador seleciona os apps vencidos
+        (ou consome o feed); todo worker então esvazia a fila dos seus shards"""
+        await self.refresh_leases()
+        if self.leases.leader:
+            await (self.ingest_changes() if self.feed else self.check_due_apps())
+        return await self.check_shards()
+
+    async def check_shards(self):
+        """Verifica os apps enfileirados dos shards deste worker em lotes de
+        CHECK_BATCH_SIZE, renovando os leases antes de cada lote. Sem leases, a fila
+        (um único shard) guarda só as consultas que falharam no modo changelist"""
+        updates_found = 0
+        attempted = set()
+        while not self.paused():
+            shards = await self.refresh_leases() if self.leases else [0]
+            if not shards:
+                break
+            shard_count = self.leases.shards if self.leases else 1
+            game_ids = await self.db.get_queued_checks(shards, shard_count, Config.CHECK_BATCH_SIZE)
+            if not game_ids or attempted.issuperset(game_ids):
+                break  # fila vazia, ou só restam apps que já falharam neste tick
+            attempted.update(game_ids)
+            # Apps que perderam os inscritos desde o enfileiramento só saem da fila
+            index = await self.db.get_app_subscribers(game_ids)
+            found, failed = await self.check_apps(index) if index else (0, [])
+            updates_found += found
+            if self.paused():
+                break  # o lote interrompido continua na fila
+            # Só saem os apps consultados; os que falharam vão para o fim da fila
+            failed = set(failed)
+            await self.db.finish_queued_checks([game_id for game_id in game_ids if game_id not in failed], failed)
+        return updates_found
+
+    async def resync_libraries(self):
+        """Atualiza as bibliotecas mais antigas aplicando só o diff do GetOwnedGames"""
+        if self.leases and not self.leases.leader:
+            return 0  # com shards, só o dono do lease do agendador ressincroniza
+        users = await self.db.get_library_sync_due(Config.LIBRARY_SYNC_HOURS, Config.LIBRARY_SYNC_BATCH)
+        if not users:
+            return 0
+        # Em paralelo; o token bucket do host limita o ritmo real das requisições
+        results = await asyncio.gather(*(self.resync_library(*user) for user in users), return_exceptions=True)
+        for (telegram_id, _, _), result in zip(users, results):
+            if isinstance(result, Exception):
+                logger.error("Error resyncing library for %s: %s", telegram_id, result,
+                             extra={'telegram_id': telegram_id})
+        changed = sum(1 for result in results if result is True)
+        logger.info("Resynced %s libraries (%s changed)", len(users), changed)
+        return changed
+
+    async def resync_library(self, telegram_id, steam_id, previous_hash):
+        """Retorna True se a biblioteca mudou, False se igual e None se não foi possível consultar"""
+        if not self.steam_api.host_available(self.steam_api.base_url):
+            return None  # circuito aberto: fica para o próximo ciclo
+        games = await self.steam_api.get_owned_games(steam_id)
+        if games is None:
+            return None
+        response_hash = library_hash(games)
+        if not games or response_hash == previous_hash:
+            # Biblioteca igual, ou perfil que ficou privado: nada a apagar nem regravar
+            await self.db.mark_library_synced(telegram_id, response_hash)
             return False
-        
+        result = await self.db.sync_library(telegram_id, games, response_hash)
+        if not result:
+            return None
+        added, updated, removed = result
+        logger.info("Library resync for %s: +%s ~%s -%s", telegram_id, added, updated, removed,
+                    extra={'telegram_id': telegram_id, 'sample': 'library_resync'})
+        return True
+
+    async def maintain_database(self):
+        """Resume o histórico além da retenção em totais mensais, em lotes curtos para
+        não segurar o writer, e compacta o arquivo"""
+        if self.leases and not self.leases.leader:
+            return 0  # com shards, só o dono do lease do agendador faz a manutenção
+        # O polling adaptativo lê o histórico de APP_POLL_HISTORY_DAYS
+        retention = max(Config.UPDATES_RETENTION_DAYS, Config.APP_POLL_HISTORY_DAYS)
+        rolled = 0
+        while True:
+            removed = await self.db.rollup_updates(retention, Config.MAINTENANCE_BATCH)
+            rolled += removed
+            if removed < Config.MAINTENANCE_BATCH:
+                break
+        pruned = await self.db.prune_last_updates(retention)
+        freed = await self.db.compact(Config.VACUUM_PAGES_PER_RUN)
+        metrics.inc('steambot_maintenance_rolled_up_total', rolled)
+        metrics.inc('steambot_maintenance_vacuumed_pages_total', freed)
+        logger.info("Database maintenance: %s updates rolled up, %s stale last updates pruned, %s pages freed",
+                    rolled, pruned, freed)
+        return rolled
+
+    def paused(self):
+        """As verificações param enquanto o circuito do SteamDB estiver aberto"""
+        return not self.steam_api.host_available(self.steam_api.steamdb_url)
+
+    async def check_apps(self, index):
+        """Consulta cada app do índice uma única vez e distribui o resultado aos inscritos.
+        Retorna (updates encontrados, apps sem resposta ou não consultados)"""
+        logger.info("Checking updates for %s apps", len(index))
         updates_found = 0
-        
-        for game_id, game_name, last_buildid, _ in installed_games:
-            current_build = self.steam_api.get_current_build_id(game_id)
-            if not current_build:
-                continue
-            
-            if last_buildid != current_build:
-                # New update found
-                changelog = self.steam_api.get_steamdb_changelog(game_id)
-                changelog_url = changelog.get('url') if changelog else f"https://steamdb.info/app/{game_id}/patchnotes/"
-                
-                # Record the update
-                self.db.record_update(telegram_id, game_id, game_name, current_build, changelog_url)
-                self.db.update_game_buildid(telegram_id, game_id, current_build)
-                
-                # Send notification if not in silent mode
-                if not user[4]:  # silent_mode is False
-                    message = (
-                        f"📢 Update available for {game_name}!\n"
-                        f"🕒 Update time: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
-                        f"📝 Changelog: {changelog_url}"
-                    )
-                    try:
-                        self.bot.send_message(telegram_id, message)
-                    except Exception as e:
-                        logger.error(f"Failed to send update notification to {telegram_id}: {e}")
-                
-                updates_found += 1
-        
-        logger.info(f"Found {updates_found} updates for user {telegram_id}")
-        return updates_found > 0
-    
-    def check_all_users(self):
+        changed = {}
+        failed = []
+
+        # Lotes concorrentes; o SteamAPI limita as conexões por host
+        apps = list(index.items())
+        for i in range(0, len(apps), Config.CHECK_BATCH_SIZE):
+            if self.paused():
+                logger.warning("SteamDB circuit open, skipping %s app checks", len(apps) - i)
+                failed.extend(game_id for game_id, _ in apps[i:])
+                break
+            batch = apps[i:i + Config.CHECK_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(self.check_app(game_id, subscribers) for game_id, subscribers in batch),
+                return_exceptions=True
+            )
+            for (game_id, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error("Error checking updates for app %s: %s", game_id, result,
+                                 extra={'app_id': game_id})
+                    changed[game_id] = False
+                    failed.append(game_id)
+                elif result is None:
+                    failed.append(game_id)
+                else:
+                    updates_found += result
+                    changed[game_id] = result > 0
+            metrics.inc('steambot_checker_apps_checked_total',
+                        sum(1 for r in results if r is not None and not isinstance(r, Exception)))
+
+        if changed and not self.feed:
+            await self.schedule_apps(changed)
+        metrics.inc('steambot_checker_updates_found_total', updates_found)
+        logger.info("Found %s updates across %s apps", updates_found, len(index))
+        return updates_found, failed
+
+    async def schedule_apps(self, changed):
+        """Recalcula o intervalo adaptativo dos apps consultados (game_id -> teve build novo)"""
+        state = await self.db.get_app_poll_state(list(changed), Config.APP_POLL_HISTORY_DAYS)
+        now = time.time()
+        schedule, removed = [], []
+        for game_id, app_changed in changed.items():
+            builds, span, previous, bound_hours = state.get(game_id, (0, 0, None, None))
+            bound = (bound_hours or 0) * 3600
+            interval = app_poll_interval(builds, span, previous, app_changed, bound) if bound else None
+            if interval and interval < bound:
+                schedule.append((game_id, interval, format_timestamp(now + interval)))
+            elif previous is not None:
+                # Voltou ao intervalo do usuário (ou perdeu os inscritos): sai da tabela
+                removed.append(game_id)
+        if schedule or removed:
+            await self.db.set_app_polls(schedule, removed)
+
+    async def check_app(self, game_id, subscribers):
+        """Check one app and fan out a new build to every subscriber"""
+        build = await self.steam_api.get_latest_build(game_id)
+        if not build:
+            return None  # sem resposta do SteamDB: o app continua pendente
+
+        # Nome e build conhecido vêm do catálogo compartilhado (iguais para todos os inscritos)
+        _, game_name, known_build, _, _, _ = subscribers[0]
+        if known_build == build.build_id:
+            await self.db.touch_app_checked(game_id)
+            return 0
+        if known_build is None:
+            # Primeira consulta do app (baseline_apps ao ganhar o primeiro inscrito):
+            # grava a referência sem notificar ninguém
+            await self.db.record_app_update(game_id, None, build.build_id, build.url, [])
+            return 0
+
+        if game_name.startswith('AppID '):
+            details = await self.get_app_details(game_id)
+            if details and details.get('name'):
+                game_name = details['name']
+
+        # Record the update (and queue notifications) for every subscriber at once,
+        # rendering the message once per language
+        update_time = datetime.now().strftime('%Y-%m-%d %H:%M')
+        messages = {}
+        for *_, language in subscribers:
+            if language not in messages:
+                messages[language] = self.catalog.template(language, 'update_notification')(
+                    game_name=game_name, update_time=update_time, changelog_url=build.url)
+        recorded = await self.db.record_app_update(
+            game_id,
+            known_build,
+            build.build_id,
+            build.url,
+            [
+                (telegram_id, None if silent_mode else messages[language], digest_mode)
+                for telegram_id, _, _, silent_mode, digest_mode, language in subscribers
+            ]
+        )
+        if not recorded:
+            return 0  # outro worker já gravou esse build (e notificou), ou falha no banco
+        if self.notifier:
+            self.notifier.wake()
+        logger.info("New build %s for app %s (%s subscribers)", build.build_id, game_id, len(subscribers),
+                    extra={'app_id': game_id, 'build_id': build.build_id, 'sample': 'app_update'})
+
+        return len(subscribers)
+
+    async def get_app_details(self, game_id):
+        """appdetails da loja com cache no catálogo (apps.metadata) entre reinícios"""
+        details = await self.db.get_app_metadata(game_id, Config.CACHE_TTLS['app_details'])
+        if details is None:
+            details = await self.steam_api.get_app_details(game_id)
+            if details:
+                await self.db.set_app_metadata(game_id, details)
+        return details
+
+    async def check_all_users(self):
         """Check for updates for all users (manual trigger)"""
         logger.info("Starting update check for all users")
-        
-        with closing(self.db.conn.cursor()) as c:
-            c.execute('SELECT telegram_id FROM users WHERE steam_id IS NOT NULL')
-            users = c.fetchall()
-        
-        for (telegram_id,) in users:
-            try:
-                self.check_user_updates(telegram_id)
-            except Exception as e:
-                logger.error(f"Error checking updates for user {telegram_id}: {e}")
-        
+        await self.run_checks(await self.db.get_app_subscribers())
         logger.info("Completed update check for all users")
-        
-    def unschedule_user_check(self, telegram_id):
-        """Remove as verificações agendadas para um usuário"""
-        if telegram_id in self.jobs:
-            self.jobs[telegram_id].remove()
-            del self.jobs[telegram_id]
-            logger.info(f"Unscheduled update checks for user {telegram_id}")
-            return True
-        return False    
\ No newline at end of file
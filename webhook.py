@@ -0,0 +1,80 @@
+import hmac
+import json
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from telegram import Update
+from logger import logger
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Recebe os POSTs do Telegram e coloca os updates na fila da Application"""
+
+    SUPPORTED_METHODS = ('POST',)
+
+    def initialize(self, bot_app, secret_token):
+        self.bot_app = bot_app  # self.application é a Application do tornado
+        self.secret_token = secret_token
+
+    def log_exception(self, typ, value, tb):
+        # Respostas 4xx (HTTPError) já foram registradas no post(); só erros inesperados
+        if not isinstance(value, tornado.web.HTTPError):
+            logger.error(f"Error in webhook handler: {value}")
+
+    async def post(self):
+        token = self.request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning(f"Webhook request from {self.request.remote_ip} with invalid secret token")
+            raise tornado.web.HTTPError(403)
+
+        if not self.request.headers.get('Content-Type', '').startswith('application/json'):
+            raise tornado.web.HTTPError(415)
+
+        try:
+            payload = json.loads(self.request.body)
+            if not isinstance(payload, dict):
+                raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+            update = Update.de_json(payload, self.bot_app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Invalid webhook payload: {e}")
+            raise tornado.web.HTTPError(400)
+
+        # Responde logo; o processamento (concurrent_updates) fica com a Application
+        if update:
+            await self.bot_app.update_queue.put(update)
+        self.set_status(200)
+
+class WebhookServer:
+    """Servidor HTTP embutido (tornado, extra webhooks do python-telegram-bot).
+
+    Só recebe e valida os updates; não registra o webhook no Telegram, o que
+    permite subir o servidor localmente e enviar updates sintéticos com o header
+    X-Telegram-Bot-Api-Secret-Token. port=0 escolhe uma porta livre (ver self.port).
+    """
+
+    def __init__(self, application, listen, port, path, secret_token):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = '/' + path.strip('/')
+        self.secret_token = secret_token
+        self._server = None
+
+    def start(self):
+        app = tornado.web.Application([
+            (self.path, WebhookHandler, {'bot_app': self.application, 'secret_token': self.secret_token})
+        ])
+        sockets = bind_sockets(self.port, self.listen)
+        self.port = sockets[0].getsockname()[1]
+        self._server = HTTPServer(app, xheaders=True)
+        self._server.add_sockets(sockets)
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Para de aceitar conexões e fecha as abertas"""
+        if self._server:
+            self._server.stop()
+            await self._server.close_all_connections()
+            self._server = None
+        logger.info("Webhook server stopped")
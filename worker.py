@@ -0,0 +1,44 @@
+import asyncio
+import signal
+from db import Database, AsyncDatabase
+from steam_api import SteamAPI
+from updater import UpdateChecker
+from changelist import SteamChangelistFeed
+from sharding import ShardLeases
+from config import Config
+from logger import logger
+
+async def run_worker(stop_event=None):
+    """Processo extra de verificação: só o UpdateChecker, sem Telegram.
+
+    Divide os shards (CHECK_SHARDS) com o bot e os demais workers no mesmo banco;
+    as notificações ficam no outbox, enviado pelo processo do bot.
+    """
+    if not Config.CHECK_SHARDS:
+        raise ValueError("CHECK_SHARDS não definido: workers extras exigem a verificação com shards.")
+
+    db = AsyncDatabase(Database())
+    steam_api = SteamAPI()
+    feed = SteamChangelistFeed(steam_api) if Config.CHANGELIST_URL else None
+    leases = ShardLeases(db, Config.CHECK_SHARDS, Config.SHARD_LEASE_SECONDS, Config.WORKER_ID)
+    checker = UpdateChecker(db, steam_api, None, feed, leases)
+
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    checker.start()
+    logger.info(f"Update worker {leases.worker_id} started")
+    try:
+        await stop_event.wait()
+    finally:
+        # Libera os shards na saída para os outros workers assumirem sem esperar o lease
+        await checker.drain(Config.SHUTDOWN_DRAIN_SECONDS)
+        await steam_api.close()
+        await db.close()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+
+if __name__ == '__main__':
+    asyncio.run(run_worker())